@@ -209,6 +209,80 @@ function renderResults(similarities, metadataLookup) {
     }).join('');
 }
 
+/**
+ * Fetch and parse a JSON file, failing with a readable message
+ */
+async function fetchJson(path, what) {
+    const response = await fetch(path);
+    if (!response.ok) {
+        throw new Error(`Failed to load ${what}: ${response.status}`);
+    }
+    return response.json();
+}
+
+/**
+ * 32-bit FNV-1a hash of the UTF-8 bytes of a string
+ * (must match fnv1a_32() in src/generate-similar-microsims.py)
+ */
+function fnv1a32(text) {
+    let hash = 0x811c9dc5;
+    for (const byte of new TextEncoder().encode(text)) {
+        hash = Math.imul(hash ^ byte, 0x01000193) >>> 0;
+    }
+    return hash;
+}
+
+/**
+ * Decode one sim's neighbors from the compact ID-table layout
+ */
+function decodeNeighbors(data, row, metadata) {
+    // Row stride; files written before "k" was recorded fall back to num_similar
+    const k = metadata.k ?? metadata.num_similar;
+    const step = (metadata.score_max - metadata.score_min) / 255;
+    const results = [];
+    for (let slot = row * k; slot < (row + 1) * k; slot++) {
+        const neighbor = data.neighbors[slot];
+        if (neighbor < 0) continue;
+        results.push({
+            url: data.ids[neighbor],
+            score: metadata.score_min + data.scores[slot] * step
+        });
+    }
+    return results;
+}
+
+/**
+ * Load the precomputed similar MicroSims for one sim.
+ *
+ * Handles all three layouts of similar-microsims.json: the original
+ * URL-keyed map, the compact ID table (similar-v2) and the sharded
+ * manifest (similar-v2-sharded), where only the target's shard is fetched.
+ * Returns { count, similarities }.
+ */
+async function loadSimilarities(targetId) {
+    const data = await fetchJson(SIMILAR_PATH, 'similarity data');
+    const metadata = data.metadata;
+
+    if (metadata.schema === 'similar-v2-sharded') {
+        const prefix = fnv1a32(targetId).toString(16).padStart(8, '0').slice(0, metadata.prefix_chars);
+        const shardUrl = new URL(`${metadata.shard_dir}/${prefix}.json`, new URL(SIMILAR_PATH, window.location.href));
+        const shard = await fetchJson(shardUrl, 'similarity shard');
+        const row = shard.sources.findIndex(source => shard.ids[source] === targetId);
+        return {
+            count: metadata.count,
+            similarities: row < 0 ? null : decodeNeighbors(shard, row, metadata)
+        };
+    }
+    if (metadata.schema === 'similar-v2') {
+        const row = data.ids.indexOf(targetId);
+        return {
+            count: metadata.count,
+            similarities: row < 0 ? null : decodeNeighbors(data, row, metadata)
+        };
+    }
+    return { count: metadata.count, similarities: data.similar[targetId] };
+}
+
 /**
  * Main initialization
  */
@@ -229,22 +303,12 @@ async function init() {
 
     try {
         // Load similarity data and metadata in parallel
-        const [similarResponse, metadataResponse] = await Promise.all([
-            fetch(SIMILAR_PATH),
-            fetch(METADATA_PATH)
+        const [similarData, metadataItems] = await Promise.all([
+            loadSimilarities(targetId),
+            fetchJson(METADATA_PATH, 'metadata')
         ]);
 
-        if (!similarResponse.ok) {
-            throw new Error(`Failed to load similarity data: ${similarResponse.status}`);
-        }
-        if (!metadataResponse.ok) {
-            throw new Error(`Failed to load metadata: ${metadataResponse.status}`);
-        }
-
-        const similarData = await similarResponse.json();
-        const metadataItems = await metadataResponse.json();
-
-        console.log(`Loaded similarity data for ${similarData.metadata.count} MicroSims`);
+        console.log(`Loaded similarity data for ${similarData.count} MicroSims`);
         console.log(`Loaded ${metadataItems.length} metadata items`);
 
         // Create lookup tables
@@ -260,8 +324,7 @@ async function init() {
         }
 
         // Get precomputed similar MicroSims
-        const similarities = similarData.similar[targetId];
-        renderResults(similarities, metadataLookup);
+        renderResults(similarData.similarities, metadataLookup);
 
     } catch (error) {
         console.error('Error:', error);
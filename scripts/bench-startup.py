@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the embedding CLI tools.
+
+find-similar-templates.py and generate-embeddings.py run as subprocesses
+many times per generation job, so their startup cost matters as much as
+the work they do. For each scenario this runs the tool several times and
+reports the median wall time. It also runs the tool once under
+`python -X importtime` and reports the total import time, the slowest
+top-level imports, and whether any heavy ML module (torch,
+sentence_transformers, transformers) was imported. None of these paths
+needs the model, so importing one of those is a regression and fails the
+run.
+
+Scenarios:
+    find-similar-templates --help
+    find-similar-templates --cache-stats
+    find-similar-templates reuse query     (cache warmed first; needs the
+                                            embeddings store)
+    generate-embeddings --help
+
+Usage:
+    python scripts/bench-startup.py
+    python scripts/bench-startup.py --python .venv-embeddings/bin/python --repeat 10
+    python scripts/bench-startup.py --max-ms 800 --json logs/bench-startup.json
+
+Exit status is 1 if a heavy module was imported or a median exceeds --max-ms.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+FIND_TEMPLATES = PROJECT_ROOT / "src" / "find-similar-templates" / "find-similar-templates.py"
+GENERATE_EMBEDDINGS = PROJECT_ROOT / "src" / "embeddings" / "generate-embeddings.py"
+STORE_DIR = PROJECT_ROOT / "data" / "microsims-embeddings"
+
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers")
+REUSE_QUERY = "Title: Pendulum Period | Topic: simple harmonic motion | Subjects: Physics"
+
+
+def scenarios() -> list:
+    """(name, argv, warm_up) for each benchmark; warm_up runs once unmeasured."""
+    runs = [
+        ("find-similar-templates --help", [str(FIND_TEMPLATES), "--help"], False),
+        ("find-similar-templates --cache-stats", [str(FIND_TEMPLATES), "--cache-stats"], False),
+    ]
+    if (STORE_DIR / "index.json").exists():
+        runs.append(("find-similar-templates reuse query (cached)",
+                     [str(FIND_TEMPLATES), "--mode", "reuse", "--query", REUSE_QUERY,
+                      "--top", "3", "--json", "--quiet"], True))
+    runs.append(("generate-embeddings --help", [str(GENERATE_EMBEDDINGS), "--help"], False))
+    return runs
+
+
+def parse_importtime(stderr: str) -> tuple[float, list, list]:
+    """
+    Total import ms, the top-level imports sorted slowest first as
+    (ms, module), and the heavy modules seen, from -X importtime output.
+    """
+    top_level = []
+    heavy = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        if module.split(".")[0] in HEAVY_MODULES:
+            heavy.add(module.split(".")[0])
+        # Nested imports are indented under their importer
+        if not name[1:].startswith(" "):
+            top_level.append((int(cumulative) / 1000, module))
+    top_level.sort(reverse=True)
+    return sum(ms for ms, _ in top_level), top_level, sorted(heavy)
+
+
+def run(python: str, argv: list, importtime: bool = False) -> subprocess.CompletedProcess:
+    cmd = [python] + (["-X", "importtime"] if importtime else []) + argv
+    return subprocess.run(cmd, cwd=PROJECT_ROOT, capture_output=True, text=True)
+
+
+def bench(python: str, name: str, argv: list, warm_up: bool, repeat: int) -> dict:
+    if warm_up:
+        run(python, argv)
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run(python, argv)
+        walls.append((time.perf_counter() - start) * 1000)
+    import_ms, top_level, heavy = parse_importtime(run(python, argv, importtime=True).stderr)
+    return {
+        "scenario": name,
+        "exit_code": result.returncode,
+        "median_ms": round(statistics.median(walls), 1),
+        "min_ms": round(min(walls), 1),
+        "import_ms": round(import_ms, 1),
+        "slowest_imports": [{"module": module, "ms": round(ms, 1)} for ms, module in top_level[:5]],
+        "heavy_imports": heavy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup-time benchmark for the embedding CLI tools")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Interpreter to benchmark with (default: this one)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per scenario (default: 5)")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Fail if any scenario's median wall time exceeds this")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("CLI Startup Benchmark")
+    print("=" * 60)
+    print(f"Python:  {args.python}")
+    print(f"Repeat:  {args.repeat}")
+    print()
+
+    results = []
+    failed = False
+    for name, argv, warm_up in scenarios():
+        result = bench(args.python, name, argv, warm_up, args.repeat)
+        results.append(result)
+        print(name)
+        print(f"  wall median {result['median_ms']:.0f} ms (min {result['min_ms']:.0f} ms), "
+              f"imports {result['import_ms']:.0f} ms, exit {result['exit_code']}")
+        slowest = ", ".join(f"{i['module']} {i['ms']:.0f}" for i in result["slowest_imports"])
+        print(f"  slowest imports (ms): {slowest}")
+        if result["exit_code"] != 0:
+            print("  WARNING: non-zero exit; timings may not reflect the normal path")
+        if result["heavy_imports"]:
+            print(f"  FAIL: imported {', '.join(result['heavy_imports'])}")
+            failed = True
+        if args.max_ms is not None and result["median_ms"] > args.max_ms:
+            print(f"  FAIL: median above --max-ms {args.max_ms:.0f}")
+            failed = True
+        print()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": args.python,
+            "repeat": args.repeat,
+            "results": results,
+        }, indent=2))
+        print(f"Results: {args.json}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
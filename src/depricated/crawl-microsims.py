@@ -5,6 +5,10 @@ MicroSim Metadata Crawler
 Crawls GitHub repos matching dmccreary/*/docs/sims pattern,
 collects metadata.json files, and logs missing metadata.
 
+Each repo's sims are discovered with one recursive Git Trees request and
+only the metadata.json files it lists are fetched, concurrently, through
+the same engine as update-repo-microsims.py (src/embeddings/github_fetch.py).
+
 Usage:
     python src/crawl-microsims.py
 
@@ -13,6 +17,7 @@ Output:
     - logs/microsim-crawl-YYYY-MM-DD.jsonl: Log of crawl activity
 """
 
+import asyncio
 import json
 import os
 import re
@@ -24,10 +29,11 @@ from urllib.parse import urljoin
 
 import requests
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "embeddings"))
+from github_fetch import GitHubFetcher, SimTree, discover_sims, GITHUB_API  # noqa: E402
+
 # Configuration
 GITHUB_USER = "dmccreary"
-GITHUB_API = "https://api.github.com"
-RAW_CONTENT_BASE = "https://raw.githubusercontent.com"
 
 # Rate limiting
 REQUEST_DELAY = 0.5  # seconds between requests to avoid rate limits
@@ -53,6 +59,7 @@ class MicroSimCrawler:
             print("Using GitHub token for authentication")
         else:
             print("Warning: No GITHUB_TOKEN set. Rate limits will be lower (60 req/hr)")
+        self.fetcher = GitHubFetcher(self.session)
 
         self.log_file = None
         self.all_metadata = []
@@ -111,65 +118,53 @@ class MicroSimCrawler:
 
         return repos
 
-    def check_sims_directory(self, repo_name: str) -> list:
-        """Check if repo has docs/sims directory and return list of sim directories."""
-        url = f"{GITHUB_API}/repos/{GITHUB_USER}/{repo_name}/contents/docs/sims"
-
-        response = self.session.get(url)
-        time.sleep(REQUEST_DELAY)
-
-        if response.status_code == 404:
-            return []
-
-        if response.status_code != 200:
-            self.log("error", {
-                "repo": repo_name,
-                "message": f"API error {response.status_code}",
-                "url": url
-            })
-            return []
-
-        contents = response.json()
-
-        # Filter to directories only
-        sim_dirs = [
-            item["name"] for item in contents
-            if item["type"] == "dir"
-        ]
+    def check_sims_directory(self, repo_name: str) -> SimTree | None:
+        """List the repo's sim directories and metadata.json files, or None if it has none."""
+        tree = asyncio.run(discover_sims(self.fetcher, GITHUB_USER, repo_name))
 
-        return sim_dirs
-
-    def fetch_metadata(self, repo_name: str, sim_name: str) -> dict | None:
-        """Fetch metadata.json for a specific MicroSim."""
-        url = f"{RAW_CONTENT_BASE}/{GITHUB_USER}/{repo_name}/main/docs/sims/{sim_name}/metadata.json"
-
-        response = self.session.get(url)
-        time.sleep(REQUEST_DELAY)
-
-        if response.status_code == 404:
+        if tree.response.status == 404 or (tree.ok and not tree.sims):
             return None
 
-        if response.status_code != 200:
+        if not tree.ok:
             self.log("error", {
                 "repo": repo_name,
-                "sim": sim_name,
-                "message": f"HTTP error {response.status_code}",
-                "url": url
+                "message": tree.response.error or f"API error {tree.response.status}",
+                "url": tree.response.url
             })
-            self.stats["errors"] += 1
             return None
 
-        try:
-            metadata = response.json()
-            return metadata
-        except json.JSONDecodeError as e:
-            self.log("error", {
-                "repo": repo_name,
-                "sim": sim_name,
-                "message": f"Invalid JSON: {e}"
-            })
-            self.stats["errors"] += 1
-            return None
+        return tree
+
+    def fetch_metadata(self, tree: SimTree) -> dict:
+        """Fetch every existing metadata.json in *tree* concurrently: {sim_name: metadata or None}."""
+        sim_names = [sim_name for sim_name in tree.sims if sim_name in tree.metadata]
+        responses = self.fetcher.get_many(tree.metadata_url(sim_name) for sim_name in sim_names)
+        fetched = {}
+        for sim_name, response in zip(sim_names, responses):
+            fetched[sim_name] = None
+            if response.status == 404:
+                continue
+
+            if response.status != 200:
+                self.log("error", {
+                    "repo": tree.repo,
+                    "sim": sim_name,
+                    "message": response.error or f"HTTP error {response.status}",
+                    "url": response.url
+                })
+                self.stats["errors"] += 1
+                continue
+
+            try:
+                fetched[sim_name] = response.json()
+            except json.JSONDecodeError as e:
+                self.log("error", {
+                    "repo": tree.repo,
+                    "sim": sim_name,
+                    "message": f"Invalid JSON: {e}"
+                })
+                self.stats["errors"] += 1
+        return fetched
 
     def crawl(self):
         """Main crawl logic."""
@@ -197,24 +192,25 @@ class MicroSimCrawler:
                 repo_name = repo["name"]
                 self.stats["repos_checked"] += 1
 
-                sim_dirs = self.check_sims_directory(repo_name)
+                tree = self.check_sims_directory(repo_name)
 
-                if not sim_dirs:
+                if not tree:
                     continue
 
                 self.stats["repos_with_sims"] += 1
-                print(f"\n{repo_name}: {len(sim_dirs)} sims")
+                print(f"\n{repo_name}: {len(tree.sims)} sims")
                 self.log("repo_found", {
                     "repo": repo_name,
-                    "sim_count": len(sim_dirs),
+                    "sim_count": len(tree.sims),
                     "url": repo["html_url"]
                 })
 
-                # Fetch metadata for each sim
-                for sim_name in sim_dirs:
+                # Fetch the existing metadata files, then process in listing order
+                fetched = self.fetch_metadata(tree)
+                for sim_name in tree.sims:
                     self.stats["sims_found"] += 1
 
-                    metadata = self.fetch_metadata(repo_name, sim_name)
+                    metadata = fetched.get(sim_name)
 
                     if metadata:
                         self.stats["metadata_found"] += 1
@@ -223,7 +219,7 @@ class MicroSimCrawler:
                         metadata["_source"] = {
                             "repo": repo_name,
                             "sim": sim_name,
-                            "github_url": f"https://github.com/{GITHUB_USER}/{repo_name}/tree/main/docs/sims/{sim_name}"
+                            "github_url": tree.github_url(sim_name)
                         }
 
                         # Ensure URL is set
@@ -247,7 +243,7 @@ class MicroSimCrawler:
                         self.log("missing_metadata", {
                             "repo": repo_name,
                             "sim": sim_name,
-                            "github_url": f"https://github.com/{GITHUB_USER}/{repo_name}/tree/main/docs/sims/{sim_name}"
+                            "github_url": tree.github_url(sim_name)
                         })
 
             # Write combined output
@@ -0,0 +1,273 @@
+"""
+Approximate nearest-neighbor (IVF) index over the WHAT/HOW embeddings store.
+
+An inverted-file index partitions the catalog with spherical k-means: each
+sim is filed under its nearest centroid ("list"). A query scores the
+centroids, probes only its `nprobe` closest lists, and computes exact cosine
+similarity against the sims in those lists. With about sqrt(N) lists and a
+handful of probes that is a few percent of the catalog per query instead of
+all of it.
+
+The index stores only the structure (centroids + the store row ids in each
+list); vectors are read from the embeddings store, so there is no second copy
+of the catalog. Each index records a fingerprint of the store's row order and
+refuses to load against a store it was not built from.
+
+    data/microsims-ann/what.npz   index over the WHAT matrix
+    data/microsims-ann/how.npz    index over the HOW matrix
+
+Built (with recall reporting) by build-ann-index.py; used by
+find-similar-templates.py, find-duplicate-microsims.py and
+generate-similar-microsims.py behind --index ann. Exact search remains the
+default and the reference.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+INDEX_DIR = PROJECT_ROOT / "data" / "microsims-ann"
+
+KMEANS_ITERATIONS = 20
+DEFAULT_NPROBE = 8
+# Rows assigned to centroids per step while training
+ASSIGN_BLOCK = 8192
+
+
+def store_fingerprint(urls: list) -> str:
+    """Fingerprint of a store's row order; an index is only valid for it."""
+    digest = hashlib.sha1()
+    for url in urls:
+        digest.update(url.encode("utf-8"))
+        digest.update(b"\n")
+    return f"{len(urls)}:{digest.hexdigest()}"
+
+
+def default_list_count(n: int) -> int:
+    """About 2*sqrt(N) lists: ~sqrt(N)/2 sims per list."""
+    return max(1, min(n, int(round(2 * np.sqrt(n)))))
+
+
+def _as_float32(rows) -> np.ndarray:
+    return np.asarray(rows, dtype=np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(matrix, centroids: np.ndarray) -> np.ndarray:
+    """Nearest (max dot product) centroid for every row, computed in blocks."""
+    n = matrix.shape[0]
+    labels = np.empty(n, dtype=np.int32)
+    for start in range(0, n, ASSIGN_BLOCK):
+        end = min(start + ASSIGN_BLOCK, n)
+        labels[start:end] = np.argmax(_as_float32(matrix[start:end]) @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """Inverted-file index: centroids plus the store rows filed under each."""
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray,
+                 fingerprint: str, nprobe: int = DEFAULT_NPROBE, info: dict = None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.fingerprint = fingerprint
+        self.nprobe = nprobe
+        self.info = info or {}
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    def list_rows(self, list_id: int) -> np.ndarray:
+        return self.rows[self.offsets[list_id]:self.offsets[list_id + 1]]
+
+    @classmethod
+    def build(cls, matrix, urls: list, n_lists: int = None,
+              iterations: int = KMEANS_ITERATIONS, seed: int = 42) -> "IVFIndex":
+        """Train spherical k-means on *matrix* (normalized rows) and file every row."""
+        n = matrix.shape[0]
+        n_lists = min(n_lists or default_list_count(n), n)
+        rng = np.random.default_rng(seed)
+        centroids = _as_float32(matrix[np.sort(rng.choice(n, size=n_lists, replace=False))])
+
+        labels = None
+        for _ in range(iterations):
+            new_labels = _assign(matrix, centroids)
+            if labels is not None and np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            sums = np.zeros_like(centroids)
+            for start in range(0, n, ASSIGN_BLOCK):
+                end = min(start + ASSIGN_BLOCK, n)
+                np.add.at(sums, labels[start:end], _as_float32(matrix[start:end]))
+            counts = np.bincount(labels, minlength=n_lists)
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                # Re-seed empty lists with random rows so every list is used
+                sums[empty] = _as_float32(matrix[np.sort(rng.choice(n, size=len(empty), replace=False))])
+            centroids = _normalize(sums)
+
+        labels = _assign(matrix, centroids)
+        order = np.argsort(labels, kind="stable").astype(np.int32)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+        return cls(centroids, offsets, order, store_fingerprint(urls))
+
+    def save(self, path: Path):
+        """Write the index atomically as a .npz file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, centroids=self.centroids, offsets=self.offsets, rows=self.rows,
+                         meta=np.array(json.dumps({
+                             "fingerprint": self.fingerprint,
+                             "nprobe": self.nprobe,
+                             "info": self.info,
+                         })))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(data["centroids"], data["offsets"], data["rows"],
+                       meta["fingerprint"], meta.get("nprobe", DEFAULT_NPROBE), meta.get("info"))
+
+    def subset(self, rows) -> "IVFIndex":
+        """
+        The index restricted to store *rows*, renumbered 0..len(rows)-1.
+
+        For tools that search a filtered matrix (e.g. titled, non-template
+        sims only): the centroids are unchanged, excluded rows are dropped
+        from their lists.
+        """
+        lookup = np.full(len(self.rows), -1, dtype=np.int64)
+        lookup[np.asarray(rows)] = np.arange(len(rows))
+        mapped = lookup[self.rows]
+        keep = mapped >= 0
+        list_ids = np.repeat(np.arange(self.n_lists), np.diff(self.offsets))
+        offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(list_ids[keep], minlength=self.n_lists), out=offsets[1:])
+        return IVFIndex(self.centroids, offsets, mapped[keep], self.fingerprint, self.nprobe, self.info)
+
+    def probe(self, queries: np.ndarray, nprobe: int = None) -> np.ndarray:
+        """The nprobe closest lists for each query, shape (B, nprobe)."""
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        scores = queries @ self.centroids.T
+        if nprobe == self.n_lists:
+            return np.tile(np.arange(self.n_lists), (len(queries), 1))
+        return np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+
+    def search(self, matrix, queries: np.ndarray, k: int, nprobe: int = None,
+               exclude_rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k rows of *matrix* for each query.
+
+        Candidates come from the probed lists and are re-scored exactly
+        against *matrix* (any store matrix, including quantized ones). Rows in
+        *exclude_rows* (one per query, e.g. the query's own row) are skipped.
+        Returns (indices, scores) of shape (B, k), best first; slots without a
+        candidate hold index -1 and score -inf.
+        """
+        queries = _as_float32(queries)
+        probes = self.probe(queries, nprobe)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for qi, lists in enumerate(probes):
+            # Sorted rows keep reads from a memory-mapped store sequential
+            cand = np.sort(np.concatenate([self.list_rows(l) for l in lists]))
+            if exclude_rows is not None:
+                cand = cand[cand != exclude_rows[qi]]
+            if len(cand) == 0:
+                continue
+            sims = _as_float32(matrix[cand]) @ queries[qi]
+            take = min(k, len(cand))
+            top = np.argpartition(-sims, take - 1)[:take]
+            top = top[np.argsort(-sims[top], kind="stable")]
+            indices[qi, :take] = cand[top]
+            scores[qi, :take] = sims[top]
+        return indices, scores
+
+    def range_search(self, matrix, query_rows: np.ndarray, threshold: float,
+                     nprobe: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Approximate all pairs (query row, row) with similarity >= threshold.
+
+        *query_rows* are rows of *matrix* used as queries. Work is grouped by
+        inverted list: every query probing a list is scored against that
+        list's rows in one matrix product. Returns parallel arrays
+        (query_rows, rows, scores), including each row paired with itself.
+        """
+        query_rows = np.asarray(query_rows)
+        queries = _as_float32(matrix[query_rows])
+        probes = self.probe(queries, nprobe)
+        out_q, out_r, out_s = [], [], []
+        by_list = np.argsort(probes, axis=None, kind="stable")
+        flat_lists = probes.ravel()[by_list]
+        flat_queries = by_list // probes.shape[1]
+        bounds = np.flatnonzero(np.diff(flat_lists)) + 1
+        for group in np.split(np.arange(len(flat_lists)), bounds):
+            if len(group) == 0:
+                continue
+            rows = np.sort(self.list_rows(flat_lists[group[0]]))
+            if len(rows) == 0:
+                continue
+            q_idx = flat_queries[group]
+            sims = queries[q_idx] @ _as_float32(matrix[rows]).T
+            qi, ri = np.nonzero(sims >= threshold)
+            out_q.append(query_rows[q_idx[qi]])
+            out_r.append(rows[ri])
+            out_s.append(sims[qi, ri])
+        if not out_q:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.float32)
+        return np.concatenate(out_q), np.concatenate(out_r), np.concatenate(out_s)
+
+
+def index_path(role: str, index_dir: Path = INDEX_DIR) -> Path:
+    return Path(index_dir) / f"{role}.npz"
+
+
+def load_index(role: str, store, index_dir: Path = INDEX_DIR) -> IVFIndex:
+    """Load the *role* ("what"/"how") index and check it matches *store*."""
+    path = index_path(role, index_dir)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"ANN index not found: {path}\n"
+            "Run: python src/embeddings/build-ann-index.py"
+        )
+    index = IVFIndex.load(path)
+    if index.fingerprint != store_fingerprint(store.urls):
+        raise ValueError(
+            f"ANN index {path} was built from a different embeddings store\n"
+            "Run: python src/embeddings/build-ann-index.py"
+        )
+    return index
+
+
+def recall_at_k(approx_scores: np.ndarray, exact_scores: np.ndarray) -> float:
+    """
+    Fraction of the approximate top-k that belongs in the exact top-k.
+
+    A returned neighbor counts as a hit when its (exact) score reaches the
+    k-th best exact score, so ties at the boundary (duplicate sims) are not
+    counted as misses. Both arguments have shape (B, k).
+    """
+    kth = exact_scores.min(axis=1, keepdims=True)
+    return float(np.mean(approx_scores >= kth - 1e-6))
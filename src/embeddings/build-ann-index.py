@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Build the approximate nearest-neighbor (IVF) indexes for the embeddings store.
+
+Trains one index per role (WHAT and HOW) with spherical k-means, measures
+recall@k against exact search for a sample of catalog sims at several probe
+counts, and saves each index with the smallest probe count that reaches the
+target recall as its default. Rebuild after every generate-embeddings.py run;
+the similarity tools refuse an index built from a different store.
+
+Usage:
+    python src/embeddings/build-ann-index.py
+    python src/embeddings/build-ann-index.py --lists 128 --target-recall 0.98
+    python src/embeddings/build-ann-index.py --k 10 --sample 1000
+
+Output:
+    data/microsims-ann/what.npz
+    data/microsims-ann/how.npz
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from embedding_store import load_store
+from ann_index import (
+    INDEX_DIR, KMEANS_ITERATIONS, IVFIndex, default_list_count, index_path, recall_at_k
+)
+
+PROBE_GRID = (1, 2, 4, 8, 16, 32, 64)
+
+
+def exact_top_k(matrix, queries: np.ndarray, query_rows: np.ndarray, k: int) -> np.ndarray:
+    """Exact top-k scores per query (self excluded), the recall reference."""
+    scores = queries @ np.asarray(matrix, dtype=np.float32).T
+    scores[np.arange(len(query_rows)), query_rows] = -np.inf
+    return -np.partition(-scores, k - 1, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build IVF ANN indexes for the embeddings store")
+    parser.add_argument("--lists", type=int, default=None,
+                        help="Number of inverted lists (default: about 2*sqrt(N))")
+    parser.add_argument("--iterations", type=int, default=KMEANS_ITERATIONS,
+                        help=f"k-means iterations (default: {KMEANS_ITERATIONS})")
+    parser.add_argument("--k", type=int, default=10, help="Neighbors compared for recall (default: 10)")
+    parser.add_argument("--sample", type=int, default=500,
+                        help="Catalog sims used as recall queries (default: 500, 0 = all)")
+    parser.add_argument("--target-recall", type=float, default=0.95,
+                        help="Recall@k the default probe count must reach (default: 0.95)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for k-means and the sample")
+    args = parser.parse_args()
+
+    store = load_store()
+    n = len(store)
+    if n <= args.k:
+        print(f"Error: catalog has {n} sims; need more than k={args.k}")
+        sys.exit(1)
+    n_lists = args.lists or default_list_count(n)
+
+    rng = np.random.default_rng(args.seed)
+    sample = n if args.sample <= 0 else min(args.sample, n)
+    query_rows = np.sort(rng.choice(n, size=sample, replace=False))
+
+    print("=" * 60)
+    print("Build ANN Index")
+    print("=" * 60)
+    print(f"Sims:          {n}")
+    print(f"Lists:         {n_lists} (~{n / n_lists:.0f} sims per list)")
+    print(f"Recall check:  {sample} queries, k={args.k}, target {args.target_recall:.2f}")
+
+    for role in ("what", "how"):
+        matrix = getattr(store, role)
+        print()
+        print(f"{role.upper()} index")
+        print("-" * 60)
+
+        start = time.perf_counter()
+        index = IVFIndex.build(matrix, store.urls, n_lists=n_lists,
+                               iterations=args.iterations, seed=args.seed)
+        build_seconds = time.perf_counter() - start
+        print(f"Build time:    {build_seconds:.2f}s")
+
+        queries = np.asarray(matrix[query_rows], dtype=np.float32)
+        start = time.perf_counter()
+        reference = exact_top_k(matrix, queries, query_rows, args.k)
+        exact_ms = (time.perf_counter() - start) * 1000 / sample
+
+        print(f"{'nprobe':>7} {'recall@k':>9} {'scanned':>8} {'ms/query':>9}")
+        print(f"{'exact':>7} {1.0:>9.4f} {1.0:>8.1%} {exact_ms:>9.3f}")
+        chosen = None
+        for nprobe in PROBE_GRID:
+            if nprobe > n_lists:
+                break
+            start = time.perf_counter()
+            _, approx = index.search(matrix, queries, args.k, nprobe=nprobe, exclude_rows=query_rows)
+            ms = (time.perf_counter() - start) * 1000 / sample
+            recall = recall_at_k(approx, reference)
+            scanned = np.mean([sum(len(index.list_rows(l)) for l in lists)
+                               for lists in index.probe(queries, nprobe)]) / n
+            print(f"{nprobe:>7} {recall:>9.4f} {scanned:>8.1%} {ms:>9.3f}")
+            if chosen is None and recall >= args.target_recall:
+                chosen = (nprobe, recall)
+        if chosen is None:
+            # Probing every list is exhaustive, hence exact
+            print(f"Target recall not reached; probing all {n_lists} lists")
+            chosen = (n_lists, 1.0)
+
+        index.nprobe = chosen[0]
+        index.info = {
+            "role": role,
+            "lists": n_lists,
+            "build_seconds": round(build_seconds, 3),
+            "recall_at_k": round(chosen[1], 4),
+            "k": args.k,
+            "model": store.metadata.get("model"),
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        path = index_path(role)
+        index.save(path)
+        print(f"Default nprobe: {index.nprobe} (recall@{args.k} {chosen[1]:.4f})")
+        print(f"Saved:         {path}")
+
+    print()
+    print(f"Indexes written to {INDEX_DIR}")
+
+
+if __name__ == "__main__":
+    main()
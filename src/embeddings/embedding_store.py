@@ -0,0 +1,376 @@
+"""
+Binary WHAT/HOW embeddings store shared by the similarity tools.
+
+Schema "dual-v2" replaces the JSON float lists of "dual-v1" with contiguous
+matrices that are memory-mapped instead of parsed:
+
+    data/microsims-embeddings/
+        index.json            metadata, row order (one URL and sim ID per row),
+                              file names
+        what.<gen>.npy        (N, dim) WHAT matrix, L2-normalized rows
+        how.<gen>.npy         (N, dim) HOW matrix, L2-normalized rows
+
+Matrices are float32 by default (float16 optional). They are opened with
+np.load(mmap_mode="r"), so loading is near-instant and the pages are shared by
+every process that maps the same files. Each save writes a new generation of
+.npy files and then atomically replaces index.json, so a reader never pairs an
+index with matrices from a different run. After the swap, generations older
+than the one the previous index named are removed: the previous generation
+stays for readers that loaded the old index just before the swap, and files
+of a newer generation (another writer's) are never touched. Open memory maps
+on POSIX keep working after their files are removed.
+
+Optional quantized variants (--quantize in generate-embeddings.py) sit next
+to the full-precision matrices and are listed under "variants" in index.json:
+
+    float16   what.<gen>.float16.npy, how.<gen>.float16.npy
+    int8      what.<gen>.int8.npy + what.<gen>.int8-scale.npy (per-dimension
+              float32 scale), same for HOW
+
+load_store(precision=...) returns a store whose what/how are the requested
+variant; int8 matrices come back as QuantizedMatrix. dot_scores() scores
+queries against any of them without materializing a float32 copy of the
+catalog.
+
+load_store() reads dual-v2 when present and falls back to the dual-v1 JSON
+(or the legacy flat one-vector-per-URL JSON), so consumers work with either.
+
+Usage:
+    from embedding_store import load_store
+    store = load_store()
+    store.urls, store.what, store.how, store.metadata
+    store.ids    # canonical sim ID per row (see microsim_ids.py), or None
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from json_stream import LazyObject, NumberArray, dump_stream
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+STORE_DIR = PROJECT_ROOT / "data" / "microsims-embeddings"
+JSON_PATH = PROJECT_ROOT / "data" / "microsims-embeddings.json"
+
+SCHEMA = "dual-v2"
+INDEX_NAME = "index.json"
+STORE_DTYPES = ("float32", "float16")
+QUANTIZED_VARIANTS = ("float16", "int8")
+PRECISIONS = ("float32",) + QUANTIZED_VARIANTS
+
+# Rows scored per step when a matrix has to be widened to float32
+SCORE_BLOCK = 4096
+
+
+class EmbeddingStore:
+    """Row-aligned WHAT/HOW matrices plus the URL (and sim ID) of each row."""
+
+    def __init__(self, metadata: dict, urls: list, what: np.ndarray, how: np.ndarray,
+                 ids: np.ndarray = None):
+        self.metadata = metadata
+        self.urls = urls
+        self.what = what
+        self.how = how
+        self.ids = ids
+        self._row_of = None
+
+    def __len__(self):
+        return len(self.urls)
+
+    def row_of(self, url: str):
+        """Row index for *url*, or None if it is not in the store."""
+        if self._row_of is None:
+            self._row_of = {url: i for i, url in enumerate(self.urls)}
+        return self._row_of.get(url)
+
+
+class QuantizedMatrix:
+    """
+    Scalar-quantized int8 matrix with a per-dimension scale.
+
+    Row i is approximately ``codes[i] * scale``. Indexing returns dequantized
+    float32 rows; use dot_scores() to score queries without dequantizing the
+    whole matrix.
+    """
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray):
+        self.codes = codes
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scale.nbytes
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __getitem__(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scale
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize *matrix* to int8 with one symmetric scale per dimension.
+
+    Returns (codes, scale) with codes in [-127, 127] and
+    matrix ~= codes * scale.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scale = np.abs(matrix).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def dot_scores(matrix, queries: np.ndarray) -> np.ndarray:
+    """
+    Dot products of every catalog row with each query.
+
+    *matrix* may be a float32/float16 array (including a memory map) or a
+    QuantizedMatrix; *queries* is one vector (dim,) or a batch (B, dim).
+    Returns (N,) or (N, B) float32. Non-float32 matrices are widened one
+    SCORE_BLOCK of rows at a time, so peak memory stays bounded.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if isinstance(matrix, QuantizedMatrix):
+        # x . q ~= sum_d codes_d * scale_d * q_d: fold the scale into the query
+        codes = matrix.codes
+        scaled = queries * matrix.scale
+    elif matrix.dtype == np.float32:
+        return np.asarray(matrix @ queries.T if queries.ndim == 2 else matrix @ queries)
+    else:
+        codes = matrix
+        scaled = queries
+
+    rhs = scaled.T if scaled.ndim == 2 else scaled
+    out = np.empty((codes.shape[0],) + rhs.shape[1:], dtype=np.float32)
+    for start in range(0, codes.shape[0], SCORE_BLOCK):
+        end = min(start + SCORE_BLOCK, codes.shape[0])
+        out[start:end] = codes[start:end].astype(np.float32) @ rhs
+    return out
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize matrix rows (float32) so cosine similarity is a dot product.
+
+    Rows already of unit length are left untouched: dividing them again can
+    move the last bit, and vectors reused by incremental runs must come back
+    bit-for-bit so downstream change detection does not see them as edited.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[(norms == 0) | (np.abs(norms - 1.0) < 1e-6)] = 1.0
+    return matrix / norms
+
+
+def _atomic_write_bytes(path: Path, write_fn):
+    """Run write_fn(file) against a temp file in path's dir, then os.replace."""
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_fn(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def save_store(urls: list, what: np.ndarray, how: np.ndarray, metadata: dict,
+               store_dir: Path = STORE_DIR, dtype: str = "float32",
+               quantize: tuple = (), ids: list = None) -> Path:
+    """
+    Write a dual-v2 store. Rows are L2-normalized before saving.
+
+    *quantize* lists extra variants ("float16", "int8") to write alongside
+    the main matrices. *ids* are the rows' canonical sim IDs. Returns the
+    path of the written index.json.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unsupported store dtype {dtype!r} (choose from {STORE_DTYPES})")
+    unknown = set(quantize) - set(QUANTIZED_VARIANTS)
+    if unknown:
+        raise ValueError(f"Unsupported quantized variant(s) {sorted(unknown)} "
+                         f"(choose from {QUANTIZED_VARIANTS})")
+    if len(urls) != len(what) or len(urls) != len(how):
+        raise ValueError("urls, what and how must have the same number of rows")
+    if ids is not None and len(ids) != len(urls):
+        raise ValueError("ids must have one entry per row")
+
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    generation = f"{time.time_ns():x}"
+    index_path = store_dir / INDEX_NAME
+    previous = _index_generation(index_path)
+
+    def write_npy(name: str, data: np.ndarray) -> str:
+        data = np.ascontiguousarray(data)
+        _atomic_write_bytes(store_dir / name, lambda f: np.save(f, data))
+        return name
+
+    files = {}
+    variants = {variant: {} for variant in quantize}
+    for role, matrix in (("what", what), ("how", how)):
+        normalized = normalize_rows(matrix)
+        files[role] = write_npy(f"{role}.{generation}.npy", normalized.astype(dtype))
+        if "float16" in variants:
+            variants["float16"][role] = write_npy(f"{role}.{generation}.float16.npy",
+                                                  normalized.astype(np.float16))
+        if "int8" in variants:
+            codes, scale = quantize_int8(normalized)
+            variants["int8"][role] = write_npy(f"{role}.{generation}.int8.npy", codes)
+            variants["int8"][f"{role}_scale"] = write_npy(f"{role}.{generation}.int8-scale.npy", scale)
+
+    index = {
+        "metadata": {
+            **metadata,
+            "schema": SCHEMA,
+            "count": len(urls),
+            "dtype": dtype,
+            "normalized": True,
+        },
+        "files": files,
+        "variants": variants,
+        "urls": list(urls),
+    }
+    if ids is not None:
+        index["ids"] = [int(i) for i in ids]
+    payload = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    _atomic_write_bytes(index_path, lambda f: f.write(payload))
+
+    # Drop generations older than the one the replaced index pointed at
+    if previous is not None:
+        for old in store_dir.glob("*.npy"):
+            old_generation = _file_generation(old.name)
+            if old_generation is not None and old_generation < previous:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+    return index_path
+
+
+def _file_generation(name: str):
+    """Generation of a store matrix file ("what.<gen>[.variant].npy"), or None."""
+    parts = name.split(".")
+    try:
+        return int(parts[1], 16) if len(parts) >= 3 else None
+    except ValueError:
+        return None
+
+
+def _index_generation(index_path: Path):
+    """Generation of the matrices *index_path* names, or None if there is no readable index."""
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return _file_generation(json.load(f)["files"]["what"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _load_v2(store_dir: Path, mmap: bool, precision: str) -> EmbeddingStore:
+    with open(store_dir / INDEX_NAME, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    mode = "r" if mmap else None
+    metadata = index["metadata"]
+
+    if precision == metadata.get("dtype"):
+        what = np.load(store_dir / index["files"]["what"], mmap_mode=mode)
+        how = np.load(store_dir / index["files"]["how"], mmap_mode=mode)
+    elif precision == "float32":
+        # A float16 store read at full precision: widen it
+        what = np.load(store_dir / index["files"]["what"], mmap_mode=mode).astype(np.float32)
+        how = np.load(store_dir / index["files"]["how"], mmap_mode=mode).astype(np.float32)
+        metadata = {**metadata, "dtype": "float32"}
+    else:
+        files = index.get("variants", {}).get(precision)
+        if not files:
+            raise FileNotFoundError(
+                f"Embeddings store {store_dir} has no {precision} variant\n"
+                f"Run: python src/embeddings/generate-embeddings.py --quantize {precision}"
+            )
+        what = np.load(store_dir / files["what"], mmap_mode=mode)
+        how = np.load(store_dir / files["how"], mmap_mode=mode)
+        if precision == "int8":
+            what = QuantizedMatrix(what, np.load(store_dir / files["what_scale"]))
+            how = QuantizedMatrix(how, np.load(store_dir / files["how_scale"]))
+        metadata = {**metadata, "dtype": precision}
+    if what.shape[0] != len(index["urls"]) or how.shape[0] != len(index["urls"]):
+        raise ValueError(f"Embeddings store {store_dir} is inconsistent: "
+                         f"{len(index['urls'])} URLs, {what.shape[0]} WHAT rows, {how.shape[0]} HOW rows")
+    ids = np.asarray(index["ids"], dtype=np.int64) if "ids" in index else None
+    return EmbeddingStore(metadata, index["urls"], what, how, ids)
+
+
+def _load_json(path: Path) -> EmbeddingStore:
+    """Load a dual-v1 (or legacy flat) JSON file into normalized float32 matrices."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    metadata = data.get("metadata", {})
+    urls = list(data["embeddings"].keys())
+    if metadata.get("schema") == "dual-v1":
+        what = normalize_rows([data["embeddings"][u]["what"] for u in urls])
+        how = normalize_rows([data["embeddings"][u]["how"] for u in urls])
+    else:
+        # Legacy single-vector format: use it for both roles
+        what = normalize_rows([data["embeddings"][u] for u in urls])
+        how = what
+    return EmbeddingStore({**metadata, "normalized": True}, urls, what, how)
+
+
+def store_exists(path: Path = None) -> bool:
+    """True if *path* (default: the dual-v2 store, then the JSON) can be loaded."""
+    if path is not None:
+        path = Path(path)
+        return (path / INDEX_NAME).exists() if path.is_dir() else path.exists()
+    return (STORE_DIR / INDEX_NAME).exists() or JSON_PATH.exists()
+
+
+def load_store(path: Path = None, mmap: bool = True,
+               precision: str = "float32") -> EmbeddingStore:
+    """
+    Load embeddings from a dual-v2 directory or a dual-v1/legacy JSON file.
+
+    With no *path*, prefers data/microsims-embeddings/ and falls back to
+    data/microsims-embeddings.json. Matrices are always row-normalized.
+    *precision* selects a quantized variant of a dual-v2 store ("float16",
+    "int8"); the JSON formats only provide float32.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision {precision!r} (choose from {PRECISIONS})")
+    if path is None:
+        if (STORE_DIR / INDEX_NAME).exists():
+            path = STORE_DIR
+        elif JSON_PATH.exists():
+            path = JSON_PATH
+        else:
+            raise FileNotFoundError(
+                f"Embeddings not found: {STORE_DIR} (or {JSON_PATH})\n"
+                "Run: python src/embeddings/generate-embeddings.py"
+            )
+    path = Path(path)
+    if path.is_dir():
+        return _load_v2(path, mmap, precision)
+    if precision != "float32":
+        raise FileNotFoundError(f"{path} is a JSON export; quantized {precision} "
+                                "matrices are only available in the dual-v2 store")
+    return _load_json(path)
+
+
+def export_json(store: EmbeddingStore, path: Path = JSON_PATH):
+    """Write *store* as a dual-v1 JSON file (for tools that still want JSON)."""
+    metadata = {k: v for k, v in store.metadata.items() if k not in ("dtype", "normalized")}
+    metadata["schema"] = "dual-v1"
+    # Streamed row by row, straight from the float32 matrices
+    rows = ((url, {"what": NumberArray(store.what[i].astype(np.float32)),
+                   "how": NumberArray(store.how[i].astype(np.float32))})
+            for i, url in enumerate(store.urls))
+    dump_stream(path, {"metadata": metadata, "embeddings": LazyObject(rows)})
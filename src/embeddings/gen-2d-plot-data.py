@@ -2,7 +2,7 @@
 """
 Generate 2D PCA projection of MicroSim embeddings for Plotly.js visualization.
 
-This script reads the 384-dimensional embeddings from microsims-embeddings.json,
+This script reads the 384-dimensional embeddings from the embeddings store,
 applies PCA to reduce to 2 dimensions, and outputs a JSON file suitable for
 Plotly.js scatter plot visualization with hover information.
 
@@ -19,59 +19,42 @@ from pathlib import Path
 import numpy as np
 from sklearn.decomposition import PCA
 
+from embedding_store import load_store, store_exists, STORE_DIR, JSON_PATH
+from microsim_ids import catalog_rows
+
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-EMBEDDINGS_PATH = PROJECT_ROOT / "data" / "microsims-embeddings.json"
+EMBEDDINGS_PATH = STORE_DIR if store_exists(STORE_DIR) else JSON_PATH
 MICROSIMS_PATH = PROJECT_ROOT / "docs" / "search" / "microsims-data.json"
 OUTPUT_PATH = PROJECT_ROOT / "docs" / "search" / "embeddings-2d.json"
 
 
-def load_embeddings(path: Path) -> dict:
-    """Load embeddings from JSON file."""
+def load_embeddings(path: Path):
+    """Load the embeddings store (dual-v2 directory or dual-v1 JSON)."""
     print(f"Loading embeddings from {path}...")
-    with open(path, 'r') as f:
-        data = json.load(f)
-    print(f"  Loaded {data['metadata']['count']} embeddings ({data['metadata']['dimension']}D)")
-    return data
+    store = load_store(path)
+    print(f"  Loaded {len(store)} embeddings ({store.metadata['dimension']}D)")
+    return store
 
 
-def load_microsims(path: Path) -> dict:
-    """Load MicroSims metadata and index by URL."""
+def load_microsims(path: Path, store) -> list:
+    """Load MicroSims metadata: the catalog entry for each store row, joined on sim IDs."""
     print(f"Loading MicroSims metadata from {path}...")
     with open(path, 'r') as f:
         microsims = json.load(f)
 
-    # Index by URL for fast lookup
-    by_url = {}
-    for sim in microsims:
-        url = sim.get('url') or sim.get('identifier')
-        if url:
-            by_url[url] = sim
-
-    print(f"  Loaded {len(microsims)} MicroSims, {len(by_url)} with URLs")
-    return by_url
-
+    rows = catalog_rows(store, microsims)
+    print(f"  Loaded {len(microsims)} MicroSims, {sum(1 for sim in rows if sim)} matched to embeddings")
+    return rows
 
-def get_what_vector(entry):
-    """
-    Extract the WHAT vector from an embeddings entry.
 
-    Supports the dual-v1 schema ({"what": [...], "how": [...]}) and the
-    legacy flat format (a plain list). The map should cluster by subject
-    matter, so the WHAT vector is used.
-    """
-    if isinstance(entry, dict):
-        return entry["what"]
-    return entry
-
-
-def apply_pca(embeddings_dict: dict) -> tuple:
+def apply_pca(store) -> tuple:
     """Apply PCA to reduce embeddings to 2D."""
     print("Applying PCA dimensionality reduction (384D → 2D)...")
 
-    # Extract URLs and embeddings in consistent order
-    urls = list(embeddings_dict.keys())
-    embeddings_matrix = np.array([get_what_vector(embeddings_dict[url]) for url in urls])
+    # The map should cluster by subject matter, so the WHAT vectors are used
+    urls = store.urls
+    embeddings_matrix = np.asarray(store.what, dtype=np.float32)
 
     print(f"  Input shape: {embeddings_matrix.shape}")
 
@@ -205,16 +188,14 @@ def get_subject(sim: dict) -> str:
     return normalize_subject(raw_subject)
 
 
-def build_plot_data(urls: list, coords_2d: np.ndarray, microsims: dict, explained_variance: np.ndarray) -> dict:
+def build_plot_data(urls: list, coords_2d: np.ndarray, microsims: list, explained_variance: np.ndarray) -> dict:
     """Build the output JSON structure for Plotly.js."""
     print("Building plot data...")
 
     points = []
     subjects_seen = set()
 
-    for i, url in enumerate(urls):
-        sim = microsims.get(url, {})
-
+    for i, (url, sim) in enumerate(zip(urls, microsims)):
         # Get subject (handle both flat and nested formats)
         subject = get_subject(sim)
         subjects_seen.add(subject)
@@ -250,7 +231,7 @@ def build_plot_data(urls: list, coords_2d: np.ndarray, microsims: dict, explaine
 
     output = {
         'metadata': {
-            'source': 'microsims-embeddings.json',
+            'source': EMBEDDINGS_PATH.name,
             'reduction': 'PCA',
             'dimensions': 2,
             'count': len(points),
@@ -287,7 +268,7 @@ def main():
     print()
 
     # Check files exist
-    if not EMBEDDINGS_PATH.exists():
+    if not store_exists(EMBEDDINGS_PATH):
         print(f"ERROR: Embeddings file not found: {EMBEDDINGS_PATH}")
         sys.exit(1)
 
@@ -297,10 +278,10 @@ def main():
 
     # Load data
     embeddings_data = load_embeddings(EMBEDDINGS_PATH)
-    microsims = load_microsims(MICROSIMS_PATH)
+    microsims = load_microsims(MICROSIMS_PATH, embeddings_data)
 
     # Apply PCA
-    urls, coords_2d, explained_variance = apply_pca(embeddings_data['embeddings'])
+    urls, coords_2d, explained_variance = apply_pca(embeddings_data)
 
     # Build output
     plot_data = build_plot_data(urls, coords_2d, microsims, explained_variance)
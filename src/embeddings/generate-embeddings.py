@@ -14,15 +14,33 @@ Usage:
     source .venv-embeddings/bin/activate
     python src/embeddings/generate-embeddings.py
 
+    # Only re-encode sims whose WHAT/HOW text changed since the last run
+    python src/embeddings/generate-embeddings.py --incremental
+
+    # Also export the dual-v1 JSON; store the matrices as float16
+    python src/embeddings/generate-embeddings.py --json --dtype float16
+
+    # Add int8 and float16 variants for the similarity tools' --precision flag
+    python src/embeddings/generate-embeddings.py --quantize int8 float16
+
 Requirements:
     pip install sentence-transformers
     (Requires Python 3.12 or earlier - PyTorch doesn't support Python 3.13 yet)
 
 Output:
-    data/microsims-embeddings.json - schema "dual-v1", keyed by URL:
+    data/microsims-embeddings/ - schema "dual-v2": memory-mappable WHAT and HOW
+    matrices (.npy) plus index.json holding the URL and sim ID of each row
+    (see embedding_store.py)
+    data/microsim-ids.json - canonical sim ID table (see microsim_ids.py);
+    sims the catalog updaters have not assigned yet are added here
+    data/microsims-embeddings.json - optional (--json) dual-v1 export, keyed by URL:
     {"embeddings": {"<url>": {"what": [...384 floats], "how": [...384 floats]}}}
+    data/microsims-embeddings-hashes.json - per-URL hashes of the WHAT/HOW
+    texts that produced each vector, used by --incremental to skip re-encoding
 """
 
+import argparse
+import hashlib
 import json
 import os
 import sys
@@ -30,6 +48,12 @@ import tempfile
 from pathlib import Path
 from datetime import datetime, timezone
 
+import numpy as np
+
+from embedding_store import (STORE_DIR, JSON_PATH, STORE_DTYPES, QUANTIZED_VARIANTS,
+                             save_store, load_store, export_json)
+from microsim_ids import MicrosimIds, sim_id
+
 
 def atomic_write_json(path: Path, obj, **dump_kwargs):
     """Write JSON to *path* atomically (temp file in same dir + os.replace).
@@ -47,19 +71,13 @@ def atomic_write_json(path: Path, obj, **dump_kwargs):
         if os.path.exists(tmp):
             os.remove(tmp)
 
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:
-    print("Error: sentence-transformers not installed.")
-    print("Install with: pip install sentence-transformers")
-    print("Note: Requires Python 3.12 or earlier (PyTorch constraint)")
-    sys.exit(1)
-
 # Paths
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent.parent  # src/embeddings -> src -> project root
 INPUT_FILE = PROJECT_ROOT / "docs" / "search" / "microsims-data.json"
-OUTPUT_FILE = PROJECT_ROOT / "data" / "microsims-embeddings.json"
+OUTPUT_DIR = STORE_DIR
+JSON_EXPORT_FILE = JSON_PATH
+HASHES_FILE = PROJECT_ROOT / "data" / "microsims-embeddings-hashes.json"
 
 # Model configuration
 MODEL_NAME = "all-MiniLM-L6-v2"  # 384 dimensions, good balance of speed and quality
@@ -217,28 +235,147 @@ def create_how_text(microsim: dict) -> str:
     return " | ".join(parts)
 
 
-def get_microsim_url(microsim: dict) -> str:
+def text_hash(text: str) -> str:
+    """Stable short hash of an embedding input text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def load_previous_embeddings() -> tuple:
+    """
+    Load the embeddings store and text hashes written by the previous run.
+
+    Returns (store, hashes). store is None and hashes empty when there is
+    nothing reusable: no previous output, no hash side file, a legacy
+    single-vector file, or a different model (vectors from another model are
+    not comparable).
+    """
+    if not HASHES_FILE.exists():
+        return None, {}
+
+    with open(HASHES_FILE, "r", encoding="utf-8") as f:
+        hash_data = json.load(f)
+    if hash_data.get("model") != MODEL_NAME:
+        print(f"Previous hashes were made with '{hash_data.get('model')}'; re-encoding everything")
+        return None, {}
+
+    try:
+        previous = load_store()
+    except FileNotFoundError:
+        return None, {}
+    if previous.metadata.get("model") != MODEL_NAME or previous.what is previous.how:
+        return None, {}
+
+    return previous, hash_data.get("hashes", {})
+
+
+def plan_encoding(urls: list, texts: list, role: str,
+                  previous, previous_hashes: dict) -> tuple[list, list]:
+    """
+    Split one role's (WHAT or HOW) texts into reusable vectors and texts to encode.
+
+    Returns (vectors, pending) where vectors[i] is the reused vector or None,
+    and pending lists the row indices that need a fresh encode.
+    """
+    vectors = [None] * len(texts)
+    pending = []
+    for i, (url, text) in enumerate(zip(urls, texts)):
+        old_hash = previous_hashes.get(url, {}).get(role)
+        row = previous.row_of(url) if previous is not None else None
+        if old_hash == text_hash(text) and row is not None:
+            vectors[i] = getattr(previous, role)[row]
+        else:
+            pending.append(i)
+    return vectors, pending
+
+
+def encode_pending(model, texts: list, vectors: list, pending: list,
+                   batch_size: int) -> np.ndarray:
+    """
+    Encode the pending texts in one batch and merge them with the reused vectors.
+
+    Identical texts (catalog duplicates, sparse sims sharing a neutral HOW
+    text) are sent to the model once.
+    """
+    unique_texts = list(dict.fromkeys(texts[i] for i in pending))
+    if unique_texts:
+        encoded = model.encode(
+            unique_texts,
+            batch_size=batch_size,
+            show_progress_bar=True,
+            convert_to_numpy=True
+        )
+        by_text = dict(zip(unique_texts, encoded))
+        for i in pending:
+            vectors[i] = by_text[texts[i]]
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def store_size(index_path: Path) -> int:
+    """
+    Bytes on disk of the store generation *index_path* describes.
+
+    Counts the index and the matrices it names, not the previous generation
+    save_store keeps around for readers that still have it open.
+    """
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    names = list(index["files"].values())
+    for files in index.get("variants", {}).values():
+        names.extend(files.values())
+    return index_path.stat().st_size + sum((index_path.parent / name).stat().st_size for name in names)
+
+
+def load_model():
     """
-    Extract the unique URL identifier for a MicroSim.
+    Import sentence-transformers and load MODEL_NAME.
 
-    Uses the 'url' or 'identifier' field as the unique key.
+    The import pulls in torch and takes seconds, so it is deferred until
+    there is something to encode: --help, argument errors and incremental
+    runs with nothing changed never pay for it.
     """
-    url = microsim.get("url") or microsim.get("identifier")
-    if not url:
-        # Fallback: construct from _source
-        source = microsim.get("_source", {})
-        repo = source.get("repo", "unknown")
-        sim = source.get("sim", "unknown")
-        url = f"https://dmccreary.github.io/{repo}/sims/{sim}/"
-    return url
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print("Error: sentence-transformers not installed.")
+        print("Install with: pip install sentence-transformers")
+        print("Note: Requires Python 3.12 or earlier (PyTorch constraint)")
+        sys.exit(1)
+    return SentenceTransformer(MODEL_NAME)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate dual WHAT/HOW MicroSim embeddings")
+    parser.add_argument(
+        "--incremental", "-i",
+        action="store_true",
+        help="Reuse vectors from the previous run when a sim's WHAT/HOW text is unchanged"
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=STORE_DTYPES,
+        default="float32",
+        help="Element type of the stored WHAT/HOW matrices (default: float32)"
+    )
+    parser.add_argument(
+        "--quantize",
+        nargs="+",
+        choices=QUANTIZED_VARIANTS,
+        default=[],
+        help="Also write quantized matrix variants (int8 with per-dimension scale, float16); "
+             "compare them with quantization-recall.py"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help=f"Also export the dual-v1 JSON file ({JSON_EXPORT_FILE.name})"
+    )
+    args = parser.parse_args()
+
     print(f"MicroSim Embedding Generator")
     print(f"=" * 50)
     print(f"Model: {MODEL_NAME}")
     print(f"Input: {INPUT_FILE}")
-    print(f"Output: {OUTPUT_FILE}")
+    print(f"Output: {OUTPUT_DIR}")
     print()
 
     # Check input file exists
@@ -253,23 +390,24 @@ def main():
 
     print(f"Found {len(microsims)} MicroSims")
 
-    # Load the embedding model
-    print(f"\nLoading embedding model '{MODEL_NAME}'...")
-    print("(This may take a moment on first run as the model downloads)")
-    model = SentenceTransformer(MODEL_NAME)
-    embedding_dimension = model.get_sentence_embedding_dimension()
-    print(f"Model loaded. Embedding dimension: {embedding_dimension}")
-
     # Prepare texts for embedding
     print("\nPreparing WHAT and HOW texts for embedding...")
     what_texts = []
     how_texts = []
     urls = []
+    sim_ids = []
     skipped = 0
+    unkeyed = 0
     empty_how = 0
 
+    # Rows are keyed by canonical sim ID; their URL is the ID's canonical URL
+    id_table = MicrosimIds.load()
     for microsim in microsims:
-        url = get_microsim_url(microsim)
+        sid = sim_id(microsim, id_table)
+        if sid is None:
+            unkeyed += 1
+            continue
+        url = id_table.urls[sid]
         what_text = create_what_text(microsim)
         how_text = create_how_text(microsim)
 
@@ -284,77 +422,100 @@ def main():
             empty_how += 1
 
         urls.append(url)
+        sim_ids.append(sid)
         what_texts.append(what_text)
         how_texts.append(how_text)
 
     print(f"Prepared {len(urls)} MicroSims for embedding")
     if skipped > 0:
         print(f"Skipped {skipped} MicroSims with insufficient WHAT text")
+    if unkeyed > 0:
+        print(f"Skipped {unkeyed} MicroSims with neither a URL nor a repo/sim location")
     if empty_how > 0:
         print(f"{empty_how} MicroSims had no HOW metadata (neutral HOW text used)")
 
+    # Reuse vectors whose input text is unchanged since the previous run
+    previous, previous_hashes = None, {}
+    if args.incremental:
+        print("\nChecking previous embeddings for reusable vectors...")
+        previous, previous_hashes = load_previous_embeddings()
+    what_vectors, what_pending = plan_encoding(urls, what_texts, "what", previous, previous_hashes)
+    how_vectors, how_pending = plan_encoding(urls, how_texts, "how", previous, previous_hashes)
+    if args.incremental:
+        print(f"Reusing {len(urls) - len(what_pending)} WHAT + {len(urls) - len(how_pending)} HOW vectors; "
+              f"encoding {len(what_pending)} WHAT + {len(how_pending)} HOW texts")
+
+    # Load the embedding model only when there is something to encode
+    model = None
+    embedding_dimension = previous.metadata.get("dimension") if previous is not None else None
+    if what_pending or how_pending:
+        print(f"\nLoading embedding model '{MODEL_NAME}'...")
+        print("(This may take a moment on first run as the model downloads)")
+        model = load_model()
+        embedding_dimension = model.get_sentence_embedding_dimension()
+        print(f"Model loaded. Embedding dimension: {embedding_dimension}")
+
     # Generate embeddings in batches
     batch_size = 32
     print("\nGenerating WHAT embeddings...")
-    what_embeddings = model.encode(
-        what_texts,
-        batch_size=batch_size,
-        show_progress_bar=True,
-        convert_to_numpy=True
-    )
+    what_embeddings = encode_pending(model, what_texts, what_vectors, what_pending, batch_size)
     print("\nGenerating HOW embeddings...")
-    how_embeddings = model.encode(
-        how_texts,
-        batch_size=batch_size,
-        show_progress_bar=True,
-        convert_to_numpy=True
-    )
-
-    print(f"Generated {len(what_embeddings)} WHAT + {len(how_embeddings)} HOW embeddings")
-
-    # Build output structure
-    print("\nBuilding output structure...")
-    output = {
-        "metadata": {
-            "model": MODEL_NAME,
-            "dimension": embedding_dimension,
-            "schema": "dual-v1",
-            "generated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
-            "source_file": str(INPUT_FILE.name)
-        },
-        "embeddings": {}
+    how_embeddings = encode_pending(model, how_texts, how_vectors, how_pending, batch_size)
+
+    print(f"Generated {len(what_pending)} WHAT + {len(how_pending)} HOW embeddings "
+          f"({len(what_embeddings)} + {len(how_embeddings)} total)")
+
+    # Catalog duplicates share a sim ID; the last occurrence wins
+    last_row = {sid: i for i, sid in enumerate(sim_ids)}
+    rows = sorted(last_row.values())
+    if len(rows) < len(urls):
+        print(f"Note: {len(urls) - len(rows)} duplicate sims collapsed")
+    unique_urls = [urls[i] for i in rows]
+    if id_table.added:
+        # Persist new IDs before the store that refers to them
+        id_table.save()
+        print(f"Assigned {id_table.added} new sim IDs")
+
+    metadata = {
+        "model": MODEL_NAME,
+        "dimension": embedding_dimension,
+        "generated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "source_file": str(INPUT_FILE.name)
     }
 
-    for url, what_emb, how_emb in zip(urls, what_embeddings, how_embeddings):
-        output["embeddings"][url] = {
-            "what": what_emb.tolist(),
-            "how": how_emb.tolist()
-        }
-
-    # Count unique URLs (catalog duplicates collapse in the URL-keyed dict)
-    output["metadata"]["count"] = len(output["embeddings"])
-    if len(output["embeddings"]) < len(urls):
-        print(f"Note: {len(urls) - len(output['embeddings'])} duplicate URLs collapsed")
-
-    # Ensure output directory exists
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-
     # Save embeddings (atomic — safe against concurrent regeneration)
-    print(f"\nSaving embeddings to {OUTPUT_FILE}...")
-    atomic_write_json(OUTPUT_FILE, output)
+    print(f"\nSaving embeddings to {OUTPUT_DIR} ({args.dtype})...")
+    index_path = save_store(unique_urls, what_embeddings[rows], how_embeddings[rows], metadata,
+                            store_dir=OUTPUT_DIR, dtype=args.dtype, quantize=tuple(args.quantize),
+                            ids=[sim_ids[i] for i in rows])
+    if args.quantize:
+        print(f"Quantized variants: {', '.join(args.quantize)}")
+
+    if args.json:
+        print(f"Exporting dual-v1 JSON to {JSON_EXPORT_FILE}...")
+        export_json(load_store(OUTPUT_DIR), JSON_EXPORT_FILE)
+
+    # Record which text produced each vector so the next --incremental run
+    # can skip unchanged sims (written after the embeddings it describes)
+    hashes = {
+        url: {"what": text_hash(what_text), "how": text_hash(how_text)}
+        for url, what_text, how_text in zip(urls, what_texts, how_texts)
+    }
+    atomic_write_json(HASHES_FILE, {"model": MODEL_NAME, "hashes": hashes})
 
-    # Report file size
-    file_size_mb = OUTPUT_FILE.stat().st_size / (1024 * 1024)
-    print(f"Saved! File size: {file_size_mb:.2f} MB")
+    # Report store size
+    file_size_mb = store_size(index_path) / (1024 * 1024)
+    print(f"Saved! Store size: {file_size_mb:.2f} MB")
 
     # Summary
     print("\n" + "=" * 50)
     print("Summary:")
     print(f"  - Total MicroSims processed: {len(urls)}")
+    print(f"  - Re-encoded: {len(what_pending)} WHAT, {len(how_pending)} HOW")
     print(f"  - Vectors per MicroSim: 2 (what, how)")
     print(f"  - Embedding dimension: {embedding_dimension}")
-    print(f"  - Output file: {OUTPUT_FILE}")
-    print(f"  - File size: {file_size_mb:.2f} MB")
+    print(f"  - Output store: {OUTPUT_DIR}")
+    print(f"  - Store size: {file_size_mb:.2f} MB")
     print("\nDone!")
 
 
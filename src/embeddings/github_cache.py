@@ -0,0 +1,201 @@
+"""
+Persistent HTTP cache for the GitHub crawlers.
+
+Almost no metadata.json changes between two crawls, yet every crawl used to
+download all of them again. This cache keeps, per URL, the last body with
+its ETag / Last-Modified and its git blob SHA, plus the docs/sims tree SHA
+of every repo, in a small SQLite database:
+
+    data/github-cache.sqlite
+
+Three ways a request is saved:
+
+    blob SHA      the Git tree lists metadata.json with the SHA of the cached
+                  body: no request at all
+    tree SHA      docs/sims has the same tree SHA as last crawl: every file
+                  is unchanged, so all are served from the cache
+    conditional   other cached URLs are requested with If-None-Match /
+                  If-Modified-Since; a 304 (which GitHub does not count
+                  against the rate limit) is answered from the cache
+
+The blob SHA of a body is computed locally (git's "blob <size>\\0" SHA-1), so
+it always matches the content actually stored.
+
+Per-run counters (hits, misses, 304s, bytes saved) are in `stats` for the
+crawl log. Every cache failure (locked or read-only database, corrupt file)
+is reported once on stderr and the cache disables itself; the crawl then
+fetches as usual.
+
+Usage:
+    from github_cache import GitHubCache
+    cache = GitHubCache()
+    fetcher = GitHubFetcher(session, cache=cache)   # conditional requests
+    cache.blob(url, sha)                            # body if SHA matches
+    cache.tree_sha("owner/repo"), cache.set_tree_sha("owner/repo", sha)
+"""
+
+import hashlib
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CACHE_PATH = PROJECT_ROOT / "data" / "github-cache.sqlite"
+MAX_AGE_DAYS = 90  # entries unused this long are dropped on close()
+LOCK_TIMEOUT = 10  # seconds to wait for another process's write
+FLUSH_EVERY = 100  # buffered writes per transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url           TEXT PRIMARY KEY,
+    etag          TEXT,
+    last_modified TEXT,
+    sha           TEXT NOT NULL,
+    content       BLOB NOT NULL,
+    last_used     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trees (
+    repo      TEXT PRIMARY KEY,
+    sha       TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def git_blob_sha(content: bytes) -> str:
+    """The SHA git gives a file with this content."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class GitHubCache:
+    """SQLite-backed URL -> (validators, blob SHA, body) cache, plus repo tree SHAs."""
+
+    def __init__(self, path: Path = CACHE_PATH):
+        self.path = Path(path)
+        self._conn = None
+        self._pending = []  # responses to store
+        self._used = set()  # URLs served from the cache
+        self.enabled = True
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "bytes_saved": 0,
+                      "trees_unchanged": 0}
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=LOCK_TIMEOUT)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _disable(self, error: Exception):
+        print(f"Warning: GitHub cache disabled ({self.path}: {error})", file=sys.stderr)
+        self.enabled = False
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _row(self, url: str):
+        if not self.enabled:
+            return None
+        try:
+            return self._connect().execute(
+                "SELECT etag, last_modified, sha, content FROM responses WHERE url = ?",
+                (url,)).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
+
+    def _hit(self, url: str, content: bytes) -> bytes:
+        self.stats["hits"] += 1
+        self.stats["bytes_saved"] += len(content)
+        self._used.add(url)
+        return content
+
+    def flush(self):
+        """Write buffered responses and last-used times in one transaction."""
+        if not self.enabled or not (self._pending or self._used):
+            return
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO responses "
+                                 "(url, etag, last_modified, sha, content, last_used) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", self._pending)
+                conn.executemany("UPDATE responses SET last_used = ? WHERE url = ?",
+                                 [(now, url) for url in self._used])
+        except sqlite3.Error as e:
+            self._disable(e)
+        self._pending = []
+        self._used = set()
+
+    def blob(self, url: str, sha: str):
+        """Cached body of *url* if its blob SHA is *sha* (counted as a hit), else None."""
+        row = self._row(url)
+        if row is None or row[2] != sha:
+            return None
+        return self._hit(url, row[3])
+
+    def conditional_headers(self, url: str) -> dict:
+        """If-None-Match / If-Modified-Since for a cached URL ({} if not cached)."""
+        row = self._row(url)
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def not_modified(self, url: str):
+        """Cached body for a 304 response to *url* (None if it has gone missing)."""
+        row = self._row(url)
+        if row is None:
+            return None
+        self.stats["not_modified"] += 1
+        return self._hit(url, row[3])
+
+    def store(self, url: str, headers, content: bytes):
+        """Record a 200 response (counted as a miss); written in batches."""
+        self.stats["misses"] += 1
+        if not self.enabled:
+            return
+        self._pending.append((url, headers.get("ETag"), headers.get("Last-Modified"),
+                              git_blob_sha(content), content, time.time()))
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def tree_sha(self, repo: str):
+        """docs/sims tree SHA recorded for *repo* ("owner/repo") by the last crawl."""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connect().execute("SELECT sha FROM trees WHERE repo = ?", (repo,)).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
+        return row[0] if row else None
+
+    def set_tree_sha(self, repo: str, sha: str):
+        if not self.enabled:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO trees (repo, sha, last_used) VALUES (?, ?, ?)",
+                             (repo, sha, time.time()))
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def close(self):
+        """Flush, drop entries unused for MAX_AGE_DAYS, then close the database."""
+        self.flush()
+        if self._conn is None:
+            return
+        cutoff = time.time() - MAX_AGE_DAYS * 86400
+        try:
+            with self._conn as conn:
+                conn.execute("DELETE FROM responses WHERE last_used < ?", (cutoff,))
+                conn.execute("DELETE FROM trees WHERE last_used < ?", (cutoff,))
+        except sqlite3.Error as e:
+            print(f"Warning: GitHub cache not pruned ({self.path}: {e})", file=sys.stderr)
+        self._conn.close()
+        self._conn = None
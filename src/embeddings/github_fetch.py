@@ -0,0 +1,385 @@
+"""
+Concurrent, rate-limited fetching for the GitHub catalog crawlers.
+
+The crawlers used to issue one blocking request at a time with a fixed
+time.sleep(0.5) after each, so a 200-sim repo spent 100 s asleep. Here
+requests run concurrently on asyncio, bounded by a pool of `concurrency`
+slots and paced per host by a token bucket. The blocking requests calls run
+in worker threads, each with its own Session copied from the caller's (a
+Session is not safe to share between threads).
+
+    TokenBucket    refills at `rate` requests/s up to `capacity`. Responses
+                   carrying X-RateLimit-Remaining / X-RateLimit-Reset adjust
+                   it: spending is capped at the remaining quota, the last
+                   RATE_RESERVE requests are spread evenly until the reset, and
+                   at zero the host is paused until the reset.
+
+Failed requests are retried with exponential backoff and jitter: network
+errors, 429, 5xx, and 403s that are rate limits (quota at zero or a
+Retry-After header). Retry-After and the reset time are honored when given.
+A wait longer than max_wait is not made; the request fails instead, so a
+crawl stops promptly when the hourly quota is gone.
+
+With a github_cache.GitHubCache, requests carry If-None-Match /
+If-Modified-Since for cached URLs and 304s are answered from the cache.
+
+discover_sims() lists a repo's sims with a single recursive Git Trees
+request, which also returns the blob SHA of every docs/sims/*/metadata.json,
+so only metadata files that exist are fetched (no 404 probes per sim).
+
+API and raw-content base URLs come from GITHUB_API_URL and GITHUB_RAW_URL
+when set, so the crawlers can run against a local stand-in server.
+
+Usage:
+    from github_fetch import GitHubFetcher, GITHUB_API
+    fetcher = GitHubFetcher(session, concurrency=8)
+    results = fetcher.get_many(urls)     # FetchResult per URL, in order
+    results[0].status, results[0].json()
+    fetcher.stats                        # requests, retries, failures
+    tree = asyncio.run(discover_sims(fetcher, "dmccreary", "geometry-course"))
+    tree.sims, tree.metadata, tree.metadata_url(sim)
+    names, failed = asyncio.run(list_repos(fetcher, "dmccreary"))
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+GITHUB_API = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+RAW_CONTENT_BASE = os.environ.get("GITHUB_RAW_URL", "https://raw.githubusercontent.com").rstrip("/")
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 20.0  # requests/s per host while the quota is plentiful
+RATE_RESERVE = 20  # below this many remaining requests, pace to the reset
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0  # seconds, doubled per retry
+BACKOFF_MAX = 60.0
+MAX_WAIT = 300.0  # longest rate-limit wait before giving up on a request
+REQUEST_TIMEOUT = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_BRANCH = "main"
+SIMS_DIR = "docs/sims"
+
+
+class FetchResult:
+    """Outcome of one URL: the final response, or the error that ended it."""
+
+    def __init__(self, url: str, status: int = None, headers: dict = None,
+                 content: bytes = b"", error: str = None, attempts: int = 0):
+        self.url = url
+        self.from_cache = False  # a 304 answered from the cache
+        self.status = status
+        self.headers = headers or {}
+        self.content = content
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status in (403, 429) and (
+            self.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in self.headers)
+
+    def json(self):
+        """Parsed body (raises json.JSONDecodeError on invalid JSON)."""
+        return json.loads(self.content)
+
+
+class TokenBucket:
+    """Per-host request pacing, tightened by GitHub's rate-limit headers."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: float = None,
+                 reserve: int = RATE_RESERVE):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.reserve = reserve
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is now)."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self, max_wait: float = MAX_WAIT) -> bool:
+        """Take one token, sleeping as needed; False if that would exceed max_wait."""
+        # No lock needed: nothing awaits between the check and the take
+        while True:
+            wait = self.wait_time()
+            if wait == 0:
+                self.tokens -= 1
+                return True
+            if wait > max_wait:
+                return False
+            await asyncio.sleep(wait)
+
+    def observe(self, headers):
+        """Adjust to X-RateLimit-Remaining / X-RateLimit-Reset, if present."""
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset = float(headers["X-RateLimit-Reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+        window = max(reset - time.time(), 1.0)
+        if remaining <= 0:
+            self.paused_until = time.monotonic() + window
+            self.tokens = 0
+        elif remaining <= self.reserve:
+            self.rate = min(self.base_rate, remaining / window)
+        else:
+            self.rate = self.base_rate
+        self.tokens = min(self.tokens, max(remaining, 0))
+
+
+def retry_delay(headers, attempt: int) -> float:
+    """Seconds to wait before retry number attempt + 1."""
+    retry_after = headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset"):
+        try:
+            return max(float(headers["X-RateLimit-Reset"]) - time.time(), 0.0) + 1.0
+        except ValueError:
+            pass
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+
+class GitHubFetcher:
+    """Concurrent GETs, paced per host, with the headers of one requests.Session."""
+
+    def __init__(self, session: requests.Session = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 rate: float = DEFAULT_RATE, max_retries: int = MAX_RETRIES,
+                 max_wait: float = MAX_WAIT, cache=None):
+        self.session = session or requests.Session()  # template for the per-thread sessions
+        self.cache = cache  # github_cache.GitHubCache for conditional requests, or None
+        self._local = threading.local()
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.buckets = {}
+        self._slots = None  # (event loop, semaphore): asyncio primitives are per loop
+        self.stats = {"requests": 0, "retries": 0, "failed": 0, "rate_limit_waits": 0}
+
+    def thread_session(self) -> requests.Session:
+        """The calling worker thread's Session, with the template's headers, auth and cookies."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.session.headers)
+            session.auth = self.session.auth
+            session.cookies.update(self.session.cookies)
+            self._local.session = session
+        return session
+
+    def _get(self, url: str, headers: dict) -> requests.Response:
+        return self.thread_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, capacity=self.concurrency)
+        return self.buckets[host]
+
+    def slots(self) -> asyncio.Semaphore:
+        """The in-flight request pool of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots[0] is not loop:
+            self._slots = (loop, asyncio.Semaphore(self.concurrency))
+        return self._slots[1]
+
+    async def fetch(self, url: str) -> FetchResult:
+        """GET *url* with pacing and retries; never raises for HTTP or network errors."""
+        bucket = self.bucket(url)
+        slots = self.slots()
+        result = FetchResult(url)
+        conditional = self.cache is not None
+        attempt = 0
+        while True:
+            headers = self.cache.conditional_headers(url) if conditional else {}
+            if not await bucket.acquire(self.max_wait):
+                result.error = "rate limit exhausted until reset"
+                break
+            result.attempts += 1
+            self.stats["requests"] += 1
+            async with slots:
+                try:
+                    response = await asyncio.to_thread(self._get, url, headers)
+                except requests.RequestException as e:
+                    response = None
+                    result.status, result.headers, result.error = None, {}, str(e)
+            if response is not None:
+                bucket.observe(response.headers)
+                result.status, result.headers = response.status_code, response.headers
+                result.content, result.error = response.content, None
+                if response.status_code == 304 and conditional:
+                    cached = self.cache.not_modified(url)
+                    if cached is None:
+                        # Evicted meanwhile: ask again without validators, not a retry
+                        conditional = False
+                        continue
+                    result.status, result.content, result.from_cache = 200, cached, True
+                    return result
+                if response.status_code == 200 and self.cache is not None:
+                    self.cache.store(url, response.headers, response.content)
+                if response.status_code not in RETRY_STATUSES and not result.rate_limited:
+                    return result
+            if attempt == self.max_retries:
+                break
+            delay = retry_delay(result.headers, attempt)
+            if delay > self.max_wait:
+                break
+            if result.rate_limited:
+                self.stats["rate_limit_waits"] += 1
+            self.stats["retries"] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+        self.stats["failed"] += 1
+        return result
+
+    async def fetch_all(self, urls: list) -> list:
+        """FetchResult for every URL, in order, at most `concurrency` in flight."""
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
+
+    def get_many(self, urls: list) -> list:
+        """Blocking wrapper around fetch_all() for synchronous callers."""
+        return asyncio.run(self.fetch_all(list(urls)))
+
+    def get(self, url: str) -> FetchResult:
+        return self.get_many([url])[0]
+
+
+class SimTree:
+    """The MicroSims of one repo as listed by its Git tree."""
+
+    def __init__(self, owner: str, repo: str, branch: str = DEFAULT_BRANCH):
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+        self.response = None  # FetchResult of the last trees request
+        self.sims_sha = None  # tree SHA of docs/sims; None if the repo has none
+        self.sims = []  # every directory under docs/sims
+        self.metadata = {}  # sim -> blob SHA of its metadata.json
+        self.truncated = False
+
+    @property
+    def ok(self) -> bool:
+        return self.response is not None and self.response.ok
+
+    def metadata_url(self, sim: str) -> str:
+        return f"{RAW_CONTENT_BASE}/{self.owner}/{self.repo}/{self.branch}/{SIMS_DIR}/{sim}/metadata.json"
+
+    def github_url(self, sim: str) -> str:
+        return f"https://github.com/{self.owner}/{self.repo}/tree/{self.branch}/{SIMS_DIR}/{sim}"
+
+    def read_entries(self, entries: list, prefix: str):
+        """Collect sim directories and metadata.json blobs from tree entries under *prefix*."""
+        sims = set()
+        for entry in entries:
+            path = entry["path"]
+            if not path.startswith(prefix):
+                continue
+            parts = path[len(prefix):].split("/")
+            if len(parts) == 1 and entry["type"] == "tree":
+                sims.add(parts[0])
+            elif len(parts) == 2 and parts[1] == "metadata.json" and entry["type"] == "blob":
+                self.metadata[parts[0]] = entry["sha"]
+        self.sims = sorted(sims)
+
+
+async def discover_sims(fetcher: GitHubFetcher, owner: str, repo: str,
+                        branch: str = DEFAULT_BRANCH) -> SimTree:
+    """
+    List a repo's sims and their metadata.json blob SHAs with one recursive
+    Git Trees request. Trees too large for one response (tree.truncated) are
+    walked down to docs/sims, which is then listed on its own; if that is
+    still too large, docs/sims is listed one level deep and each sim's tree
+    fetched separately.
+    Check tree.ok: on failure tree.response holds the failed request.
+    """
+    tree = SimTree(owner, repo, branch)
+    base = f"{GITHUB_API}/repos/{owner}/{repo}/git/trees"
+    tree.response = await fetcher.fetch(f"{base}/{branch}?recursive=1")
+    if not tree.ok:
+        return tree
+    data = tree.response.json()
+    if not data.get("truncated"):
+        for entry in data["tree"]:
+            if entry["path"] == SIMS_DIR and entry["type"] == "tree":
+                tree.sims_sha = entry["sha"]
+        tree.read_entries(data["tree"], SIMS_DIR + "/")
+        return tree
+
+    tree.truncated = True
+    sha = data["sha"]
+    for name in SIMS_DIR.split("/"):
+        tree.response = await fetcher.fetch(f"{base}/{sha}")
+        if not tree.ok:
+            return tree
+        sha = next((entry["sha"] for entry in tree.response.json()["tree"]
+                    if entry["path"] == name and entry["type"] == "tree"), None)
+        if sha is None:
+            return tree
+    tree.sims_sha = sha
+    tree.response = await fetcher.fetch(f"{base}/{sha}?recursive=1")
+    if not tree.ok:
+        return tree
+    data = tree.response.json()
+    if not data.get("truncated"):
+        tree.read_entries(data["tree"], "")
+        return tree
+
+    # Even docs/sims alone is too large: one request for the sim list, one per sim
+    tree.response = await fetcher.fetch(f"{base}/{sha}")
+    if not tree.ok:
+        return tree
+    dirs = [entry for entry in tree.response.json()["tree"] if entry["type"] == "tree"]
+    responses = await fetcher.fetch_all([f"{base}/{entry['sha']}" for entry in dirs])
+    entries = list(dirs)
+    for entry, response in zip(dirs, responses):
+        if not response.ok:
+            tree.response = response
+            return tree
+        entries.extend(dict(child, path=f"{entry['path']}/{child['path']}")
+                       for child in response.json()["tree"])
+    tree.read_entries(entries, "")
+    return tree
+
+
+async def list_repos(fetcher: GitHubFetcher, owner: str) -> tuple[list, FetchResult | None]:
+    """
+    Names of every public repository of a user or organization, and the
+    failed FetchResult if the listing stopped early (else None).
+    """
+    names = []
+    page = 1
+    while True:
+        response = await fetcher.fetch(f"{GITHUB_API}/users/{owner}/repos?per_page=100&page={page}")
+        if not response.ok:
+            return names, response
+        repos = response.json()
+        if not repos:
+            return names, None
+        names.extend(repo["name"] for repo in repos)
+        page += 1
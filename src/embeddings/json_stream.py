@@ -0,0 +1,149 @@
+"""
+Streaming, atomic JSON output for large pipeline files.
+
+json.dumps() of a whole catalog output holds the Python object graph, the
+encoded string and (for embeddings) a float list per vector at the same time.
+dump_stream() instead writes a skeleton whose large parts are lazy, a member
+or a block of numbers at a time, straight into the temp file that is renamed
+over the target when complete (so readers never see a partial file):
+
+    LazyObject(pairs)     {key: value, ...} from an iterable of (key, value)
+    LazyArray(items)      [item, ...] from an iterable
+    NumberArray(array)    a NumPy array as one flat JSON array, formatted
+                          block by block from the array's buffer (no .tolist())
+
+Floats are written with FLOAT_FORMAT ("%.9g"), which round-trips every
+float32 exactly and is about 40% shorter than the repr of the float64 that
+.tolist() produces. Everything else is encoded by the json module.
+
+dump_json() is the same atomic write for ordinary (non-lazy) objects and
+accepts json.dump() options such as indent.
+
+Usage:
+    from json_stream import dump_stream, LazyObject, NumberArray
+    dump_stream(path, {"metadata": meta,
+                       "embeddings": LazyObject((url, NumberArray(matrix[i]))
+                                                for i, url in enumerate(urls))})
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+FLOAT_FORMAT = "%.9g"  # shortest "%g" precision that round-trips float32
+NUMBER_BLOCK = 4096  # values formatted per write
+WRITE_BUFFER = 1 << 20
+
+
+class LazyObject:
+    """A JSON object produced from an iterable of (key, value) pairs."""
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+class LazyArray:
+    """A JSON array produced from an iterable of items."""
+
+    def __init__(self, items):
+        self.items = items
+
+
+class NumberArray:
+    """A NumPy array written as one flat JSON array of numbers."""
+
+    def __init__(self, values, fmt: str = None):
+        self.values = np.asarray(values).ravel()
+        if fmt is None:
+            fmt = "%d" if np.issubdtype(self.values.dtype, np.integer) else FLOAT_FORMAT
+        self.fmt = fmt
+
+
+@contextmanager
+def atomic_output(path: Path, mode: str = "w"):
+    """Yield a temp file next to *path*; it replaces *path* only if the block succeeds."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"}),
+                       buffering=WRITE_BUFFER) as f:
+            yield f
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class _Lazy(Exception):
+    """Raised from json.dumps(default=...) when a plain container holds a lazy node."""
+
+
+def _reject(obj):
+    raise _Lazy()
+
+
+def _write_numbers(f, node: NumberArray, templates: dict):
+    values = node.values
+    f.write("[")
+    for start in range(0, len(values), NUMBER_BLOCK):
+        block = values[start:start + NUMBER_BLOCK]
+        if block.dtype.kind == "f" and not np.isfinite(block).all():
+            raise ValueError("NaN and infinity are not valid JSON numbers")
+        template = templates.get((node.fmt, len(block)))
+        if template is None:
+            template = templates[(node.fmt, len(block))] = ",".join([node.fmt] * len(block))
+        if start:
+            f.write(",")
+        f.write(template % tuple(block))
+    f.write("]")
+
+
+def write_stream(f, obj, _templates: dict = None):
+    """Write *obj* (which may contain lazy nodes) to text file *f* as compact JSON."""
+    templates = {} if _templates is None else _templates
+    if isinstance(obj, (dict, list, tuple)):
+        # Plain containers are encoded in one call unless they hold a lazy node
+        try:
+            f.write(json.dumps(obj, separators=(",", ":"), default=_reject))
+            return
+        except _Lazy:
+            pass
+    if isinstance(obj, NumberArray):
+        _write_numbers(f, obj, templates)
+    elif isinstance(obj, (dict, LazyObject)):
+        f.write("{")
+        for n, (key, value) in enumerate(obj.items() if isinstance(obj, dict) else obj.pairs):
+            if n:
+                f.write(",")
+            f.write(json.dumps(str(key)))
+            f.write(":")
+            write_stream(f, value, templates)
+        f.write("}")
+    elif isinstance(obj, (list, tuple, LazyArray)):
+        f.write("[")
+        for n, item in enumerate(obj.items if isinstance(obj, LazyArray) else obj):
+            if n:
+                f.write(",")
+            write_stream(f, item, templates)
+        f.write("]")
+    else:
+        f.write(json.dumps(obj, separators=(",", ":")))
+
+
+def dump_stream(path: Path, obj) -> int:
+    """Atomically write *obj* (lazy nodes allowed) to *path*; returns the file size."""
+    with atomic_output(path) as f:
+        write_stream(f, obj)
+    return Path(path).stat().st_size
+
+
+def dump_json(path: Path, obj, **dump_kwargs) -> int:
+    """Atomically json.dump() *obj* to *path*, encoded chunk by chunk; returns the file size."""
+    with atomic_output(path) as f:
+        json.dump(obj, f, **dump_kwargs)
+    return Path(path).stat().st_size
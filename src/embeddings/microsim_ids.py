@@ -0,0 +1,217 @@
+"""
+Canonical MicroSim IDs shared by the pipeline artifacts.
+
+Catalog entries name their sim inconsistently: most carry a full GitHub
+Pages URL, some only a bare slug in "identifier" (e.g. "ai-in-am-pipeline"),
+and copied metadata can repeat another sim's URL. Every sim does have a
+unique location, its owner, repo and sim directory, so that is the
+canonical key (lowercased):
+
+    "<repo>/<sim>"            sims of DEFAULT_OWNER, e.g. "geometry-course/pendulum"
+    "<owner>/<repo>/<sim>"    any other owner, so forks keep their own IDs
+
+Each key maps to a dense integer ID in an append-only table:
+
+    data/microsim-ids.json   {"schema": "microsim-ids-v2", "keys": [...], "urls": [...]}
+
+ID i is keys[i]. IDs are never reused or renumbered, so artifacts written at
+different times stay joinable. urls[i] is the sim's canonical URL: its
+declared URL when that is the GitHub Pages URL of the same owner/repo/sim,
+otherwise the Pages URL built from its location.
+
+Version 1 tables keyed every sim as "<repo>/<sim>", whatever its owner; on
+load, a key whose URL is another owner's Pages URL is moved to that owner's
+key. (Forks that had collided on one key keep the ID for the owner stamped
+last; the other is given a new ID the next time it is stamped.)
+
+update-local-microsims.py and update-repo-microsims.py assign IDs and stamp
+"sim_id" and the canonical "url" on every catalog entry.
+generate-embeddings.py stores the ID of every row, and the other tools join
+catalog and store with catalog_rows() instead of re-deriving URL keys.
+
+Usage:
+    from microsim_ids import MicrosimIds, catalog_rows
+    table = MicrosimIds.load()
+    table.stamp(catalog); table.save()       # catalog writers
+    sims = catalog_rows(store, catalog)      # catalog entry per store row
+"""
+
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+ID_TABLE_PATH = PROJECT_ROOT / "data" / "microsim-ids.json"
+
+SCHEMA = "microsim-ids-v2"
+SCHEMA_V1 = "microsim-ids-v1"  # "<repo>/<sim>" keys for every owner
+DEFAULT_OWNER = "dmccreary"
+PAGES_URL_RE = re.compile(r"^https?://([^./]+)\.github\.io/([^/]+)/sims/([^/?#]+)", re.IGNORECASE)
+GITHUB_URL_RE = re.compile(r"^https?://github\.com/([^/]+)/", re.IGNORECASE)
+
+
+def declared_url(sim: dict):
+    """The URL a catalog entry declares for itself (may be a bare slug)."""
+    return sim.get("url") or sim.get("identifier")
+
+
+def _location(sim: dict):
+    """(owner, repo, sim) of the sim's directory, or None if unknown."""
+    source = sim.get("_source") or {}
+    if source.get("repo") and source.get("sim"):
+        match = GITHUB_URL_RE.match(source.get("github_url") or "")
+        return (match.group(1) if match else DEFAULT_OWNER), source["repo"], source["sim"]
+    match = PAGES_URL_RE.match(declared_url(sim) or "")
+    if match:
+        return match.groups()
+    return None
+
+
+def location_key(owner: str, repo: str, name: str) -> str:
+    """Canonical key of a sim directory; the owner is left out for DEFAULT_OWNER."""
+    key = f"{repo}/{name}" if owner.lower() == DEFAULT_OWNER else f"{owner}/{repo}/{name}"
+    return key.strip().lower()
+
+
+def sim_key(sim: dict):
+    """Canonical location key, "url:<declared>" without a location, or None."""
+    location = _location(sim)
+    if location:
+        return location_key(*location)
+    url = declared_url(sim)
+    return f"url:{url.strip()}" if url else None
+
+
+def canonical_url(sim: dict):
+    """The declared URL if it is this sim's own Pages URL (same owner too), else the Pages URL."""
+    url = (declared_url(sim) or "").strip()
+    location = _location(sim)
+    if not location:
+        return url or None
+    owner, repo, name = location
+    match = PAGES_URL_RE.match(url)
+    if match and tuple(part.lower() for part in match.groups()) == (owner.lower(), repo.lower(), name.lower()):
+        return url
+    return f"https://{owner}.github.io/{repo}/sims/{name}/"
+
+
+def _migrate_v1(keys: list, urls: list) -> list:
+    """Version 1 keys, with those of other owners' sims moved to owner-qualified keys."""
+    migrated = list(keys)
+    taken = set(keys)
+    for i, (key, url) in enumerate(zip(keys, urls)):
+        match = PAGES_URL_RE.match(url or "")
+        if not match:
+            continue
+        owner, repo, name = match.groups()
+        new_key = location_key(owner, repo, name)
+        if new_key != key and f"{repo}/{name}".lower() == key and new_key not in taken:
+            migrated[i] = new_key
+            taken.add(new_key)
+    return migrated
+
+
+class MicrosimIds:
+    """Append-only table: canonical key <-> dense integer ID, plus each ID's URL."""
+
+    def __init__(self, keys: list = None, urls: list = None):
+        self.keys = list(keys or [])
+        self.urls = list(urls) if urls is not None else [None] * len(self.keys)
+        self._id_of = {key: i for i, key in enumerate(self.keys)}
+        self.added = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def load(cls, path: Path = ID_TABLE_PATH) -> "MicrosimIds":
+        """The saved table, or an empty one if none has been written yet."""
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("schema") == SCHEMA_V1:
+            return cls(_migrate_v1(data["keys"], data["urls"]), data["urls"])
+        if data.get("schema") != SCHEMA:
+            raise ValueError(f"{path} is not a {SCHEMA} ID table")
+        return cls(data["keys"], data["urls"])
+
+    def save(self, path: Path = ID_TABLE_PATH):
+        """Write the table atomically."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"schema": SCHEMA, "count": len(self.keys),
+                           "keys": self.keys, "urls": self.urls}, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def id_of(self, key: str):
+        return self._id_of.get(key)
+
+    def assign(self, sim: dict):
+        """ID of *sim*, adding its key if new; records its canonical URL. None if unkeyable."""
+        key = sim_key(sim)
+        if key is None:
+            return None
+        sid = self._id_of.get(key)
+        if sid is None:
+            sid = len(self.keys)
+            self.keys.append(key)
+            self.urls.append(None)
+            self._id_of[key] = sid
+            self.added += 1
+        self.urls[sid] = canonical_url(sim)
+        return sid
+
+    def stamp(self, catalog: list) -> int:
+        """Set "sim_id" and the canonical "url" on every entry; returns the IDs added."""
+        before = self.added
+        for sim in catalog:
+            sid = self.assign(sim)
+            if sid is not None:
+                sim["sim_id"] = sid
+                sim["url"] = self.urls[sid]
+        return self.added - before
+
+
+def sim_id(sim: dict, table: MicrosimIds):
+    """
+    ID of a catalog entry: its stamped "sim_id" when *table* agrees, otherwise
+    looked up (or added in memory) by key, e.g. for catalogs stamped against
+    another table or not stamped at all.
+    """
+    sid = sim.get("sim_id")
+    if isinstance(sid, int) and 0 <= sid < len(table) and table.keys[sid] == sim_key(sim):
+        return sid
+    return table.assign(sim)
+
+
+def catalog_rows(store, catalog: list, table: MicrosimIds = None) -> list:
+    """
+    The catalog entry for every store row ({} when the catalog lacks it).
+
+    Joined on integer sim IDs. Stores written before IDs existed have no
+    store.ids and are joined on the declared URL they were keyed by.
+    """
+    if getattr(store, "ids", None) is None:
+        by_url = {}
+        for sim in catalog:
+            url = declared_url(sim)
+            if url:
+                by_url[url] = sim
+        return [by_url.get(url, {}) for url in store.urls]
+    table = table if table is not None else MicrosimIds.load()
+    by_id = {}
+    for sim in catalog:
+        sid = sim_id(sim, table)
+        if sid is not None:
+            by_id[sid] = sim
+    return [by_id.get(sid, {}) for sid in store.ids.tolist()]
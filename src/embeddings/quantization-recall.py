@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Measure how much ranking quality the quantized embedding variants give up.
+
+For a sample of catalog sims, finds the top-k nearest neighbors (self
+excluded) using the float32 WHAT and HOW matrices as the reference, repeats
+the search on each quantized variant in the store (float16, int8), and
+reports recall@k, the largest absolute score error, and the matrix size. Use
+it to pick the smallest format that keeps rankings stable before switching a
+tool to --precision float16/int8.
+
+Usage:
+    python src/embeddings/generate-embeddings.py --incremental --quantize int8 float16
+    python src/embeddings/quantization-recall.py
+    python src/embeddings/quantization-recall.py --k 10 --sample 1000
+
+Output:
+    A table on stdout, one row per (variant, role).
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from embedding_store import load_store, dot_scores, QUANTIZED_VARIANTS
+
+
+def top_k(matrix, queries: np.ndarray, query_rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Top-k neighbor rows and scores per query, excluding the query's own row."""
+    scores = dot_scores(matrix, queries).T  # (B, N)
+    scores[np.arange(len(query_rows)), query_rows] = -np.inf
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return idx, np.take_along_axis(scores, idx, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall of quantized embeddings vs float32")
+    parser.add_argument("--k", type=int, default=10, help="Neighbors compared per query (default: 10)")
+    parser.add_argument("--sample", type=int, default=500,
+                        help="Number of catalog sims used as queries (default: 500, 0 = all)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the query sample")
+    args = parser.parse_args()
+
+    reference = load_store(precision="float32")
+    n = len(reference)
+    if n <= args.k:
+        print(f"Error: catalog has {n} sims; need more than k={args.k}")
+        sys.exit(1)
+
+    rng = np.random.default_rng(args.seed)
+    sample = n if args.sample <= 0 else min(args.sample, n)
+    query_rows = np.sort(rng.choice(n, size=sample, replace=False))
+
+    print(f"Quantization recall: {n} sims, {sample} queries, k={args.k}")
+    print()
+    print(f"{'variant':<9} {'role':<5} {'recall@k':>9} {'max |err|':>10} {'size MB':>8}")
+    print("-" * 45)
+
+    for role in ("what", "how"):
+        ref_matrix = getattr(reference, role)
+        queries = np.asarray(ref_matrix[query_rows], dtype=np.float32)
+        ref_idx, _ = top_k(ref_matrix, queries, query_rows, args.k)
+        ref_size = ref_matrix.shape[0] * ref_matrix.shape[1] * 4 / 2**20
+        print(f"{'float32':<9} {role:<5} {1.0:>9.4f} {0.0:>10.5f} {ref_size:>8.2f}")
+
+        for variant in QUANTIZED_VARIANTS:
+            try:
+                store = load_store(precision=variant)
+            except FileNotFoundError:
+                print(f"{variant:<9} {role:<5}  not generated (run with --quantize {variant})")
+                continue
+            matrix = getattr(store, role)
+            idx, scores = top_k(matrix, queries, query_rows, args.k)
+            hits = sum(len(np.intersect1d(a, b)) for a, b in zip(idx, ref_idx))
+            recall = hits / (sample * args.k)
+            exact = np.take_along_axis(dot_scores(ref_matrix, queries).T, idx, axis=1)
+            max_err = float(np.abs(exact - scores).max())
+            print(f"{variant:<9} {role:<5} {recall:>9.4f} {max_err:>10.5f} {matrix.nbytes / 2**20:>8.2f}")
+    print()
+    print("recall@k = fraction of the float32 top-k neighbors the variant also returns")
+
+
+if __name__ == "__main__":
+    main()
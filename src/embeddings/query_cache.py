@@ -0,0 +1,177 @@
+"""
+Persistent LRU cache of query embeddings.
+
+Reuse and template queries repeat heavily across generator reruns and
+retries. This cache keeps the L2-normalized vector for each
+(model name, normalized query text) in a small SQLite database, so a repeated
+query skips the encoder entirely (and, with the model loaded lazily, never
+imports torch).
+
+    data/query-embedding-cache.sqlite
+
+Query text is normalized by collapsing whitespace only, since the tokenizer
+ignores whitespace differences. The cache holds at most `max_entries`
+vectors; each write evicts the least recently used entries beyond that.
+Hit/miss/eviction counters persist alongside the entries for `stats()`.
+
+Every cache failure (locked or read-only database, corrupt file) is reported
+once on stderr and the cache disables itself; queries then encode as usual.
+
+Usage:
+    from query_cache import QueryEmbeddingCache
+    cache = QueryEmbeddingCache("all-MiniLM-L6-v2")
+    found = cache.get_many(texts)        # {text: vector} for the hits
+    cache.put_many({text: vector, ...})  # store new vectors
+"""
+
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CACHE_PATH = PROJECT_ROOT / "data" / "query-embedding-cache.sqlite"
+DEFAULT_MAX_ENTRIES = 20000
+LOCK_TIMEOUT = 10  # seconds to wait for another process's write
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    model     TEXT NOT NULL,
+    text      TEXT NOT NULL,
+    dim       INTEGER NOT NULL,
+    vector    BLOB NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits      INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (model, text)
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_query_text(text: str) -> str:
+    """Cache key form of a query: surrounding whitespace stripped, runs collapsed."""
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """SQLite-backed LRU map (model, query text) -> normalized float32 vector."""
+
+    def __init__(self, model_name: str, path: Path = CACHE_PATH,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.model_name = model_name
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._conn = None
+        self.enabled = True
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=LOCK_TIMEOUT)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _disable(self, error: Exception):
+        print(f"Warning: query embedding cache disabled ({self.path}: {error})", file=sys.stderr)
+        self.enabled = False
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _bump(self, conn, name: str, amount: int):
+        if amount:
+            conn.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                         (name, amount))
+
+    def get_many(self, texts: list) -> dict:
+        """Cached vectors for *texts*, as {text: vector}; misses are absent."""
+        if not self.enabled or not texts:
+            return {}
+        keys = {text: normalize_query_text(text) for text in texts}
+        unique = sorted(set(keys.values()))
+        try:
+            conn = self._connect()
+            rows = {}
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows.update(
+                    (text, np.frombuffer(blob, dtype=np.float32, count=dim).copy())
+                    for text, dim, blob in conn.execute(
+                        f"SELECT text, dim, vector FROM entries WHERE model = ? AND text IN ({marks})",
+                        [self.model_name] + part))
+            with conn:
+                now = time.time()
+                conn.executemany("UPDATE entries SET last_used = ?, hits = hits + 1 "
+                                 "WHERE model = ? AND text = ?",
+                                 [(now, self.model_name, text) for text in rows])
+                self._bump(conn, "hits", len(rows))
+                self._bump(conn, "misses", len(unique) - len(rows))
+        except sqlite3.Error as e:
+            self._disable(e)
+            return {}
+        return {text: rows[key] for text, key in keys.items() if key in rows}
+
+    def put_many(self, vectors: dict):
+        """Store {text: normalized vector} and evict down to max_entries."""
+        if not self.enabled or not vectors:
+            return
+        now = time.time()
+        records = [(self.model_name, normalize_query_text(text), len(vector),
+                    np.asarray(vector, dtype=np.float32).tobytes(), now, now)
+                   for text, vector in vectors.items()]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO entries "
+                                 "(model, text, dim, vector, created, last_used) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", records)
+                excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute("DELETE FROM entries WHERE rowid IN "
+                                 "(SELECT rowid FROM entries ORDER BY last_used LIMIT ?)", (excess,))
+                    self._bump(conn, "evictions", excess)
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def stats(self) -> dict:
+        """Entry counts, file size and lifetime hit/miss/eviction counters."""
+        stats = {
+            "path": str(self.path),
+            "max_entries": self.max_entries,
+            "entries": 0,
+            "models": {},
+            "size_bytes": self.path.stat().st_size if self.path.exists() else 0,
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "hit_rate": None,
+        }
+        if not self.path.exists():
+            return stats
+        try:
+            conn = self._connect()
+            for model, count in conn.execute("SELECT model, COUNT(*) FROM entries GROUP BY model"):
+                stats["models"][model] = count
+                stats["entries"] += count
+            for name, value in conn.execute("SELECT name, value FROM counters"):
+                stats[name] = value
+        except sqlite3.Error as e:
+            self._disable(e)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+        return stats
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -2,7 +2,7 @@
 """
 Find Duplicate MicroSims by WHAT similarity.
 
-Reads the dual-v1 embeddings file and the catalog metadata, computes pairwise
+Reads the WHAT/HOW embeddings store and the catalog metadata, computes pairwise
 cosine similarity on the WHAT vector (what each MicroSim teaches), clusters
 MicroSims whose WHAT similarity exceeds a threshold, and writes a merge-report
 recommending which sim in each cluster to keep as the single high-quality
@@ -18,26 +18,74 @@ Usage:
     python src/find-duplicate-microsims.py                 # default threshold 0.90
     python src/find-duplicate-microsims.py --threshold 0.88
     python src/find-duplicate-microsims.py --cross-repo-only
+    python src/find-duplicate-microsims.py --precision int8    # quantized WHAT matrix
+    python src/find-duplicate-microsims.py --method ann        # IVF range search
+    python src/find-duplicate-microsims.py --method lsh --check-recall
+    python src/find-duplicate-microsims.py --sweep 0.85:0.97   # compare thresholds
+    python src/find-duplicate-microsims.py --workers 16        # parallel exact pass
+    python src/find-duplicate-microsims.py --incremental       # nightly, after catalog updates
+    python src/find-duplicate-microsims.py --code              # also code-level copies
+
+--method lsh avoids the N^2 pass: random-hyperplane (SimHash) signatures are
+split into bands, sims sharing a band bucket become candidate pairs, and only
+candidates are scored exactly. Near-identical copies collide in almost every
+band; --check-recall measures the pairs found against exact search on a
+sample of sims.
+
+Every run saves the similarity graph (all pairs above the threshold, with
+scores) to data/duplicate-graph.npz. A later run with the same settings and a
+threshold at or above the saved one reuses it instead of recomputing all
+pairs. --sweep computes the graph once at the lowest threshold and clusters
+each threshold from it, adding edges in descending similarity to one
+union-find, so choosing a cut costs a single similarity pass.
+
+--incremental updates that graph after a catalog change: only new sims and
+sims whose WHAT vector changed are scored (against every sim), old edges of
+changed or removed sims are dropped, and components are recomputed from the
+edge list (linear in the edges). Clusters whose members and catalog records
+are unchanged are copied from the previous JSON report.
+
+--code adds a source-level stage: every sim directory in the local workspace
+is fingerprinted from its main.html/index.html and *.js files (token
+5-shingles, 128-permutation MinHash, streamed line by line so only the
+fixed-size signatures stay in memory). LSH banding over the signatures finds
+forks whose code is near-identical even when their metadata was rewritten;
+they are reported as code clusters next to the WHAT clusters.
 
 Output:
-    docs/reports/duplicate-microsims.md    (human-readable merge report)
-    docs/reports/duplicate-microsims.json  (full cluster data)
+    docs/reports/duplicate-microsims.md          (human-readable merge report)
+    docs/reports/duplicate-microsims.json        (full cluster data)
+    docs/reports/duplicate-microsims-sweep.md    (--sweep: per-threshold table)
+    docs/reports/duplicate-microsims-sweep.json  (--sweep: table + clusters)
 """
 
 import argparse
+import hashlib
 import json
 import os
+import re
+import sys
 import tempfile
+import zlib
 from pathlib import Path
 from datetime import datetime, timezone
 
 import numpy as np
 
 PROJECT_ROOT = Path(__file__).parent.parent
-EMBEDDINGS_PATH = PROJECT_ROOT / "data" / "microsims-embeddings.json"
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "embeddings"))
+from embedding_store import load_store, dot_scores, QuantizedMatrix, PRECISIONS  # noqa: E402
+from ann_index import load_index, store_fingerprint  # noqa: E402
+from microsim_ids import catalog_rows, canonical_url, sim_key  # noqa: E402
+from json_stream import atomic_output, dump_json  # noqa: E402
+
 CATALOG_PATH = PROJECT_ROOT / "docs" / "search" / "microsims-data.json"
 REPORT_MD = PROJECT_ROOT / "docs" / "reports" / "duplicate-microsims.md"
 REPORT_JSON = PROJECT_ROOT / "docs" / "reports" / "duplicate-microsims.json"
+SWEEP_MD = PROJECT_ROOT / "docs" / "reports" / "duplicate-microsims-sweep.md"
+SWEEP_JSON = PROJECT_ROOT / "docs" / "reports" / "duplicate-microsims-sweep.json"
+GRAPH_PATH = PROJECT_ROOT / "data" / "duplicate-graph.npz"
+WORKSPACE_DIR = Path(os.environ.get("HOME")) / "Documents" / "ws"
 
 # WHAT-similarity tiers for reporting (applied to the cluster's min internal edge)
 TIER_NEAR_IDENTICAL = 0.95   # almost certainly the same MicroSim copied
@@ -67,48 +115,29 @@ def is_placeholder(sim):
 
 
 def atomic_write(path: Path, text: str):
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            f.write(text)
-        os.replace(tmp, path)
-    finally:
-        if os.path.exists(tmp):
-            os.remove(tmp)
-
+    with atomic_output(path) as f:
+        f.write(text)
 
-def get_what_vector(entry):
-    """Extract the WHAT vector (dual-v1) or the flat legacy vector."""
-    if isinstance(entry, dict):
-        return entry["what"]
-    return entry
 
-
-def load_data(include_templates=False):
+def load_data(include_templates=False, precision="float32", use_ann=False):
     """Load embeddings + catalog, keeping only sims with meaningful WHAT text.
 
     Records with no title carry almost no WHAT signal, so their embeddings are
     nearly identical to each other and would form one large spurious
     "near-identical" cluster. Scaffold/template sims are copied into every book
     by design and are not learning objects. Both are excluded and counted.
+
+    With *use_ann* the WHAT ANN index is loaded too, restricted to the kept
+    rows; otherwise the returned index is None.
     """
-    with open(EMBEDDINGS_PATH) as f:
-        emb = json.load(f)
+    store = load_store(precision=precision)
     with open(CATALOG_PATH) as f:
         catalog = json.load(f)
 
+    # Catalog entry per store row, joined on canonical sim IDs
     by_url = {}
-    for sim in catalog:
-        url = sim.get("url") or sim.get("identifier")
-        if url:
-            by_url[url] = sim
-
-    all_urls = list(emb["embeddings"].keys())
-    urls, skipped_untitled, skipped_template = [], 0, 0
-    for u in all_urls:
-        sim = by_url.get(u, {})
+    urls, rows, skipped_untitled, skipped_template = [], [], 0, 0
+    for row, (u, sim) in enumerate(zip(store.urls, catalog_rows(store, catalog))):
         if not (sim.get("title") or "").strip():
             skipped_untitled += 1
             continue
@@ -116,12 +145,19 @@ def load_data(include_templates=False):
             skipped_template += 1
             continue
         urls.append(u)
+        rows.append(row)
+        by_url[u] = sim
 
-    matrix = np.array([get_what_vector(emb["embeddings"][u]) for u in urls], dtype=np.float32)
-    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
-    norms[norms == 0] = 1.0
-    matrix = matrix / norms
-    return urls, matrix, by_url, skipped_untitled, skipped_template
+    # Store rows are already L2-normalized. Quantized matrices stay quantized
+    # (scored via dot_scores); everything else is gathered as float32.
+    if isinstance(store.what, QuantizedMatrix):
+        matrix = QuantizedMatrix(store.what.codes[rows], store.what.scale)
+    elif store.what.dtype == np.float16:
+        matrix = np.asarray(store.what[rows])
+    else:
+        matrix = np.asarray(store.what[rows], dtype=np.float32)
+    index = load_index("what", store).subset(rows) if use_ann else None
+    return urls, matrix, by_url, skipped_untitled, skipped_template, index
 
 
 def quality_score(sim):
@@ -159,9 +195,514 @@ def quality_score(sim):
     return round(score, 3)
 
 
-def cluster(urls, matrix, threshold):
-    """Union-find clustering over the WHAT-similarity graph at *threshold*."""
+EDGE_BLOCK = 512  # query rows per similarity block
+# BLAS thread pools are sized when numpy loads; pin spawned workers to one
+# thread each so N workers do not oversubscribe the cores.
+BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+_worker_matrix = None  # the shared matrix inside a pool worker
+
+# SimHash LSH (--method lsh)
+LSH_TARGET_RECALL = 0.98   # expected recall at the threshold when bands are auto
+LSH_MAX_BITS = 24
+LSH_MAX_BANDS = 64
+VERIFY_CHUNK = 65536       # candidate pairs scored per step
+RECALL_SAMPLE = 1000       # sims checked against exact search by --check-recall
+
+# Code-level MinHash (--code)
+CODE_FILES = ("main.html", "index.html")  # plus every *.js in the sim directory
+CODE_TOKEN_RE = re.compile(r"[A-Za-z_$][\w$]*|\d+(?:\.\d+)?|\S")
+SHINGLE_TOKENS = 5
+MINHASH_PERMUTATIONS = 128
+MINHASH_PRIME = 4294967291  # largest prime below 2**32
+MINHASH_FLUSH = 8192        # shingles hashed per signature update
+DEFAULT_CODE_THRESHOLD = 0.80
+
+
+def block_edges(matrix, start, end, threshold):
+    """Edges (i<j) whose smaller end i is a row in [start, end)."""
+    sims = dot_scores(matrix, matrix[start:end]).T  # (block, n)
+    # Row bi is sim start+bi: keep only columns j > start+bi
+    bi, j = np.nonzero(np.triu(sims >= threshold, k=start + 1))
+    return bi + start, j, sims[bi, j]
+
+
+def _init_edge_worker(codes_path, scale):
+    """Pool initializer: memory-map the shared matrix once per worker."""
+    global _worker_matrix
+    codes = np.load(codes_path, mmap_mode="r")
+    _worker_matrix = QuantizedMatrix(codes, scale) if scale is not None else codes
+
+
+def _edge_worker(task):
+    start, end, threshold = task
+    return block_edges(_worker_matrix, start, end, threshold)
+
+
+def parallel_edges(matrix, threshold, workers):
+    """exact_edges() with row blocks spread over *workers* processes.
+
+    The matrix is written once to a temporary .npy that every worker
+    memory-maps, so the OS page cache holds one shared copy and nothing
+    large is pickled; only each block's edge arrays come back. Blocks are
+    merged in order, so the result equals the serial one.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    n = matrix.shape[0]
+    tasks = [(start, min(start + EDGE_BLOCK, n), threshold) for start in range(0, n, EDGE_BLOCK)]
+    quantized = isinstance(matrix, QuantizedMatrix)
+    saved_env = {k: os.environ.get(k) for k in BLAS_THREAD_VARS}
+    with tempfile.TemporaryDirectory(prefix="duplicate-edges-") as tmp:
+        codes_path = os.path.join(tmp, "matrix.npy")
+        np.save(codes_path, matrix.codes if quantized else matrix)
+        try:
+            os.environ.update({k: "1" for k in BLAS_THREAD_VARS})
+            # spawn (not fork) so each worker loads numpy under the pinned env
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_edge_worker,
+                                     initargs=(codes_path, matrix.scale if quantized else None)) as pool:
+                parts = list(pool.map(_edge_worker, tasks))
+        finally:
+            for k, v in saved_env.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+    return _edge_arrays(*zip(*parts)) if parts else _edge_arrays([], [], [])
+
+
+def exact_edges(matrix, threshold, workers=1):
+    """All pairs (i<j) with WHAT similarity >= *threshold*, by blocked matmul.
+
+    Returns parallel arrays (src, dst, sim) with src < dst. With *workers* > 1
+    the blocks run in a process pool (parallel_edges).
+    """
+    n = matrix.shape[0]
+    if workers > 1 and n > EDGE_BLOCK:
+        return parallel_edges(matrix, threshold, workers)
+    # Block the matmul to keep memory bounded for large catalogs.
+    src, dst, sim = [], [], []
+    for start in range(0, n, EDGE_BLOCK):
+        bs, bd, bv = block_edges(matrix, start, min(start + EDGE_BLOCK, n), threshold)
+        src.append(bs)
+        dst.append(bd)
+        sim.append(bv)
+    return _edge_arrays(src, dst, sim)
+
+
+def ann_edges(index, matrix, threshold, nprobe=None):
+    """Approximate exact_edges(): range search over the IVF index.
+
+    A pair is found when either sim's probed lists contain the other, so
+    only pairs that straddle list boundaries far from both sims are missed.
+    Pairs found from both ends are kept once.
+    """
+    qs, rs, ss = index.range_search(matrix, np.arange(matrix.shape[0]), threshold, nprobe)
+    lo, hi = np.minimum(qs, rs), np.maximum(qs, rs)
+    keep = lo < hi
+    lo, hi, ss = lo[keep], hi[keep], ss[keep]
+    _, first = np.unique(lo * matrix.shape[0] + hi, return_index=True)
+    return _edge_arrays([lo[first]], [hi[first]], [ss[first]])
+
+
+def lsh_params(n, threshold, bits=None, bands=None, target=LSH_TARGET_RECALL):
+    """
+    (bits per band, bands, expected recall at *threshold*) for SimHash banding.
+
+    Two vectors at angle theta agree on one random-hyperplane bit with
+    probability 1 - theta/pi, so a pair at the threshold shares one band with
+    p = (1 - theta/pi)**bits and at least one of B bands with 1 - (1-p)**B.
+    By default bits ~ log2(N) keeps unrelated buckets small, and B is the
+    fewest bands whose expected recall at the threshold reaches *target*
+    (pairs above the threshold collide more often).
+    """
+    bits = bits or int(np.clip(np.ceil(np.log2(max(n, 2))), 8, LSH_MAX_BITS))
+    p = (1 - np.arccos(np.clip(threshold, -1.0, 1.0)) / np.pi) ** bits
+    if not bands:
+        bands = int(np.ceil(np.log1p(-target) / np.log1p(-p))) if p < 1 else 1
+        bands = int(np.clip(bands, 1, LSH_MAX_BANDS))
+    return bits, bands, float(1 - (1 - p) ** bands)
+
+
+def simhash_bands(matrix, bits, bands, seed=42):
+    """Band keys, shape (bands, N): each packs *bits* hyperplane sign bits."""
+    n, dim = matrix.shape
+    planes = np.random.default_rng(seed).standard_normal((dim, bits * bands)).astype(np.float32)
+    weights = np.left_shift(np.int64(1), np.arange(bits, dtype=np.int64))
+    keys = np.empty((bands, n), dtype=np.int64)
+    for start in range(0, n, EDGE_BLOCK):
+        end = min(start + EDGE_BLOCK, n)
+        signs = (np.asarray(matrix[start:end], dtype=np.float32) @ planes) > 0
+        keys[:, start:end] = (signs.reshape(end - start, bands, bits) @ weights).T
+    return keys
+
+
+def bucket_pairs(keys):
+    """All pairs (i, j) of positions sharing a key, i.e. in the same bucket.
+
+    Positions are sorted by key; step d pairs each position with the one d
+    places later, keeping only positions whose bucket still has a member that
+    far ahead. Work is proportional to the pairs produced.
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+    # Members left in the bucket after each position
+    ahead = np.repeat(starts + sizes, sizes) - np.arange(len(keys)) - 1
+    active = np.flatnonzero(ahead > 0)
+    out_i, out_j = [], []
+    d = 1
+    while len(active):
+        out_i.append(order[active])
+        out_j.append(order[active + d])
+        d += 1
+        active = active[ahead[active] >= d]
+    if not out_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(out_i), np.concatenate(out_j)
+
+
+def pair_scores(matrix, src, dst):
+    """Exact cosine similarity of each (src, dst) row pair, in chunks."""
+    out = np.empty(len(src), dtype=np.float32)
+    for start in range(0, len(src), VERIFY_CHUNK):
+        end = min(start + VERIFY_CHUNK, len(src))
+        a = np.asarray(matrix[src[start:end]], dtype=np.float32)
+        b = np.asarray(matrix[dst[start:end]], dtype=np.float32)
+        out[start:end] = np.einsum("ij,ij->i", a, b)
+    return out
+
+
+def lsh_edges(matrix, threshold, bits=None, bands=None, seed=42):
+    """Approximate exact_edges(): SimHash banding, then exact verification.
+
+    Candidate pairs are those sharing a bucket in any band; only they are
+    scored, so the cost grows with the candidates rather than N^2. Pairs
+    the banding misses are lost (see lsh_params for the expected recall).
+    """
+    n = matrix.shape[0]
+    bits, bands, expected = lsh_params(n, threshold, bits, bands)
+    keys = simhash_bands(matrix, bits, bands, seed)
+    codes = []
+    for band in keys:
+        i, j = bucket_pairs(band)
+        codes.append(np.unique(np.minimum(i, j) * n + np.maximum(i, j)))
+    codes = np.unique(np.concatenate(codes)) if codes else np.empty(0, dtype=np.int64)
+    src, dst = codes // n, codes % n
+    sims = pair_scores(matrix, src, dst)
+    keep = sims >= threshold
+    total_pairs = n * (n - 1) // 2
+    print(f"LSH: {bits} bits x {bands} bands, {len(codes):,} candidate pairs "
+          f"({len(codes) / max(total_pairs, 1):.2%} of all pairs), "
+          f"expected recall {expected:.3f} at {threshold}")
+    return _edge_arrays([src[keep]], [dst[keep]], [sims[keep]])
+
+
+def edge_recall(matrix, edges, threshold, sample, seed=42):
+    """
+    Recall of approximate *edges* against exact search for *sample* sims.
+
+    Every exact pair (i, j) >= threshold with i in the sample is looked up
+    in *edges*; reported overall and for near-identical pairs.
+    """
+    n = matrix.shape[0]
+    rows = np.sort(np.random.default_rng(seed).choice(n, size=min(sample, n), replace=False))
+    found = np.unique(edges[0] * n + edges[1])
+    exact_codes, exact_sims = [], []
+    for start in range(0, len(rows), EDGE_BLOCK):
+        block = rows[start:start + EDGE_BLOCK]
+        sims = dot_scores(matrix, matrix[block]).T  # (block, n)
+        sims[np.arange(len(block)), block] = -np.inf
+        bi, j = np.nonzero(sims >= threshold)
+        i = block[bi]
+        exact_codes.append(np.minimum(i, j) * n + np.maximum(i, j))
+        exact_sims.append(sims[bi, j])
+    codes = np.concatenate(exact_codes)
+    sims = np.concatenate(exact_sims)
+    codes, first = np.unique(codes, return_index=True)
+    sims = sims[first]
+    hit = np.isin(codes, found)
+    near = sims >= TIER_NEAR_IDENTICAL
+    return {
+        "sample": len(rows),
+        "exact_pairs": int(len(codes)),
+        "found_pairs": int(hit.sum()),
+        "recall": round(float(hit.mean()), 4) if len(codes) else None,
+        "near_identical_pairs": int(near.sum()),
+        "near_identical_recall": round(float(hit[near].mean()), 4) if near.any() else None,
+    }
+
+
+def _edge_arrays(src, dst, sim):
+    """Concatenate per-block edge pieces into (src, dst, sim) arrays."""
+    if not src:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return (np.concatenate(src).astype(np.int64), np.concatenate(dst).astype(np.int64),
+            np.concatenate(sim).astype(np.float32))
+
+
+def connected_components(n, src, dst):
+    """Component label (its smallest member) for each of *n* nodes.
+
+    Min-label propagation over the edge arrays: every edge pulls both
+    endpoints down to the smaller of their labels, then pointer jumping
+    (labels = labels[labels]) shortcuts chains. Converges in a few passes
+    for the shallow, dense components that duplicate clusters form.
+    """
+    labels = np.arange(n, dtype=np.int64)
+    if len(src) == 0:
+        return labels
+    while True:
+        low = np.minimum(labels[src], labels[dst])
+        new = labels.copy()
+        np.minimum.at(new, src, low)
+        np.minimum.at(new, dst, low)
+        # Labels only ever point at smaller nodes, so jumping terminates
+        while True:
+            jumped = new[new]
+            if np.array_equal(jumped, new):
+                break
+            new = jumped
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+def graph_settings(urls, digests, precision, method, index, nprobe, lsh, include_templates):
+    """What a saved similarity graph depends on besides its threshold.
+
+    The fingerprint covers the sims' URLs and their vectors (*digests*), so
+    re-embedded text invalidates the graph even when the URLs are unchanged.
+    """
+    vectors = hashlib.sha1(np.ascontiguousarray(digests[0]).tobytes()).hexdigest()[:16]
+    return {
+        "fingerprint": f"{store_fingerprint(urls)}:{vectors}",
+        "precision": precision,
+        "method": method,
+        "nprobe": (nprobe or index.nprobe) if method == "ann" else None,
+        "lsh": lsh if method == "lsh" else None,
+        "include_templates": include_templates,
+    }
+
+
+def vector_digests(matrix):
+    """64-bit digest of every row's float32 bytes, to spot changed vectors."""
+    out = np.empty(matrix.shape[0], dtype=np.uint64)
+    for start in range(0, matrix.shape[0], EDGE_BLOCK):
+        rows = np.ascontiguousarray(np.asarray(matrix[start:start + EDGE_BLOCK], dtype=np.float32))
+        out[start:start + len(rows)] = [
+            int.from_bytes(hashlib.blake2b(r.tobytes(), digest_size=8).digest(), "little")
+            for r in rows]
+    return out
+
+
+def record_digests(urls, by_url):
+    """64-bit digest of every sim's catalog record (what the report shows)."""
+    return np.array([
+        int.from_bytes(hashlib.blake2b(json.dumps(by_url.get(u, {}), sort_keys=True).encode("utf-8"),
+                                       digest_size=8).digest(), "little")
+        for u in urls], dtype=np.uint64)
+
+
+def save_graph(path, edges, threshold, settings, urls, digests):
+    """Write the edge arrays atomically as a .npz with their settings.
+
+    The sims' URLs and (vector, record) digests are saved too, so an
+    --incremental run can tell which sims changed.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            src, dst, sim = edges
+            np.savez(f, src=src, dst=dst, sim=sim, urls=np.array(urls, dtype=str),
+                     vector_digests=digests[0], record_digests=digests[1],
+                     meta=np.array(json.dumps(
+                         dict(settings, threshold=threshold,
+                              generated_at=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")))))
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_graph(path, threshold, settings, ignore=()):
+    """The saved graph as a dict of its arrays, edges filtered to >= *threshold*.
+
+    A graph is usable only when it was built with the same *settings* (keys
+    in *ignore* aside) and at a threshold no higher than the one requested;
+    otherwise, or if it is missing or unreadable, this returns None.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if (any(meta.get(k) != v for k, v in settings.items() if k not in ignore)
+                    or meta["threshold"] > threshold):
+                return None
+            keep = data["sim"] >= threshold
+            graph = {k: data[k] for k in ("urls", "vector_digests", "record_digests")}
+            graph["edges"] = (data["src"][keep], data["dst"][keep], data["sim"][keep])
+            return graph
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def update_graph(prev, urls, matrix, threshold, digests):
+    """
+    Bring a saved exact graph up to date with the current sims.
+
+    Sims whose URL is new or whose vector digest changed are "dirty": their
+    old edges are dropped and they are scored against every sim, so the cost
+    is (dirty x N) instead of N^2. Edges between unchanged sims are kept and
+    renumbered; edges to removed sims disappear. Returns the edges (ordered
+    as exact_edges() orders them) and the set of URLs whose edges or catalog
+    record changed.
+    """
     n = len(urls)
+    old_row = {u: i for i, u in enumerate(prev["urls"].tolist())}
+    new_of_old = np.full(len(old_row), -1, dtype=np.int64)
+    dirty, changed = [], set()
+    for i, u in enumerate(urls):
+        j = old_row.get(u)
+        if j is not None and prev["vector_digests"][j] == digests[0][i]:
+            new_of_old[j] = i
+            if prev["record_digests"][j] != digests[1][i]:
+                changed.add(u)
+        else:
+            dirty.append(i)
+    removed = int(np.sum(new_of_old < 0)) - sum(1 for i in dirty if urls[i] in old_row)
+
+    src, dst, sim = prev["edges"]
+    a, b = new_of_old[src], new_of_old[dst]
+    keep = (a >= 0) & (b >= 0)
+    kept_lo, kept_hi = np.minimum(a[keep], b[keep]), np.maximum(a[keep], b[keep])
+    codes, sims = [kept_lo * n + kept_hi], [sim[keep]]
+
+    dirty = np.array(dirty, dtype=np.int64)
+    for start in range(0, len(dirty), EDGE_BLOCK):
+        block = dirty[start:start + EDGE_BLOCK]
+        block_sims = dot_scores(matrix, matrix[block]).T  # (block, n)
+        block_sims[np.arange(len(block)), block] = -np.inf
+        bi, j = np.nonzero(block_sims >= threshold)
+        i = block[bi]
+        codes.append(np.minimum(i, j) * n + np.maximum(i, j))
+        sims.append(block_sims[bi, j])
+        changed.update(urls[k] for k in np.unique(np.r_[block, j]).tolist())
+
+    # Pairs of two dirty sims are found from both ends; keep one
+    codes, first = np.unique(np.concatenate(codes), return_index=True)
+    sims = np.concatenate(sims)[first]
+    print(f"Incremental: {len(dirty)} new/changed sims, {removed} removed; "
+          f"scored {len(dirty)} x {n} pairs, kept {int(keep.sum())} edges")
+    return _edge_arrays([codes // n], [codes % n], [sims]), changed
+
+
+def similarity_graph(urls, matrix, threshold, digests, method="exact", index=None, nprobe=None,
+                     lsh=None, include_templates=False, precision="float32",
+                     rebuild=False, workers=1, incremental=False):
+    """Edges (src, dst, sim) at *threshold*, from the saved graph when possible.
+
+    *method* is "exact" (all pairs), "ann" (range search over *index*) or
+    "lsh" (SimHash candidates; *lsh* holds bits/bands/seed, None = auto).
+    With *incremental* an exact graph saved for an earlier catalog is
+    updated (update_graph) instead of recomputed. A freshly computed graph
+    replaces the saved one.
+
+    Returns (edges, changed): *changed* is the set of URLs whose clusters
+    may differ from the previous run's, or None if that is unknown (every
+    cluster must be rebuilt).
+    """
+    lsh = lsh or {}
+    settings = graph_settings(urls, digests, precision, method, index, nprobe, lsh, include_templates)
+    prev = None if rebuild else load_graph(GRAPH_PATH, threshold, settings)
+    if prev is not None:
+        edges = prev["edges"]
+        print(f"Reusing similarity graph {GRAPH_PATH} ({len(edges[0])} edges >= {threshold})")
+        changed = {u for u, old, new in zip(urls, prev["record_digests"], digests[1]) if old != new}
+        return edges, changed
+
+    if incremental and not rebuild:
+        if method != "exact":
+            print(f"Note: --incremental applies to --method exact; computing the {method} graph in full")
+        else:
+            prev = load_graph(GRAPH_PATH, threshold, settings, ignore=("fingerprint",))
+            if prev is None:
+                print("No compatible saved graph; computing it in full")
+            else:
+                edges, changed = update_graph(prev, urls, matrix, threshold, digests)
+                save_graph(GRAPH_PATH, edges, threshold, settings, urls, digests)
+                return edges, changed
+
+    print(f"Computing similarity graph at {threshold} ({method})...")
+    if method == "ann":
+        edges = ann_edges(index, matrix, threshold, nprobe)
+    elif method == "lsh":
+        edges = lsh_edges(matrix, threshold, lsh.get("bits"), lsh.get("bands"), lsh.get("seed", 42))
+    else:
+        edges = exact_edges(matrix, threshold, workers)
+    save_graph(GRAPH_PATH, edges, threshold, settings, urls, digests)
+    return edges, None
+
+
+def components(labels, edges, threshold):
+    """
+    Clusters of size >= 2 from component *labels* (each the component's
+    smallest member), as member index lists (ascending, ordered by smallest
+    member), plus the (min, avg) similarity over each cluster's *edges*.
+    """
+    n = len(labels)
+    src, _, sim = edges
+    sizes = np.bincount(labels, minlength=n)
+    members = np.flatnonzero(sizes[labels] >= 2)
+    members = members[np.argsort(labels[members], kind="stable")]
+    groups = np.split(members, np.flatnonzero(np.diff(labels[members])) + 1) if len(members) else []
+
+    # Per-component edge stats; both endpoints of an edge share a label
+    edge_labels = labels[src]
+    edge_count = np.bincount(edge_labels, minlength=n)
+    edge_sum = np.bincount(edge_labels, weights=sim.astype(np.float64), minlength=n)
+    edge_min = np.full(n, np.inf)
+    np.minimum.at(edge_min, edge_labels, sim.astype(np.float64))
+
+    clusters, stats = [], []
+    for g in groups:
+        root = labels[g[0]]
+        clusters.append(g.tolist())
+        if edge_count[root]:
+            stats.append((float(edge_min[root]), float(edge_sum[root] / edge_count[root])))
+        else:
+            stats.append((threshold, threshold))
+    return clusters, stats
+
+
+def cluster(n, edges, threshold):
+    """Connected components of the WHAT-similarity graph given by *edges*."""
+    src, dst, _ = edges
+    return components(connected_components(n, src, dst), edges, threshold)
+
+
+def sweep_labels(n, edges, thresholds):
+    """
+    Yield (threshold, labels, edges at that threshold) for *thresholds*,
+    highest first.
+
+    One union-find absorbs the edges in descending similarity, so each
+    threshold only adds the edges between it and the previous one. Roots
+    are always the smaller index, so labels are each component's smallest
+    member, as connected_components() returns.
+    """
+    src, dst, sim = edges
+    order = np.argsort(-sim, kind="stable")
+    src, dst, sim = src[order], dst[order], sim[order]
     parent = list(range(n))
 
     def find(a):
@@ -170,52 +711,39 @@ def cluster(urls, matrix, threshold):
             a = parent[a]
         return a
 
-    def union(a, b):
-        ra, rb = find(a), find(b)
-        if ra != rb:
-            parent[rb] = ra
+    added = 0
+    for t in sorted(thresholds, reverse=True):
+        # Compare in float32, as the similarity pass did
+        upto = int(np.searchsorted(-sim, -np.float32(t), side="right"))
+        for a, b in zip(src[added:upto].tolist(), dst[added:upto].tolist()):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+        added = upto
+        labels = np.array([find(i) for i in range(n)], dtype=np.int64)
+        yield t, labels, (src[:upto], dst[:upto], sim[:upto])
 
-    # Block the matmul to keep memory bounded for large catalogs.
-    block = 512
-    edges = {}  # (i,j) -> sim, only for i<j above threshold
-    for start in range(0, n, block):
-        end = min(start + block, n)
-        sims = matrix[start:end] @ matrix.T  # (block, n)
-        for bi in range(end - start):
-            i = start + bi
-            row = sims[bi]
-            js = np.where(row >= threshold)[0]
-            for j in js:
-                if j <= i:
-                    continue
-                union(i, j)
-                edges[(i, int(j))] = float(row[j])
-
-    groups = {}
-    for i in range(n):
-        groups.setdefault(find(i), []).append(i)
-    return [g for g in groups.values() if len(g) >= 2], edges
-
-
-def build_report(threshold, cross_repo_only, include_templates=False):
-    urls, matrix, by_url, skipped_untitled, skipped_template = load_data(include_templates)
-    clusters, edges = cluster(urls, matrix, threshold)
 
+def cluster_records(clusters, stats, urls, by_url, cross_repo_only, reuse=None, changed=frozenset()):
+    """Report records (keeper, merge list, tier) for each cluster.
+
+    A cluster whose member URLs match a key of *reuse* and include none of
+    *changed* takes that previous record instead of being rebuilt.
+    """
     records = []
-    for members in clusters:
+    rebuilt = reused = 0
+    for members, (min_sim, avg_sim) in zip(clusters, stats):
         murls = [urls[i] for i in members]
+        key = frozenset(murls)
+        if reuse and key in reuse and not key & changed:
+            records.append(reuse[key])
+            reused += 1
+            continue
         repos = {by_url.get(u, {}).get("_source", {}).get("repo", "?") for u in murls}
         cross_repo = len(repos) > 1
         if cross_repo_only and not cross_repo:
             continue
 
-        # Internal edge stats for tiering
-        internal = [edges[(min(a, b), max(a, b))]
-                    for idx, a in enumerate(members) for b in members[idx + 1:]
-                    if (min(a, b), max(a, b)) in edges]
-        min_sim = min(internal) if internal else threshold
-        avg_sim = sum(internal) / len(internal) if internal else threshold
-
         entries = []
         for u in murls:
             sim = by_url.get(u, {})
@@ -242,6 +770,7 @@ def build_report(threshold, cross_repo_only, include_templates=False):
         else:
             tier = "moderate"
 
+        rebuilt += 1
         records.append({
             "size": len(entries),
             "cross_repo": cross_repo,
@@ -254,9 +783,343 @@ def build_report(threshold, cross_repo_only, include_templates=False):
             "members": entries,
         })
 
+    if reuse is not None:
+        print(f"Clusters rebuilt: {rebuilt}, reused from the previous report: {reused}")
+
     # Sort: cross-repo first, then larger, then tighter
     records.sort(key=lambda r: (r["cross_repo"], r["size"], r["avg_similarity"]), reverse=True)
-    return records, len(urls), skipped_untitled, skipped_template
+    return records
+
+
+def prepare_graph(threshold, include_templates=False, precision="float32", method="exact",
+                  nprobe=None, lsh=None, rebuild_graph=False, workers=1, check_recall=0,
+                  incremental=False):
+    """Load the data and its similarity graph at *threshold*.
+
+    Returns (urls, by_url, skipped untitled, skipped templates, edges,
+    changed URLs or None, recall check or None). With *check_recall* > 0 an
+    approximate graph is checked against exact search for that many
+    sampled sims.
+    """
+    urls, matrix, by_url, skipped_untitled, skipped_template, index = load_data(
+        include_templates, precision, method == "ann")
+    digests = (vector_digests(matrix), record_digests(urls, by_url))
+    edges, changed = similarity_graph(urls, matrix, threshold, digests, method, index, nprobe, lsh,
+                                      include_templates, precision, rebuild_graph, workers,
+                                      incremental)
+    recall = None
+    if check_recall and method != "exact":
+        recall = edge_recall(matrix, edges, threshold, check_recall)
+        print(f"Recall vs exact ({recall['sample']} sampled sims): "
+              f"{recall['found_pairs']}/{recall['exact_pairs']} pairs = {recall['recall']}; "
+              f"near-identical {recall['near_identical_recall']}")
+    return urls, by_url, skipped_untitled, skipped_template, edges, changed, recall
+
+
+def previous_records(threshold, method, cross_repo_only):
+    """{member URL set: record} from the last report, if it used these settings."""
+    try:
+        with open(REPORT_JSON) as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (report.get("threshold"), report.get("method"), report.get("cross_repo_only")) != \
+            (threshold, method, cross_repo_only):
+        return {}
+    return {frozenset(m["url"] for m in r["members"]): r for r in report.get("clusters", [])}
+
+
+def build_report(threshold, cross_repo_only, **graph_opts):
+    urls, by_url, skipped_untitled, skipped_template, edges, changed, recall = prepare_graph(
+        threshold, **graph_opts)
+    clusters, stats = cluster(len(urls), edges, threshold)
+    if graph_opts.get("incremental") and changed is not None:
+        # Clusters with the same members, none of them changed, are kept as-is
+        reuse = previous_records(threshold, graph_opts.get("method", "exact"), cross_repo_only)
+        records = cluster_records(clusters, stats, urls, by_url, cross_repo_only, reuse, changed)
+    else:
+        records = cluster_records(clusters, stats, urls, by_url, cross_repo_only)
+    return records, len(urls), skipped_untitled, skipped_template, recall
+
+
+def build_sweep(thresholds, cross_repo_only, **graph_opts):
+    """Cluster records for every threshold from one graph at the lowest one.
+
+    Returns ({threshold: records}, catalog size, skipped untitled, skipped
+    templates, recall check), thresholds ascending.
+    """
+    urls, by_url, skipped_untitled, skipped_template, edges, _, recall = prepare_graph(
+        min(thresholds), **graph_opts)
+    by_threshold = {}
+    for t, labels, t_edges in sweep_labels(len(urls), edges, thresholds):
+        clusters, stats = components(labels, t_edges, t)
+        by_threshold[t] = cluster_records(clusters, stats, urls, by_url, cross_repo_only)
+    return dict(sorted(by_threshold.items())), len(urls), skipped_untitled, skipped_template, recall
+
+
+def sweep_row(threshold, records):
+    """Summary counts for one threshold of a sweep."""
+    tiers = [r["tier"] for r in records]
+    return {
+        "threshold": threshold,
+        "clusters": len(records),
+        "sims_in_clusters": sum(r["size"] for r in records),
+        "mergeable": sum(r["size"] - 1 for r in records),
+        "cross_repo_clusters": sum(1 for r in records if r["cross_repo"]),
+        "largest_cluster": max((r["size"] for r in records), default=0),
+        "near_identical": tiers.count("near-identical"),
+        "strong": tiers.count("strong"),
+        "moderate": tiers.count("moderate"),
+    }
+
+
+def parse_sweep(spec):
+    """Thresholds from 'LOW:HIGH[:STEP]' (step default 0.01) or 'A,B,C'."""
+    try:
+        if "," in spec:
+            values = [float(v) for v in spec.split(",")]
+        else:
+            parts = [float(v) for v in spec.split(":")]
+            if len(parts) not in (2, 3):
+                raise ValueError
+            low, high = parts[0], parts[1]
+            step = parts[2] if len(parts) == 3 else 0.01
+            if step <= 0 or high < low:
+                raise ValueError
+            values = [round(low + i * step, 4) for i in range(int(round((high - low) / step)) + 1)]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid sweep {spec!r}: use LOW:HIGH[:STEP] or a comma-separated list")
+    return sorted(set(values))
+
+
+class MinHasher:
+    """
+    MinHash signatures of token shingles, computed while streaming files.
+
+    Each permutation is h(x) = (a*x + b) mod MINHASH_PRIME over 32-bit
+    shingle hashes; the signature keeps each permutation's minimum, so two
+    signatures agree in a position with probability equal to the Jaccard
+    similarity of the shingle sets.
+    """
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, shingle=SHINGLE_TOKENS, seed=42):
+        rng = np.random.default_rng(seed)
+        # a, x < 2**32 keeps a*x + b inside uint64
+        self.a = rng.integers(1, 2**32, size=permutations, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 2**32, size=permutations, dtype=np.uint64)[:, None]
+        self.shingle = shingle
+        self.weights = np.array([pow(1099511628211, shingle - 1 - k, 2**64) for k in range(shingle)],
+                                dtype=np.uint64)
+
+    def _update(self, signature, tokens):
+        """Fold the shingles of *tokens* (token hashes) into *signature*."""
+        h = np.array(tokens, dtype=np.uint64)
+        count = len(h) - self.shingle + 1
+        shingles = np.zeros(count, dtype=np.uint64)
+        for k, w in enumerate(self.weights):
+            shingles += h[k:k + count] * w  # wraps mod 2**64
+        x = (shingles ^ (shingles >> np.uint64(32))) & np.uint64(0xFFFFFFFF)
+        values = (self.a * x + self.b) % np.uint64(MINHASH_PRIME)
+        np.minimum(signature, values.min(axis=1), out=signature)
+        return count
+
+    def signature(self, paths):
+        """
+        (signature, sha1 of the raw bytes, shingle count) over *paths*.
+
+        Files are read line by line; token hashes are buffered only until
+        MINHASH_FLUSH shingles are ready. Shingles do not span files. A file
+        shorter than one shingle counts as a single padded shingle.
+        """
+        signature = np.full(len(self.a), MINHASH_PRIME, dtype=np.uint64)
+        digest = hashlib.sha1()
+        count = 0
+        keep = self.shingle - 1
+        for path in paths:
+            tokens, flushed = [], False
+            try:
+                with open(path, "rb") as f:
+                    for line in f:
+                        digest.update(line)
+                        tokens.extend(zlib.crc32(t.encode("utf-8"))
+                                      for t in CODE_TOKEN_RE.findall(line.decode("utf-8", "ignore")))
+                        if len(tokens) >= MINHASH_FLUSH + keep:
+                            count += self._update(signature, tokens)
+                            tokens, flushed = tokens[-keep:] if keep else [], True
+            except OSError:
+                continue
+            if not flushed and 0 < len(tokens) < self.shingle:
+                tokens += [0] * (self.shingle - len(tokens))
+            if len(tokens) > keep:
+                count += self._update(signature, tokens)
+        return signature.astype(np.uint32), digest.hexdigest(), count
+
+
+def sim_code_files(sim_dir):
+    """The code files of one sim directory, in a stable order."""
+    files = [sim_dir / name for name in CODE_FILES if (sim_dir / name).is_file()]
+    return files + sorted(sim_dir.glob("*.js"))
+
+
+def code_signatures(workspace, hasher, skip=None):
+    """
+    MinHash every sim with code under *workspace*/<repo>/docs/sims/<sim>/,
+    except those for which *skip*(repo, sim) is true.
+
+    Returns ([(repo, sim)], signatures (N, permutations) uint32, [sha1]).
+    Only the fixed-size signature of each sim is kept.
+    """
+    keys, signatures, digests = [], [], []
+    workspace = Path(workspace)
+    if not workspace.is_dir():
+        print(f"Warning: workspace not found: {workspace}; skipping code fingerprints")
+        return keys, np.empty((0, len(hasher.a)), dtype=np.uint32), digests
+    for repo_dir in sorted(p for p in workspace.iterdir() if p.is_dir() and not p.name.startswith(".")):
+        sims_dir = repo_dir / "docs" / "sims"
+        if not sims_dir.is_dir():
+            continue
+        for sim_dir in sorted(p for p in sims_dir.iterdir() if p.is_dir()):
+            if skip and skip(repo_dir.name, sim_dir.name):
+                continue
+            files = sim_code_files(sim_dir)
+            if not files:
+                continue
+            signature, digest, count = hasher.signature(files)
+            if count:
+                keys.append((repo_dir.name, sim_dir.name))
+                signatures.append(signature)
+                digests.append(digest)
+    matrix = np.array(signatures, dtype=np.uint32).reshape(len(signatures), len(hasher.a))
+    return keys, matrix, digests
+
+
+def minhash_bands(threshold, permutations=MINHASH_PERMUTATIONS, target=LSH_TARGET_RECALL):
+    """(bands, rows) with the widest bands that still catch a pair at
+    Jaccard *threshold* with probability >= *target*."""
+    for rows in range(permutations, 0, -1):
+        if permutations % rows:
+            continue
+        bands = permutations // rows
+        if 1 - (1 - threshold ** rows) ** bands >= target:
+            return bands, rows
+    return permutations, 1
+
+
+def code_edges(signatures, threshold):
+    """Pairs whose estimated Jaccard similarity is >= *threshold*.
+
+    Candidates share all of a band's MinHash values; each is then scored by
+    the fraction of matching signature positions.
+    """
+    n, permutations = signatures.shape
+    bands, rows = minhash_bands(threshold, permutations)
+    mix = np.array([pow(1000003, rows - 1 - k, 2**64) for k in range(rows)], dtype=np.uint64)
+    codes = [np.empty(0, dtype=np.int64)]
+    for band in range(bands):
+        part = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (part * mix).sum(axis=1).view(np.int64)
+        i, j = bucket_pairs(keys)
+        codes.append(np.unique(np.minimum(i, j) * n + np.maximum(i, j)))
+    codes = np.unique(np.concatenate(codes))
+    src, dst = codes // n, codes % n
+    est = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), VERIFY_CHUNK):
+        end = min(start + VERIFY_CHUNK, len(codes))
+        est[start:end] = (signatures[src[start:end]] == signatures[dst[start:end]]).mean(axis=1)
+    keep = est >= threshold
+    print(f"MinHash LSH: {bands} bands x {rows} rows, {len(codes):,} candidate pairs, "
+          f"{int(keep.sum()):,} at estimated Jaccard >= {threshold}")
+    return _edge_arrays([src[keep]], [dst[keep]], [est[keep]])
+
+
+def code_report(workspace, threshold, what_records, cross_repo_only, include_templates=False):
+    """Code-level duplicate clusters under *workspace*, linked to the catalog.
+
+    Each cluster notes whether its members also form (part of) one WHAT
+    cluster; those that do not are copies the metadata hid. Scaffold/template
+    sims are left out unless *include_templates*, as in the WHAT pass.
+    """
+    with open(CATALOG_PATH) as f:
+        catalog = json.load(f)
+    by_key = {}
+    for sim in catalog:
+        by_key.setdefault(sim_key(sim), sim)
+
+    skipped = []
+
+    def placeholder(repo, name):
+        location = {"_source": {"repo": repo, "sim": name}}
+        if is_placeholder(by_key.get(sim_key(location)) or location):
+            skipped.append((repo, name))
+            return True
+        return False
+
+    print(f"Fingerprinting sim source files in {workspace}...")
+    keys, signatures, digests = code_signatures(workspace, MinHasher(),
+                                                skip=None if include_templates else placeholder)
+    print(f"Signatures: {len(keys)} sims with code"
+          + (f" ({len(skipped)} scaffold/template sims excluded)" if skipped else ""))
+    if len(keys) < 2:
+        return []
+    edges = code_edges(signatures, threshold)
+    clusters, stats = cluster(len(keys), edges, threshold)
+
+    what_cluster = {m["url"]: n for n, r in enumerate(what_records) for m in r["members"]}
+
+    records = []
+    for members, (min_j, avg_j) in zip(clusters, stats):
+        entries = []
+        for i in members:
+            repo, name = keys[i]
+            location = {"_source": {"repo": repo, "sim": name}}
+            sim = by_key.get(sim_key(location), {})
+            entries.append({
+                "repo": repo,
+                "sim": name,
+                "url": canonical_url(sim or location),
+                "title": sim.get("title") or name,
+            })
+        repos = sorted({e["repo"] for e in entries})
+        if cross_repo_only and len(repos) < 2:
+            continue
+        in_what = {what_cluster.get(e["url"]) for e in entries}
+        records.append({
+            "size": len(entries),
+            "identical": len({digests[i] for i in members}) == 1,
+            "cross_repo": len(repos) > 1,
+            "repos": repos,
+            "min_jaccard": round(min_j, 4),
+            "avg_jaccard": round(avg_j, 4),
+            "in_what_cluster": len(in_what) == 1 and None not in in_what,
+            "members": entries,
+        })
+    # Copies the WHAT pass missed first, then larger, then tighter
+    records.sort(key=lambda r: (not r["in_what_cluster"], r["size"], r["avg_jaccard"]), reverse=True)
+    return records
+
+
+def render_code_md(code_records, code_threshold):
+    L = []
+    L.append("---\n")
+    L.append("## Code-Level Duplicates\n")
+    L.append(f"Sims whose `main.html`/`*.js` are near-identical (estimated Jaccard "
+             f"similarity of token 5-shingles ≥ {code_threshold}), whatever their "
+             "metadata says. Clusters marked **not a WHAT cluster** are forks whose "
+             "metadata was rewritten enough to hide them from the WHAT pass above.\n")
+    for n, r in enumerate(code_records, 1):
+        first = r["members"][0]
+        kind = "identical code" if r["identical"] else f"Jaccard min {r['min_jaccard']}, avg {r['avg_jaccard']}"
+        scope = f"cross-repo ({len(r['repos'])} repos)" if r["cross_repo"] else "same-repo"
+        where = "also a WHAT cluster" if r["in_what_cluster"] else "**not a WHAT cluster**"
+        L.append(f"### C{n}. {first['title']} — {r['size']} copies ({kind}, {scope}; {where})\n")
+        for m in r["members"]:
+            label = f"[{m['title']}]({m['url']})" if m["url"] else m["title"]
+            L.append(f"- `{m['repo']}/{m['sim']}` — {label}")
+        L.append("")
+    if not code_records:
+        L.append("_No code-level duplicates found at this threshold._\n")
+    return "\n".join(L)
 
 
 def render_md(records, total, threshold, cross_repo_only, skipped_untitled=0, skipped_template=0):
@@ -316,6 +1179,84 @@ def render_md(records, total, threshold, cross_repo_only, skipped_untitled=0, sk
     return "\n".join(L)
 
 
+def render_sweep_md(rows, total, cross_repo_only, skipped_untitled=0, skipped_template=0):
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    L = []
+    L.append("# Duplicate MicroSims — Threshold Sweep\n")
+    L.append(f"**Generated:** {now} | **Catalog size:** {total} MicroSims analyzed "
+             f"({skipped_untitled} untitled and {skipped_template} scaffold/template "
+             f"records excluded)"
+             f"{' | **Cross-repo clusters only**' if cross_repo_only else ''}\n")
+    L.append("Cluster counts at each WHAT-similarity threshold, all computed from one "
+             "similarity graph. Pick the cut, then run "
+             "`find-duplicate-microsims.py --threshold <cut>` for the full merge "
+             "report (it reuses the saved graph).\n")
+    L.append("| Threshold | Clusters | Sims in clusters | Mergeable | Cross-repo | "
+             "Largest | Near-identical | Strong | Moderate |")
+    L.append("|-----------|----------|------------------|-----------|------------|"
+             "---------|----------------|--------|----------|")
+    for r in rows:
+        L.append(f"| {r['threshold']:.2f} | {r['clusters']} | {r['sims_in_clusters']} | "
+                 f"{r['mergeable']} | {r['cross_repo_clusters']} | {r['largest_cluster']} | "
+                 f"{r['near_identical']} | {r['strong']} | {r['moderate']} |")
+    L.append("")
+    return "\n".join(L)
+
+
+def run_sweep(args):
+    print(f"Loading embeddings + catalog...")
+    by_threshold, total, skipped_untitled, skipped_template, recall = build_sweep(
+        args.sweep, args.cross_repo_only, **graph_options(args))
+    rows = [sweep_row(t, records) for t, records in by_threshold.items()]
+
+    atomic_write(SWEEP_MD, render_sweep_md(rows, total, args.cross_repo_only,
+                                           skipped_untitled, skipped_template))
+    dump_json(SWEEP_JSON, {
+        "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "thresholds": list(by_threshold),
+        "method": args.method,
+        "recall_check": recall,
+        "cross_repo_only": args.cross_repo_only,
+        "catalog_size": total,
+        "untitled_excluded": skipped_untitled,
+        "templates_excluded": skipped_template,
+        "sweep": [dict(row, clusters=[{
+            "size": r["size"],
+            "tier": r["tier"],
+            "cross_repo": r["cross_repo"],
+            "min_similarity": r["min_similarity"],
+            "avg_similarity": r["avg_similarity"],
+            "keeper": r["keeper"]["url"],
+            "members": [m["url"] for m in r["members"]],
+        } for r in records], cluster_count=row["clusters"])
+            for row, records in zip(rows, by_threshold.values())],
+    }, indent=2)
+    print(f"Excluded {skipped_untitled} untitled + {skipped_template} scaffold/template records")
+    print()
+    print(f"{'threshold':>9} {'clusters':>8} {'in clusters':>11} {'mergeable':>9} {'cross-repo':>10} {'largest':>7}")
+    for r in rows:
+        print(f"{r['threshold']:>9.2f} {r['clusters']:>8} {r['sims_in_clusters']:>11} "
+              f"{r['mergeable']:>9} {r['cross_repo_clusters']:>10} {r['largest_cluster']:>7}")
+    print()
+    print(f"Report:  {SWEEP_MD}")
+    print(f"Data:    {SWEEP_JSON}")
+
+
+def graph_options(args):
+    """prepare_graph() keyword arguments from the command line."""
+    return {
+        "include_templates": args.include_templates,
+        "precision": args.precision,
+        "method": args.method,
+        "nprobe": args.nprobe,
+        "lsh": {"bits": args.lsh_bits, "bands": args.lsh_bands, "seed": args.lsh_seed},
+        "rebuild_graph": args.rebuild_graph,
+        "workers": args.workers,
+        "check_recall": args.check_recall,
+        "incremental": args.incremental,
+    }
+
+
 def main():
     ap = argparse.ArgumentParser(description="Find duplicate MicroSims by WHAT similarity.")
     ap.add_argument("--threshold", "-t", type=float, default=0.90,
@@ -324,25 +1265,81 @@ def main():
                     help="Only report clusters that span more than one repository")
     ap.add_argument("--include-templates", action="store_true",
                     help="Include scaffold/template sims (excluded by default)")
+    ap.add_argument("--precision", choices=PRECISIONS, default="float32",
+                    help="WHAT matrix precision (default: float32); float16/int8 "
+                         "need generate-embeddings.py --quantize")
+    ap.add_argument("--method", "--index", dest="method", choices=["exact", "ann", "lsh"],
+                    default="exact",
+                    help="Exact all-pairs search (default), range search over the IVF "
+                         "index from build-ann-index.py, or SimHash LSH candidates "
+                         "verified exactly")
+    ap.add_argument("--nprobe", type=int, default=None,
+                    help="Lists probed per sim with --method ann (default: the index's own)")
+    ap.add_argument("--lsh-bits", type=int, default=None,
+                    help=f"Hyperplane bits per LSH band (default: ~log2(N), max {LSH_MAX_BITS})")
+    ap.add_argument("--lsh-bands", type=int, default=None,
+                    help=f"LSH bands (default: fewest reaching {LSH_TARGET_RECALL} expected "
+                         "recall at the threshold)")
+    ap.add_argument("--lsh-seed", type=int, default=42, help="Random hyperplane seed (default: 42)")
+    ap.add_argument("--check-recall", type=int, nargs="?", const=RECALL_SAMPLE, default=0,
+                    metavar="SAMPLE",
+                    help=f"With --method ann/lsh, measure pair recall against exact search "
+                         f"for SAMPLE sims (default: {RECALL_SAMPLE})")
+    ap.add_argument("--sweep", type=parse_sweep, metavar="LOW:HIGH[:STEP]",
+                    help="Report cluster counts for a range of thresholds (step default "
+                         "0.01) or a comma-separated list, from one similarity pass; "
+                         "writes the sweep report instead of the merge report")
+    ap.add_argument("--rebuild-graph", action="store_true",
+                    help=f"Recompute the similarity graph even if {GRAPH_PATH.name} can be reused")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Update the saved exact graph for new/changed sims only and "
+                         "rebuild only the clusters they affect")
+    ap.add_argument("--code", action="store_true",
+                    help="Also find code-level duplicates (MinHash over main.html/*.js "
+                         "in the local workspace)")
+    ap.add_argument("--code-threshold", type=float, default=DEFAULT_CODE_THRESHOLD,
+                    help=f"Estimated Jaccard similarity for --code (default: {DEFAULT_CODE_THRESHOLD})")
+    ap.add_argument("--workspace", type=Path, default=WORKSPACE_DIR,
+                    help=f"Workspace directory containing repos, for --code (default: {WORKSPACE_DIR})")
+    ap.add_argument("--workers", "-j", type=int, default=1,
+                    help="Processes for the exact all-pairs pass (default: 1; "
+                         "0 = one per CPU core)")
     args = ap.parse_args()
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
+
+    if args.sweep:
+        run_sweep(args)
+        return
 
     print(f"Loading embeddings + catalog...")
-    records, total, skipped_untitled, skipped_template = build_report(
-        args.threshold, args.cross_repo_only, args.include_templates)
+    records, total, skipped_untitled, skipped_template, recall = build_report(
+        args.threshold, args.cross_repo_only, **graph_options(args))
+
+    code_records = None
+    if args.code:
+        code_records = code_report(args.workspace, args.code_threshold, records,
+                                   args.cross_repo_only, args.include_templates)
 
     md = render_md(records, total, args.threshold, args.cross_repo_only,
                    skipped_untitled, skipped_template)
+    if code_records is not None:
+        md += "\n" + render_code_md(code_records, args.code_threshold)
     atomic_write(REPORT_MD, md)
-    atomic_write(REPORT_JSON, json.dumps({
+    dump_json(REPORT_JSON, {
         "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "threshold": args.threshold,
+        "method": args.method,
+        "recall_check": recall,
         "cross_repo_only": args.cross_repo_only,
         "catalog_size": total,
         "untitled_excluded": skipped_untitled,
         "templates_excluded": skipped_template,
         "cluster_count": len(records),
         "clusters": records,
-    }, indent=2))
+        "code_threshold": args.code_threshold if args.code else None,
+        "code_clusters": code_records,
+    }, indent=2)
     print(f"Excluded {skipped_untitled} untitled + {skipped_template} scaffold/template records")
 
     dup = sum(r["size"] for r in records)
@@ -350,6 +1347,9 @@ def main():
     cross = sum(1 for r in records if r["cross_repo"])
     print(f"Clusters: {len(records)}  |  sims in clusters: {dup}  |  "
           f"mergeable (retirable): {mergeable}  |  cross-repo clusters: {cross}")
+    if code_records is not None:
+        hidden = sum(1 for r in code_records if not r["in_what_cluster"])
+        print(f"Code clusters: {len(code_records)}  |  not found by WHAT similarity: {hidden}")
     print(f"Report:  {REPORT_MD}")
     print(f"Data:    {REPORT_JSON}")
 
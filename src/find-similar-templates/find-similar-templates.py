@@ -36,6 +36,12 @@ Usage:
     # Output as JSON for programmatic use
     python src/find-similar-templates/find-similar-templates.py --file spec.txt --json
 
+    # Batch: one JSON request per line in, one JSON result line per request out
+    python src/find-similar-templates/find-similar-templates.py --batch specs.jsonl --mode reuse --top 3
+
+    # Approximate candidate search over the IVF index (build-ann-index.py)
+    python src/find-similar-templates/find-similar-templates.py --file spec.txt --index ann
+
 Requirements:
     pip install sentence-transformers numpy
     (Requires Python 3.12 or earlier - PyTorch doesn't support Python 3.13 yet)
@@ -48,14 +54,18 @@ Output:
 
 import argparse
 import json
+import os
 import re
 import sys
 from pathlib import Path
 from typing import Optional
 
+# sentence_transformers (torch), http.server and urllib.request are imported
+# inside the functions that need them: most invocations never load the model
+# or touch the network, and this script runs as a subprocess many times per
+# generation job. Track startup with scripts/bench-startup.py.
 try:
     import numpy as np
-    from sentence_transformers import SentenceTransformer
 except ImportError:
     print("Error: Required packages not installed.", file=sys.stderr)
     print("Install with: pip install sentence-transformers numpy", file=sys.stderr)
@@ -65,7 +75,12 @@ except ImportError:
 # Paths
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent.parent
-EMBEDDINGS_PATH = PROJECT_ROOT / "data" / "microsims-embeddings.json"
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "embeddings"))
+from embedding_store import load_store, dot_scores, PRECISIONS  # noqa: E402
+from ann_index import load_index  # noqa: E402
+from query_cache import QueryEmbeddingCache  # noqa: E402
+from microsim_ids import catalog_rows  # noqa: E402
+
 MICROSIMS_DATA_PATH = PROJECT_ROOT / "docs" / "search" / "microsims-data.json"
 
 # Model configuration - must match the embeddings generator
@@ -97,6 +112,11 @@ PEDAGOGICAL_WEIGHT = 0.30
 REUSE_THRESHOLD = 0.75      # >= this: embed an iframe to the existing sim
 TEMPLATE_THRESHOLD = 0.60   # >= this: generate new, but use the match as a template
 
+# With --index ann, only this many nearest sims per query vector (WHAT, and
+# HOW when present) are scored, or 20x --top if that is larger. The final
+# ranking mixes in pedagogical alignment, so the pool is kept well above top_n.
+ANN_CANDIDATES = 200
+
 # Bloom verb to appropriate pedagogical patterns mapping
 # Higher scores indicate better alignment
 VERB_PATTERN_ALIGNMENT = {
@@ -170,6 +190,12 @@ LEVEL_PACING_ALIGNMENT = {
     "create": {"self-paced": 1.0, "step-through": 0.7, "continuous": 0.5, "timed": 0.3}
 }
 
+# Bloom levels in order; adjacent levels earn partial alignment credit
+BLOOM_LEVELS = ["remember", "understand", "apply", "analyze", "evaluate", "create"]
+
+# Weights of the pedagogical alignment components
+PEDAGOGY_WEIGHTS = {'pattern': 0.4, 'verb': 0.25, 'pacing': 0.2, 'level': 0.15}
+
 # Patterns that are inappropriate for certain verbs (penalty applied)
 PATTERN_PENALTIES = {
     "explain": {"continuous": -0.3},  # Continuous animation bad for explain
@@ -179,14 +205,44 @@ PATTERN_PENALTIES = {
     "create": {"reference": -0.4, "demonstration": -0.2}
 }
 
+# Query server (--serve): localhost only, JSON in/out. Callers opt in with
+# --server URL or by exporting SERVER_ENV; when the server is unreachable the
+# query runs in-process as before.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+SERVER_ENV = "MICROSIM_TEMPLATES_SERVER"
+SERVER_TIMEOUT = 30  # seconds per client request
+
+# Request fields accepted by the server, passed through to find_similar_templates()
+QUERY_FIELDS = ('spec_text', 'top_n', 'mode', 'query_text', 'min_score', 'index', 'nprobe')
+# Per-request fields of a batch (index/nprobe apply to the whole batch)
+BATCH_FIELDS = ('spec_text', 'top_n', 'mode', 'query_text', 'min_score')
+
+# --batch: requests encoded and scored together per chunk, bounding the
+# (catalog size x chunk) score matrices
+BATCH_CHUNK = 256
+# Accepted JSONL line keys -> request fields
+BATCH_LINE_KEYS = {
+    'spec': 'spec_text', 'spec_text': 'spec_text',
+    'query': 'query_text', 'query_text': 'query_text',
+    'mode': 'mode',
+    'top': 'top_n', 'top_n': 'top_n',
+    'min_score': 'min_score',
+}
+
 # Cache for loaded data and model
 _cache = {
+    'precision': 'float32',
     'model': None,
     'embeddings': None,
     'microsims_data': None,
     'urls': None,
     'what_matrix': None,
-    'how_matrix': None
+    'how_matrix': None,
+    'ann': None,
+    'pedagogy': None,
+    'query_cache': None,
+    'use_query_cache': True
 }
 
 
@@ -311,65 +367,74 @@ def create_how_query_text(spec: dict) -> str:
 
 
 def load_model():
-    """Load the sentence transformer model (cached)."""
+    """Load the sentence transformer model (cached).
+
+    Imported here rather than at module level so that client calls to a
+    --serve instance never pay for importing PyTorch.
+    """
     if _cache['model'] is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "sentence-transformers not installed. Install with: "
+                "pip install sentence-transformers (requires Python 3.12 or earlier)"
+            )
         _cache['model'] = SentenceTransformer(MODEL_NAME)
     return _cache['model']
 
 
-def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
-    """L2-normalize matrix rows for cosine similarity via dot product."""
-    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
-    norms[norms == 0] = 1.0
-    return matrix / norms
-
-
-def load_embeddings():
+def load_embeddings(precision: str = None):
     """
     Load precomputed embeddings (cached).
 
-    Supports the dual-v1 schema ({"what": [...], "how": [...]} per URL) and
-    the legacy flat format (a plain vector per URL), where the single legacy
-    vector is used as both the WHAT and HOW matrix.
+    Reads the memory-mapped dual-v2 store, falling back to the dual-v1 JSON
+    or the legacy flat format (one vector per URL, used as both the WHAT and
+    HOW matrix). Matrix rows are L2-normalized, so cosine similarity is a
+    plain dot product. *precision* ('float32', 'float16', 'int8') selects a
+    quantized variant of the store; the matrices are then scored directly in
+    that form via dot_scores.
     """
+    if precision is not None and precision != _cache['precision']:
+        _cache['precision'] = precision
+        _cache['embeddings'] = None
     if _cache['embeddings'] is None:
-        if not EMBEDDINGS_PATH.exists():
-            raise FileNotFoundError(
-                f"Embeddings file not found: {EMBEDDINGS_PATH}\n"
-                "Run: python src/embeddings/generate-embeddings.py"
-            )
+        store = load_store(precision=_cache['precision'])
+        _cache['embeddings'] = store
+        _cache['urls'] = store.urls
+        _cache['what_matrix'] = store.what
+        _cache['how_matrix'] = store.how
+        _cache['ann'] = None
+        _cache['pedagogy'] = None
+        _cache['microsims_data'] = None
+
+    return _cache['embeddings'], _cache['urls'], _cache['what_matrix'], _cache['how_matrix']
 
-        with open(EMBEDDINGS_PATH, 'r') as f:
-            data = json.load(f)
 
-        _cache['embeddings'] = data
-        _cache['urls'] = list(data['embeddings'].keys())
+def load_ann_indexes():
+    """Load the WHAT and HOW IVF indexes for the cached store (cached)."""
+    if _cache['ann'] is None:
+        store = load_embeddings()[0]
+        _cache['ann'] = {role: load_index(role, store) for role in ('what', 'how')}
+    return _cache['ann']
 
-        if data.get('metadata', {}).get('schema') == 'dual-v1':
-            what_matrix = np.array([
-                data['embeddings'][url]['what'] for url in _cache['urls']
-            ])
-            how_matrix = np.array([
-                data['embeddings'][url]['how'] for url in _cache['urls']
-            ])
-        else:
-            # Legacy single-vector format: use it for both roles
-            what_matrix = np.array([
-                data['embeddings'][url] for url in _cache['urls']
-            ])
-            how_matrix = what_matrix
-
-        _cache['what_matrix'] = _normalize_rows(what_matrix)
-        _cache['how_matrix'] = (
-            _cache['what_matrix'] if how_matrix is what_matrix
-            else _normalize_rows(how_matrix)
-        )
 
-    return _cache['embeddings'], _cache['urls'], _cache['what_matrix'], _cache['how_matrix']
+def ann_candidates(what_vector: np.ndarray, how_vector: Optional[np.ndarray],
+                   count: int, nprobe: int = None) -> np.ndarray:
+    """Store rows of the approximate top-*count* sims for each query vector."""
+    _, _, what_matrix, how_matrix = load_embeddings()
+    indexes = load_ann_indexes()
+    rows, _ = indexes['what'].search(what_matrix, what_vector[None, :], count, nprobe)
+    found = [rows[0]]
+    if how_vector is not None:
+        rows, _ = indexes['how'].search(how_matrix, how_vector[None, :], count, nprobe)
+        found.append(rows[0])
+    candidates = np.unique(np.concatenate(found))
+    return candidates[candidates >= 0]
 
 
 def load_microsims_data():
-    """Load MicroSims metadata to get GitHub URLs (cached)."""
+    """MicroSims metadata for each embedding row, joined on sim IDs (cached)."""
     if _cache['microsims_data'] is None:
         if not MICROSIMS_DATA_PATH.exists():
             raise FileNotFoundError(
@@ -380,16 +445,19 @@ def load_microsims_data():
         with open(MICROSIMS_DATA_PATH, 'r') as f:
             microsims = json.load(f)
 
-        # Build lookup by URL
-        _cache['microsims_data'] = {}
-        for sim in microsims:
-            url = sim.get('url') or sim.get('identifier')
-            if url:
-                _cache['microsims_data'][url] = sim
+        store = load_embeddings()[0]
+        _cache['microsims_data'] = catalog_rows(store, microsims)
 
     return _cache['microsims_data']
 
 
+def load_pedagogy() -> 'CatalogPedagogy':
+    """Compile the catalog's pedagogical fields for the loaded embedding rows (cached)."""
+    if _cache['pedagogy'] is None:
+        _cache['pedagogy'] = CatalogPedagogy(load_microsims_data())
+    return _cache['pedagogy']
+
+
 def extract_bloom_info(spec: dict) -> tuple[Optional[str], Optional[str]]:
     """
     Extract Bloom level and verb from a parsed specification.
@@ -416,32 +484,9 @@ def extract_bloom_info(spec: dict) -> tuple[Optional[str], Optional[str]]:
     return bloom_level, bloom_verb
 
 
-def compute_pedagogical_score(spec: dict, template_data: dict) -> float:
-    """
-    Compute a pedagogical alignment score between a specification and a template.
-
-    Args:
-        spec: Parsed specification dict
-        template_data: Template's metadata from microsims-data.json
-
-    Returns:
-        Score between 0.0 and 1.0 indicating pedagogical alignment
-    """
-    pedagogical = template_data.get('pedagogical', {})
-    if not pedagogical:
-        # No pedagogical data - return neutral score
-        return 0.5
-
-    bloom_level, bloom_verb = extract_bloom_info(spec)
-
-    template_pattern = pedagogical.get('pattern', '')
-    template_pacing = pedagogical.get('pacing', '')
-    template_verbs = pedagogical.get('bloomVerbs', [])
-    template_bloom_alignment = pedagogical.get('bloomAlignment', [])
-
-    scores = []
-
-    # 1. Pattern alignment score (most important)
+def pattern_alignment_score(bloom_level: Optional[str], bloom_verb: Optional[str],
+                            template_pattern: str) -> float:
+    """Pattern alignment: the template's pedagogical pattern vs the spec's Bloom verb/level."""
     pattern_score = 0.5  # Default neutral
 
     if bloom_verb and template_pattern:
@@ -464,9 +509,11 @@ def compute_pedagogical_score(spec: dict, template_data: dict) -> float:
         level_patterns = LEVEL_PATTERN_ALIGNMENT.get(bloom_level, {})
         pattern_score = level_patterns.get(template_pattern, 0.5)
 
-    scores.append(('pattern', pattern_score, 0.4))  # 40% weight
+    return pattern_score
+
 
-    # 2. Verb match score
+def verb_match_score(bloom_verb: Optional[str], template_verbs) -> float:
+    """Verb match: is the spec's Bloom verb among the template's bloomVerbs?"""
     verb_score = 0.5  # Default neutral
     if bloom_verb and template_verbs:
         if bloom_verb in template_verbs:
@@ -474,34 +521,73 @@ def compute_pedagogical_score(spec: dict, template_data: dict) -> float:
         else:
             # Check for related verbs at same Bloom level
             verb_score = 0.6  # Partial credit if template has verbs
-    scores.append(('verb', verb_score, 0.25))  # 25% weight
+    return verb_score
 
-    # 3. Pacing alignment score
+
+def pacing_alignment_score(bloom_level: Optional[str], template_pacing: str) -> float:
+    """Pacing alignment: the template's pacing vs the spec's Bloom level."""
     pacing_score = 0.5  # Default neutral
     if bloom_level and template_pacing:
         pacing_alignment = LEVEL_PACING_ALIGNMENT.get(bloom_level, {})
         pacing_score = pacing_alignment.get(template_pacing, 0.5)
-    scores.append(('pacing', pacing_score, 0.2))  # 20% weight
+    return pacing_score
+
 
-    # 4. Bloom level alignment score
+def level_alignment_score(bloom_level: Optional[str], template_bloom_alignment) -> float:
+    """Bloom level alignment, with partial credit for adjacent levels."""
     level_score = 0.5  # Default neutral
     if bloom_level and template_bloom_alignment:
         if bloom_level in template_bloom_alignment:
             level_score = 1.0
         else:
             # Adjacent levels get partial credit
-            level_order = ["remember", "understand", "apply", "analyze", "evaluate", "create"]
-            if bloom_level in level_order:
-                spec_idx = level_order.index(bloom_level)
+            if bloom_level in BLOOM_LEVELS:
+                spec_idx = BLOOM_LEVELS.index(bloom_level)
                 for tmpl_level in template_bloom_alignment:
-                    if tmpl_level in level_order:
-                        tmpl_idx = level_order.index(tmpl_level)
+                    if tmpl_level in BLOOM_LEVELS:
+                        tmpl_idx = BLOOM_LEVELS.index(tmpl_level)
                         distance = abs(spec_idx - tmpl_idx)
                         if distance == 1:
                             level_score = max(level_score, 0.7)
                         elif distance == 2:
                             level_score = max(level_score, 0.5)
-    scores.append(('level', level_score, 0.15))  # 15% weight
+    return level_score
+
+
+def compute_pedagogical_score(spec: dict, template_data: dict) -> float:
+    """
+    Compute a pedagogical alignment score between a specification and a template.
+
+    Reference implementation for one template; ranking uses the vectorized
+    CatalogPedagogy.scores(), built from the same component functions.
+
+    Args:
+        spec: Parsed specification dict
+        template_data: Template's metadata from microsims-data.json
+
+    Returns:
+        Score between 0.0 and 1.0 indicating pedagogical alignment
+    """
+    pedagogical = template_data.get('pedagogical', {})
+    if not pedagogical or not isinstance(pedagogical, dict):
+        # No (usable) pedagogical data - return neutral score
+        return 0.5
+
+    bloom_level, bloom_verb = extract_bloom_info(spec)
+
+    template_pattern = pedagogical.get('pattern', '')
+    template_pacing = pedagogical.get('pacing', '')
+    template_verbs = pedagogical.get('bloomVerbs', [])
+    template_bloom_alignment = pedagogical.get('bloomAlignment', [])
+
+    scores = [
+        ('pattern', pattern_alignment_score(bloom_level, bloom_verb, template_pattern),
+         PEDAGOGY_WEIGHTS['pattern']),
+        ('verb', verb_match_score(bloom_verb, template_verbs), PEDAGOGY_WEIGHTS['verb']),
+        ('pacing', pacing_alignment_score(bloom_level, template_pacing), PEDAGOGY_WEIGHTS['pacing']),
+        ('level', level_alignment_score(bloom_level, template_bloom_alignment),
+         PEDAGOGY_WEIGHTS['level']),
+    ]
 
     # Compute weighted average
     total_score = sum(score * weight for _, score, weight in scores)
@@ -510,6 +596,124 @@ def compute_pedagogical_score(spec: dict, template_data: dict) -> float:
     return total_score / total_weight if total_weight > 0 else 0.5
 
 
+class CatalogPedagogy:
+    """
+    The catalog's pedagogical fields compiled into arrays aligned with the
+    embedding rows, so one query's pedagogical scores for every sim are a few
+    table lookups instead of a compute_pedagogical_score() call per sim.
+
+    pattern and pacing become integer codes (0 = missing); bloomVerbs become
+    (row, verb code) pairs; bloomAlignment becomes a 6-bit mask over
+    BLOOM_LEVELS plus (row, level code) pairs for non-standard values. Per
+    query, each distinct pattern/pacing/mask value is scored once with the
+    component functions above and broadcast to the catalog. Records whose
+    fields have unexpected types (e.g. bloomVerbs as a string) are scored
+    with compute_pedagogical_score() directly.
+    """
+
+    def __init__(self, records: list):
+        n = len(records)
+        self.records = records
+        self.has_pedagogy = np.zeros(n, dtype=bool)
+        self.pattern_codes = np.zeros(n, dtype=np.int32)
+        self.pacing_codes = np.zeros(n, dtype=np.int32)
+        self.has_verbs = np.zeros(n, dtype=bool)
+        self.has_alignment = np.zeros(n, dtype=bool)
+        self.level_masks = np.zeros(n, dtype=np.int64)
+        self.patterns = {'': 0}
+        self.pacings = {'': 0}
+        self.verbs = {}
+        self.levels = {}
+        verb_rows, verb_codes, level_rows, level_codes, irregular = [], [], [], [], []
+
+        for row, sim in enumerate(self.records):
+            pedagogical = sim.get('pedagogical', {})
+            if not pedagogical or not isinstance(pedagogical, dict):
+                # Missing, or not an object (hand-edited metadata): neutral score
+                continue
+            pattern = pedagogical.get('pattern', '')
+            pacing = pedagogical.get('pacing', '')
+            verbs = pedagogical.get('bloomVerbs', [])
+            alignment = pedagogical.get('bloomAlignment', [])
+            if not ((not pattern or isinstance(pattern, str))
+                    and (not pacing or isinstance(pacing, str))
+                    and (not verbs or isinstance(verbs, list))
+                    and (not alignment or isinstance(alignment, list))):
+                irregular.append(row)
+                continue
+
+            self.has_pedagogy[row] = True
+            if pattern:
+                self.pattern_codes[row] = self.patterns.setdefault(pattern, len(self.patterns))
+            if pacing:
+                self.pacing_codes[row] = self.pacings.setdefault(pacing, len(self.pacings))
+            if verbs:
+                self.has_verbs[row] = True
+                for verb in verbs:
+                    if isinstance(verb, str):
+                        verb_rows.append(row)
+                        verb_codes.append(self.verbs.setdefault(verb, len(self.verbs)))
+            if alignment:
+                self.has_alignment[row] = True
+                for level in alignment:
+                    if level in BLOOM_LEVELS:
+                        self.level_masks[row] |= 1 << BLOOM_LEVELS.index(level)
+                    elif isinstance(level, str):
+                        level_rows.append(row)
+                        level_codes.append(self.levels.setdefault(level, len(self.levels)))
+
+        self.verb_rows = np.array(verb_rows, dtype=np.int64)
+        self.verb_codes = np.array(verb_codes, dtype=np.int32)
+        self.level_rows = np.array(level_rows, dtype=np.int64)
+        self.level_codes = np.array(level_codes, dtype=np.int32)
+        self.irregular = irregular
+        self._level_mask_levels = [[level for bit, level in enumerate(BLOOM_LEVELS) if mask >> bit & 1]
+                                   for mask in range(1 << len(BLOOM_LEVELS))]
+
+    def _rows_with(self, value: str, vocab: dict, rows: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Boolean mask of catalog rows whose list field contains *value*."""
+        found = np.zeros(len(self.records), dtype=bool)
+        if value in vocab:
+            found[rows[codes == vocab[value]]] = True
+        return found
+
+    def scores(self, spec: dict) -> np.ndarray:
+        """Pedagogical alignment of every catalog row with *spec* (float64)."""
+        bloom_level, bloom_verb = extract_bloom_info(spec)
+
+        pattern_table = np.array([pattern_alignment_score(bloom_level, bloom_verb, pattern)
+                                  for pattern in self.patterns])
+        pacing_table = np.array([pacing_alignment_score(bloom_level, pacing)
+                                 for pacing in self.pacings])
+        pattern = pattern_table[self.pattern_codes]
+        pacing = pacing_table[self.pacing_codes]
+
+        if bloom_verb:
+            verb = np.where(self.has_verbs, 0.6, 0.5)
+            verb[self._rows_with(bloom_verb, self.verbs, self.verb_rows, self.verb_codes)] = 1.0
+        else:
+            verb = np.full(len(self.records), 0.5)
+
+        if bloom_level in BLOOM_LEVELS:
+            level_table = np.array([level_alignment_score(bloom_level, levels)
+                                    for levels in self._level_mask_levels])
+            level = np.where(self.has_alignment, level_table[self.level_masks], 0.5)
+        else:
+            level = np.full(len(self.records), 0.5)
+            if bloom_level:
+                level[self._rows_with(bloom_level, self.levels, self.level_rows, self.level_codes)] = 1.0
+
+        # Same weighted average, in the same order, as compute_pedagogical_score()
+        total_score = (pattern * PEDAGOGY_WEIGHTS['pattern'] + verb * PEDAGOGY_WEIGHTS['verb']
+                       + pacing * PEDAGOGY_WEIGHTS['pacing'] + level * PEDAGOGY_WEIGHTS['level'])
+        total_weight = sum(PEDAGOGY_WEIGHTS.values())
+        result = np.where(self.has_pedagogy, total_score / total_weight, 0.5)
+
+        for row in self.irregular:
+            result[row] = compute_pedagogical_score(spec, self.records[row])
+        return result
+
+
 def fullscreen_url_for(live_url: str) -> str:
     """Build the directly-embeddable main.html URL from a catalog live URL."""
     if live_url.endswith('main.html'):
@@ -534,9 +738,246 @@ def recommendation_for(what_score: float) -> str:
     return 'generate'
 
 
+def prepare_query(spec_text: str = None, query_text: str = None) -> tuple[dict, str, str]:
+    """
+    Turn a specification or a plain WHAT query into (spec, what_query, how_query).
+
+    A non-empty query_text bypasses spec parsing and has no HOW part.
+    """
+    if query_text and query_text.strip():
+        return parse_specification(query_text), query_text, ""
+
+    spec = parse_specification(spec_text)
+    what_query = create_what_query_text(spec)
+    how_query = create_how_query_text(spec)
+    if not what_query.strip() and not how_query.strip():
+        # If parsing failed, use the raw text as the WHAT query
+        what_query = spec_text
+    return spec, what_query, how_query
+
+
+def load_query_cache() -> Optional[QueryEmbeddingCache]:
+    """The on-disk query embedding cache for MODEL_NAME, or None if disabled."""
+    if not _cache['use_query_cache']:
+        return None
+    if _cache['query_cache'] is None:
+        _cache['query_cache'] = QueryEmbeddingCache(MODEL_NAME)
+    return _cache['query_cache']
+
+
+def encode_normalized(texts: list) -> np.ndarray:
+    """
+    L2-normalized query vectors for *texts*, one row per text.
+
+    Texts found in the query embedding cache skip the model; the rest are
+    encoded in one model call (loading the model only then) and cached.
+    """
+    cache = load_query_cache()
+    vectors = cache.get_many(texts) if cache else {}
+    missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+    if missing:
+        model = load_model()
+        embeddings = np.asarray(model.encode(missing, convert_to_numpy=True), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        encoded = dict(zip(missing, embeddings / norms))
+        if cache:
+            cache.put_many(encoded)
+        vectors.update(encoded)
+    return np.stack([vectors[text] for text in texts])
+
+
+def format_cache_stats(stats: dict, as_json: bool = False) -> str:
+    """Format QueryEmbeddingCache.stats() for --cache-stats."""
+    if as_json:
+        return json.dumps(stats, indent=2)
+    hit_rate = f"{stats['hit_rate']:.1%}" if stats['hit_rate'] is not None else "n/a"
+    lines = [
+        "=" * 50,
+        "Query Embedding Cache",
+        "=" * 50,
+        f"Path:       {stats['path']}",
+        f"Entries:    {stats['entries']} / {stats['max_entries']}",
+        f"Size:       {stats['size_bytes'] / 1024:.1f} KB",
+        f"Hits:       {stats['hits']}",
+        f"Misses:     {stats['misses']}",
+        f"Hit rate:   {hit_rate}",
+        f"Evictions:  {stats['evictions']}",
+    ]
+    for model, count in sorted(stats['models'].items()):
+        lines.append(f"  {model}: {count} entries")
+    return '\n'.join(lines)
+
+
+def top_positions(scores: np.ndarray, positions: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    The top_n of *positions* by descending score, ties in position order
+    (the order a stable descending sort would give).
+    """
+    if top_n <= 0 or len(positions) == 0:
+        return positions[:0]
+    values = scores[positions]
+    if len(positions) > top_n:
+        # Keep everything tied with the top_n-th best so ties resolve by position
+        kth = np.partition(values, len(values) - top_n)[len(values) - top_n]
+        keep = values >= kth
+        positions, values = positions[keep], values[keep]
+    order = np.lexsort((positions, -values))
+    return positions[order[:top_n]]
+
+
+def rank_candidates(spec: dict, rows, what_similarities: np.ndarray,
+                    how_similarities: Optional[np.ndarray], mode: str = 'template',
+                    top_n: int = 5, min_score: float = None) -> list:
+    """
+    Score catalog *rows* for one query and return the top_n as tuples
+    (idx, ranking_score, what_score, how_score, pedagogical_score).
+
+    what_similarities/how_similarities are aligned with *rows*;
+    how_similarities is None when the query has no HOW content. Scores are
+    whole-array operations; only the top_n are turned into tuples.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    what_scores = np.asarray(what_similarities, dtype=np.float64)
+    how_scores = (np.asarray(how_similarities, dtype=np.float64)
+                  if how_similarities is not None else None)
+    pedagogical_scores = load_pedagogy().scores(spec)[rows]
+
+    if mode == 'reuse':
+        # Pure WHAT ranking: a perfect concept match in a different
+        # library is still reusable via iframe.
+        ranking_scores = what_scores
+    elif how_scores is not None:
+        ranking_scores = (WHAT_WEIGHT * what_scores +
+                          HOW_WEIGHT * how_scores +
+                          PEDAGOGICAL_WEIGHT * pedagogical_scores)
+    else:
+        # No HOW content in the query: fold HOW weight into WHAT
+        ranking_scores = ((WHAT_WEIGHT + HOW_WEIGHT) * what_scores +
+                          PEDAGOGICAL_WEIGHT * pedagogical_scores)
+
+    if min_score is not None:
+        positions = np.flatnonzero(ranking_scores >= min_score)
+    else:
+        positions = np.arange(len(rows))
+
+    return [(int(rows[pos]), float(ranking_scores[pos]), float(what_scores[pos]),
+             float(how_scores[pos]) if how_scores is not None else None,
+             float(pedagogical_scores[pos]))
+            for pos in top_positions(ranking_scores, positions, top_n)]
+
+
+def build_result(idx: int, ranking_score: float, what_score: float,
+                 how_score: Optional[float], pedagogical_score: float,
+                 mode: str = 'template') -> dict:
+    """Result dict for catalog row *idx*, as printed by --json."""
+    _, urls, _, _ = load_embeddings()
+    url = urls[idx]
+
+    # Get metadata for this MicroSim
+    sim_data = load_microsims_data()[idx]
+    source = sim_data.get('_source', {})
+
+    # Construct GitHub URL for code viewing
+    github_url = source.get('github_url')
+    if not github_url:
+        # Fallback: construct from URL
+        # https://dmccreary.github.io/repo/sims/name/ -> https://github.com/dmccreary/repo/tree/main/docs/sims/name
+        if 'dmccreary.github.io' in url:
+            match = re.match(r'https://dmccreary\.github\.io/([^/]+)/sims/([^/]+)/?', url)
+            if match:
+                repo, sim_name = match.groups()
+                github_url = f"https://github.com/dmccreary/{repo}/tree/main/docs/sims/{sim_name}"
+
+    # Get pedagogical metadata for display
+    pedagogical = sim_data.get('pedagogical', {})
+
+    result = {
+        'github_url': github_url,
+        'live_url': url,
+        'title': sim_data.get('title', 'Unknown'),
+        'score': round(ranking_score, 4),
+        'what_score': round(what_score, 4),
+        'how_score': round(how_score, 4) if how_score is not None else None,
+        'pedagogical_score': round(pedagogical_score, 4),
+        'framework': sim_data.get('framework', 'unknown'),
+        'subject': sim_data.get('subject', 'unknown'),
+        'grade_level': sim_data.get('gradeLevel', 'unknown'),
+        'visualization_type': sim_data.get('visualizationType', []),
+        'pattern': pedagogical.get('pattern', 'unknown'),
+        'pacing': pedagogical.get('pacing', 'unknown'),
+        'bloom_verbs': pedagogical.get('bloomVerbs', []),
+        'description': sim_data.get('description', '')[:200] if sim_data.get('description') else ''
+    }
+
+    if mode == 'reuse':
+        result['recommendation'] = recommendation_for(what_score)
+        result['fullscreen_url'] = fullscreen_url_for(url)
+        result['iframe_snippet'] = iframe_snippet_for(url)
+
+    return result
+
+
+def find_similar_templates_batch(requests: list, index: str = 'exact', nprobe: int = None):
+    """
+    Answer many queries with one encoder call and one matrix product per role.
+
+    Each request is a dict of find_similar_templates() keyword arguments
+    (spec_text, query_text, mode, top_n, min_score). All WHAT and HOW query
+    texts are encoded together, then scored against the catalog as a
+    (N, n_queries) matrix product — or, with index='ann', against each
+    query's ANN candidates.
+
+    Yields one result list per request, in order.
+    """
+    if not requests:
+        return
+    _, urls, what_matrix, how_matrix = load_embeddings()
+
+    prepared = [prepare_query(r.get('spec_text'), r.get('query_text')) for r in requests]
+    what_texts = [what_query for _, what_query, _ in prepared]
+    how_slots = [i for i, (_, _, how_query) in enumerate(prepared) if how_query.strip()]
+    vectors = encode_normalized(what_texts + [prepared[i][2] for i in how_slots])
+    what_vectors = vectors[:len(requests)]
+    how_vectors = [None] * len(requests)
+    for i, vector in zip(how_slots, vectors[len(requests):]):
+        how_vectors[i] = vector
+
+    if index != 'ann':
+        rows = range(len(urls))
+        # WHAT similarity: what the sim teaches vs what each query asks for
+        what_similarities = dot_scores(what_matrix, what_vectors)  # (N, n_queries)
+        # HOW similarity: implementation style (only for queries that describe one)
+        how_similarities = None
+        if how_slots:
+            how_similarities = dot_scores(how_matrix, vectors[len(requests):])
+        how_column = {i: col for col, i in enumerate(how_slots)}
+
+    for i, request in enumerate(requests):
+        spec = prepared[i][0]
+        mode = request.get('mode', 'template')
+        top_n = request.get('top_n', 5)
+        if index == 'ann':
+            # Score only the ANN candidates, exactly
+            rows = ann_candidates(what_vectors[i], how_vectors[i],
+                                  max(ANN_CANDIDATES, top_n * 20), nprobe)
+            what_scores = dot_scores(what_matrix[rows], what_vectors[i])
+            how_scores = (dot_scores(how_matrix[rows], how_vectors[i])
+                          if how_vectors[i] is not None else None)
+        else:
+            what_scores = what_similarities[:, i]
+            how_scores = (how_similarities[:, how_column[i]]
+                          if i in how_column else None)
+
+        top_results = rank_candidates(spec, rows, what_scores, how_scores, mode,
+                                      top_n, request.get('min_score'))
+        yield [build_result(*scored, mode=mode) for scored in top_results]
+
+
 def find_similar_templates(spec_text: str = None, top_n: int = 5,
                            mode: str = 'template', query_text: str = None,
-                           min_score: float = None) -> list:
+                           min_score: float = None, index: str = 'exact',
+                           nprobe: int = None) -> list:
     """
     Find the most similar MicroSims for a specification or a plain WHAT query.
 
@@ -548,122 +989,23 @@ def find_similar_templates(spec_text: str = None, top_n: int = 5,
               'reuse' ranks on pure WHAT similarity
         query_text: Plain WHAT query text (bypasses spec parsing)
         min_score: Optional minimum score filter on the ranking score
+        index: 'exact' scores every catalog sim; 'ann' scores only the
+               candidates found in the IVF indexes (see ann_candidates)
+        nprobe: Lists probed per query with index='ann' (default: the
+                index's own)
 
     Returns:
         List of result dicts. Reuse mode adds recommendation,
         iframe_snippet and fullscreen_url per result.
     """
-    if query_text and query_text.strip():
-        spec = parse_specification(query_text)
-        what_query = query_text
-        how_query = ""
-    else:
-        spec = parse_specification(spec_text)
-        what_query = create_what_query_text(spec)
-        how_query = create_how_query_text(spec)
-        if not what_query.strip() and not how_query.strip():
-            # If parsing failed, use the raw text as the WHAT query
-            what_query = spec_text
-
-    # Load model and embeddings
-    model = load_model()
-    _, urls, what_matrix, how_matrix = load_embeddings()
-    microsims_data = load_microsims_data()
-
-    def encode_normalized(text: str) -> np.ndarray:
-        embedding = model.encode([text], convert_to_numpy=True)[0]
-        norm = np.linalg.norm(embedding)
-        return embedding / norm if norm > 0 else embedding
-
-    # WHAT similarity: what the sim teaches vs what the query asks for
-    what_similarities = np.dot(what_matrix, encode_normalized(what_query))
-
-    # HOW similarity: implementation style (only when the query describes one)
-    how_similarities = None
-    if how_query.strip():
-        how_similarities = np.dot(how_matrix, encode_normalized(how_query))
-
-    # Score all catalog entries
-    scored = []
-    for idx, url in enumerate(urls):
-        what_score = float(what_similarities[idx])
-        how_score = float(how_similarities[idx]) if how_similarities is not None else None
-        sim_data = microsims_data.get(url, {})
-        pedagogical_score = compute_pedagogical_score(spec, sim_data)
-
-        if mode == 'reuse':
-            # Pure WHAT ranking: a perfect concept match in a different
-            # library is still reusable via iframe.
-            ranking_score = what_score
-        else:
-            if how_score is not None:
-                ranking_score = (WHAT_WEIGHT * what_score +
-                                 HOW_WEIGHT * how_score +
-                                 PEDAGOGICAL_WEIGHT * pedagogical_score)
-            else:
-                # No HOW content in the query: fold HOW weight into WHAT
-                ranking_score = ((WHAT_WEIGHT + HOW_WEIGHT) * what_score +
-                                 PEDAGOGICAL_WEIGHT * pedagogical_score)
-
-        scored.append((idx, ranking_score, what_score, how_score, pedagogical_score))
-
-    # Sort by ranking score
-    scored.sort(key=lambda x: x[1], reverse=True)
-
-    if min_score is not None:
-        scored = [s for s in scored if s[1] >= min_score]
-
-    top_results = scored[:top_n]
-
-    # Build results
-    results = []
-    for idx, ranking_score, what_score, how_score, pedagogical_score in top_results:
-        url = urls[idx]
-
-        # Get metadata for this MicroSim
-        sim_data = microsims_data.get(url, {})
-        source = sim_data.get('_source', {})
-
-        # Construct GitHub URL for code viewing
-        github_url = source.get('github_url')
-        if not github_url:
-            # Fallback: construct from URL
-            # https://dmccreary.github.io/repo/sims/name/ -> https://github.com/dmccreary/repo/tree/main/docs/sims/name
-            if 'dmccreary.github.io' in url:
-                match = re.match(r'https://dmccreary\.github\.io/([^/]+)/sims/([^/]+)/?', url)
-                if match:
-                    repo, sim_name = match.groups()
-                    github_url = f"https://github.com/dmccreary/{repo}/tree/main/docs/sims/{sim_name}"
-
-        # Get pedagogical metadata for display
-        pedagogical = sim_data.get('pedagogical', {})
-
-        result = {
-            'github_url': github_url,
-            'live_url': url,
-            'title': sim_data.get('title', 'Unknown'),
-            'score': round(ranking_score, 4),
-            'what_score': round(what_score, 4),
-            'how_score': round(how_score, 4) if how_score is not None else None,
-            'pedagogical_score': round(pedagogical_score, 4),
-            'framework': sim_data.get('framework', 'unknown'),
-            'subject': sim_data.get('subject', 'unknown'),
-            'grade_level': sim_data.get('gradeLevel', 'unknown'),
-            'visualization_type': sim_data.get('visualizationType', []),
-            'pattern': pedagogical.get('pattern', 'unknown'),
-            'pacing': pedagogical.get('pacing', 'unknown'),
-            'bloom_verbs': pedagogical.get('bloomVerbs', []),
-            'description': sim_data.get('description', '')[:200] if sim_data.get('description') else ''
-        }
-
-        if mode == 'reuse':
-            result['recommendation'] = recommendation_for(what_score)
-            result['fullscreen_url'] = fullscreen_url_for(url)
-            result['iframe_snippet'] = iframe_snippet_for(url)
-
-        results.append(result)
-
-    return results
+    request = {
+        'spec_text': spec_text,
+        'query_text': query_text,
+        'mode': mode,
+        'top_n': top_n,
+        'min_score': min_score,
+    }
+    return next(find_similar_templates_batch([request], index=index, nprobe=nprobe))
 
 
 def format_results(results: list, as_json: bool = False, mode: str = 'template') -> str:
@@ -722,6 +1064,260 @@ def format_results(results: list, as_json: bool = False, mode: str = 'template')
     return '\n'.join(output)
 
 
+def make_handler(quiet: bool = False):
+    """Request handler for the query server, bound to the warm module cache."""
+    from http.server import BaseHTTPRequestHandler
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/health':
+                self._send_json(404, {'error': f'unknown path: {self.path}'})
+                return
+            _, urls, _, _ = load_embeddings()
+            self._send_json(200, {
+                'status': 'ok',
+                'model': MODEL_NAME,
+                'precision': _cache['precision'],
+                'count': len(urls),
+            })
+
+        def do_POST(self):
+            if self.path not in ('/query', '/batch'):
+                self._send_json(404, {'error': f'unknown path: {self.path}'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+                if self.path == '/batch':
+                    unknown = set(request) - {'requests', 'index', 'nprobe'}
+                    items = request.get('requests', [])
+                    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                        raise ValueError('"requests" must be a list of JSON objects')
+                    for item in items:
+                        unknown |= set(item) - set(BATCH_FIELDS)
+                else:
+                    unknown = set(request) - set(QUERY_FIELDS)
+                    items = [request]
+                if unknown:
+                    raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+                for item in items:
+                    check_request(item)
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            try:
+                if self.path == '/batch':
+                    results = list(find_similar_templates_batch(
+                        request.get('requests', []),
+                        index=request.get('index', 'exact'),
+                        nprobe=request.get('nprobe')))
+                else:
+                    results = find_similar_templates(**request)
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {'results': results})
+
+        def log_message(self, format, *args):
+            if not quiet:
+                super().log_message(format, *args)
+
+    return QueryHandler
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+          index: str = 'exact', quiet: bool = False):
+    """
+    Answer template/reuse queries over localhost HTTP with everything resident.
+
+    Loads the model, the WHAT/HOW matrices, the catalog lookup (and the ANN
+    indexes with index='ann') once, then serves:
+
+        GET  /health   {"status", "model", "precision", "count"}
+        POST /query    {"spec_text" | "query_text", "mode", "top_n", ...}
+                       -> {"results": [...]} (the --json result list)
+        POST /batch    {"requests": [{...}, ...], "index", "nprobe"}
+                       -> {"results": [[...], ...]} (one list per request)
+
+    Requests are handled one at a time, so the model is never re-entered.
+    """
+    from http.server import HTTPServer
+
+    load_model()
+    load_embeddings()
+    load_microsims_data()
+    if index == 'ann':
+        load_ann_indexes()
+
+    server = HTTPServer((host, port), make_handler(quiet))
+    print(f"Serving find-similar-templates on http://{host}:{server.server_port} "
+          f"({len(_cache['urls'])} MicroSims, precision {_cache['precision']})", file=sys.stderr)
+    print(f"Clients: --server http://{host}:{server.server_port} "
+          f"or export {SERVER_ENV}=http://{host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def query_server(server_url: str, request: dict, timeout: float = SERVER_TIMEOUT,
+                 endpoint: str = '/query') -> list:
+    """
+    Run one query (or, with endpoint='/batch', a batch) on a --serve
+    instance and return its results.
+
+    Raises ConnectionError when the server cannot be reached (so the caller
+    can fall back to an in-process query) and RuntimeError when the server
+    reports an error for the query itself.
+    """
+    import urllib.error
+    import urllib.request
+
+    data = json.dumps(request).encode('utf-8')
+    req = urllib.request.Request(server_url.rstrip('/') + endpoint, data=data,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read())['results']
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get('error', str(e))
+        except ValueError:
+            message = str(e)
+        raise RuntimeError(f"server error: {message}")
+    except (urllib.error.URLError, OSError) as e:
+        raise ConnectionError(f"query server unreachable at {server_url}: {e}")
+
+
+class BatchLineError(ValueError):
+    """A --batch line that cannot be run; request_id is its "id", if it has one."""
+
+    def __init__(self, message: str, request_id=None):
+        super().__init__(message)
+        self.request_id = request_id
+
+
+def check_request(request: dict):
+    """Raise ValueError unless the request fields have usable types and values."""
+    for field in ('spec_text', 'query_text'):
+        if request.get(field) is not None and not isinstance(request[field], str):
+            raise ValueError(f"{field} must be a string")
+    if request.get('mode', 'template') not in ('template', 'reuse'):
+        raise ValueError(f"unknown mode: {request['mode']}")
+    top_n = request.get('top_n', 5)
+    if isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1:
+        raise ValueError("top_n must be a positive integer")
+    min_score = request.get('min_score')
+    if min_score is not None and (isinstance(min_score, bool) or not isinstance(min_score, (int, float))):
+        raise ValueError("min_score must be a number")
+
+
+def parse_batch_line(line: str, defaults: dict) -> tuple[Optional[str], dict]:
+    """
+    Parse one --batch JSONL line into (id, request).
+
+    A line is an object with "spec" or "query" and optionally "id", "mode",
+    "top" and "min_score" (unset fields take the command-line values); a bare
+    JSON string is treated as a query. Raises BatchLineError (a ValueError,
+    carrying the line's "id" when it has one) for anything else.
+    """
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        raise BatchLineError(f"invalid JSON: {e}")
+    if isinstance(item, str):
+        item = {'query': item}
+    if not isinstance(item, dict):
+        raise BatchLineError("expected a JSON object or string")
+    request_id = item.pop('id', None)
+    unknown = set(item) - set(BATCH_LINE_KEYS)
+    if unknown:
+        raise BatchLineError(f"unknown fields: {', '.join(sorted(unknown))}", request_id)
+    request = dict(defaults)
+    for key, value in item.items():
+        request[BATCH_LINE_KEYS[key]] = value
+    try:
+        check_request(request)
+    except ValueError as e:
+        raise BatchLineError(str(e), request_id)
+    if not any((request.get(k) or '').strip() for k in ('spec_text', 'query_text')):
+        raise BatchLineError('no "spec" or "query" text', request_id)
+    return request_id, request
+
+
+def run_batch(lines, defaults: dict, index: str = 'exact', nprobe: int = None,
+              server: str = None, out=None, precision: str = None):
+    """
+    Stream one JSON line per input request: {"id", "results"} or {"id", "error"}.
+
+    Requests are answered BATCH_CHUNK at a time through
+    find_similar_templates_batch() (or the server's /batch endpoint), so
+    the model is loaded once and each chunk costs one encoder call. The
+    embeddings (at *precision*) are only loaded if a chunk runs in-process.
+    Errors carry the line's "id", or its line number when it has none; a
+    chunk the server rejects is reported as an error on each of its lines.
+    """
+    out = out or sys.stdout
+    chunk = []
+    state = {'server': server}
+
+    def emit(payload: dict):
+        out.write(json.dumps(payload) + '\n')
+        out.flush()
+
+    def flush():
+        if not chunk:
+            return
+        requests = [request for _, request in chunk]
+        results = None
+        if state['server']:
+            try:
+                results = query_server(state['server'],
+                                       {'requests': requests, 'index': index, 'nprobe': nprobe},
+                                       endpoint='/batch')
+            except ConnectionError as e:
+                print(f"Warning: {e}; running the batch in-process", file=sys.stderr)
+                state['server'] = None
+            except RuntimeError as e:
+                for request_id, _ in chunk:
+                    emit({'id': request_id, 'error': str(e)})
+                chunk.clear()
+                return
+        if results is None:
+            load_embeddings(precision)
+            results = find_similar_templates_batch(requests, index=index, nprobe=nprobe)
+        for (request_id, _), result in zip(chunk, results):
+            emit({'id': request_id, 'results': result})
+        chunk.clear()
+
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            request_id, request = parse_batch_line(line, defaults)
+        except BatchLineError as e:
+            # Keep output in input order
+            flush()
+            emit({'id': line_no if e.request_id is None else e.request_id, 'error': str(e)})
+            continue
+        chunk.append((line_no if request_id is None else request_id, request))
+        if len(chunk) >= BATCH_CHUNK:
+            flush()
+    flush()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Find similar MicroSim templates from a specification',
@@ -739,6 +1335,17 @@ Examples:
     Learning Objective: Students will understand pendulum motion..."
 
     # JSON output for programmatic use
+    python find-similar-templates.py --file spec.txt --json
+
+    # Query embedding cache statistics
+    python find-similar-templates.py --cache-stats
+
+    # Many queries in one run (JSONL in, JSONL out)
+    python find-similar-templates.py --batch specs.jsonl --mode reuse --top 3
+
+    # Keep the model resident and send queries to it
+    python find-similar-templates.py --serve &
+    export MICROSIM_TEMPLATES_SERVER=http://127.0.0.1:8765
     python find-similar-templates.py --file spec.txt --json
         """
     )
@@ -785,9 +1392,108 @@ Examples:
         action='store_true',
         help='Suppress loading messages'
     )
+    parser.add_argument(
+        '--precision',
+        choices=PRECISIONS,
+        default='float32',
+        help='Catalog matrix precision to score against (default: float32); '
+             'float16/int8 need generate-embeddings.py --quantize'
+    )
+    parser.add_argument(
+        '--index',
+        choices=['exact', 'ann'],
+        default='exact',
+        help='exact: score every catalog sim (default); ann: score only '
+             'candidates from the IVF index built by build-ann-index.py'
+    )
+    parser.add_argument(
+        '--nprobe',
+        type=int,
+        help="Lists probed per query with --index ann (default: the index's own)"
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Run a localhost query server that keeps the model and embeddings '
+             'loaded (see --host/--port)'
+    )
+    parser.add_argument(
+        '--host',
+        default=DEFAULT_HOST,
+        help=f'Interface for --serve (default: {DEFAULT_HOST})'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=DEFAULT_PORT,
+        help=f'Port for --serve (default: {DEFAULT_PORT})'
+    )
+    parser.add_argument(
+        '--server',
+        default=os.environ.get(SERVER_ENV),
+        help=f'Send the query to a running --serve instance at this URL, falling '
+             f'back to an in-process query if it is unreachable (default: ${SERVER_ENV})'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the on-disk query embedding cache'
+    )
+    parser.add_argument(
+        '--cache-stats',
+        action='store_true',
+        help='Print query embedding cache statistics and exit'
+    )
+    parser.add_argument(
+        '--batch', '-b',
+        metavar='FILE',
+        help='Answer many queries: read JSONL requests from FILE ("-" for stdin), '
+             'one {"id", "spec" | "query", "mode", "top", "min_score"} object per '
+             'line, and write one JSON result line per request'
+    )
 
     args = parser.parse_args()
 
+    if args.cache_stats:
+        print(format_cache_stats(QueryEmbeddingCache(MODEL_NAME).stats(), as_json=args.json))
+        return
+    if args.no_cache:
+        _cache['use_query_cache'] = False
+
+    if args.serve:
+        load_embeddings(args.precision)
+        serve(args.host, args.port, index=args.index, quiet=args.quiet)
+        return
+
+    if args.batch:
+        if args.batch != '-' and not Path(args.batch).exists():
+            print(f"Error: File not found: {args.batch}", file=sys.stderr)
+            sys.exit(1)
+        if args.quiet:
+            import io
+            old_stderr = sys.stderr
+            sys.stderr = io.StringIO()
+        defaults = {
+            'spec_text': None,
+            'query_text': None,
+            'mode': args.mode,
+            'top_n': args.top,
+            'min_score': args.min_score,
+        }
+        source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        try:
+            run_batch(source, defaults, index=args.index, nprobe=args.nprobe, server=args.server,
+                      precision=args.precision)
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if args.quiet:
+                sys.stderr = old_stderr
+        return
+
     # Get specification text
     spec_text = None
 
@@ -813,18 +1519,31 @@ Examples:
         old_stderr = sys.stderr
         sys.stderr = io.StringIO()
 
+    request = {
+        'spec_text': spec_text,
+        'top_n': args.top,
+        'mode': args.mode,
+        'query_text': args.query,
+        'min_score': args.min_score,
+        'index': args.index,
+        'nprobe': args.nprobe,
+    }
+
     try:
-        # Find similar templates
-        if not args.quiet and not args.json:
-            print("Loading model and embeddings...", file=sys.stderr)
-
-        results = find_similar_templates(
-            spec_text,
-            args.top,
-            mode=args.mode,
-            query_text=args.query,
-            min_score=args.min_score
-        )
+        results = None
+        if args.server:
+            # The server scores at the precision it was started with
+            try:
+                results = query_server(args.server, request)
+            except ConnectionError as e:
+                print(f"Warning: {e}; running the query in-process", file=sys.stderr)
+
+        if results is None:
+            # Find similar templates
+            if not args.quiet and not args.json:
+                print("Loading model and embeddings...", file=sys.stderr)
+            load_embeddings(args.precision)
+            results = find_similar_templates(**request)
 
         # Format and output results
         output = format_results(results, as_json=args.json, mode=args.mode)
@@ -2,174 +2,517 @@
 """
 Generate Similar MicroSims Lookup File
 
-Reads the embeddings file and precomputes the top N most similar MicroSims
+Reads the embeddings store and precomputes the top N most similar MicroSims
 for each MicroSim. Outputs a compact JSON file for use by the web application.
 
+Similarities are computed one block of rows at a time and reduced to the top
+N per row with np.argpartition, so the full N x N matrix is never held in
+memory: peak usage is about BLOCK_MEMORY_MB regardless of catalog size.
+
+With --index ann the neighbors come from the IVF index built by
+src/embeddings/build-ann-index.py instead: each sim is compared only with the
+sims in its nearest k-means lists, trading a little recall for speed on large
+catalogs.
+
+The default output is compact (schema "similar-v2"): one table of sim IDs
+(URLs), then for every sim its neighbors as integer positions in that table
+and its scores quantized to uint8 over the file's score range. With --shards
+the sims are split by the first hex characters of an FNV-1a hash of their ID
+into small files, each with its own ID table, and similar-microsims.json
+becomes a manifest; the viewer then fetches only the shard for the sim being
+viewed. --format legacy writes the original {url: [{url, score}]} map.
+
+--report also prints the size (raw and gzipped) and parse time of the legacy
+and compact payloads and of the average shard, so the saving is visible. The
+formats not selected are written to scratch files for it, so it is off by
+default.
+
+Each run also saves its float32 neighbor lists, with the URL and a digest of
+the vector of every row, to data/similar-neighbors.npz. With --incremental the
+next run compares against them: only sims that are new or whose vector
+changed, plus sims that lost a neighbor to such a change or a removal, are
+searched in full. Every other list is kept and patched with one
+(new/changed x all) product, which finds new vectors that enter its top N.
+The cost is then about (changed x N) instead of N^2.
+
 Usage:
     python src/generate-similar-microsims.py
+    python src/generate-similar-microsims.py --index ann [--nprobe 16]
+    python src/generate-similar-microsims.py --shards 16       # or 256
+    python src/generate-similar-microsims.py --format legacy
+    python src/generate-similar-microsims.py --incremental
+    python src/generate-similar-microsims.py --shards 16 --report
 
 Output:
     docs/search/similar-microsims.json
+    docs/search/similar-microsims/<prefix>.json   (--shards)
 """
 
+import argparse
+import gzip
+import hashlib
 import json
 import os
+import sys
 import tempfile
+import time
 import numpy as np
 from pathlib import Path
 from datetime import datetime, timezone
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / "embeddings"))
+from embedding_store import load_store, STORE_DIR  # noqa: E402
+from ann_index import load_index  # noqa: E402
+from json_stream import LazyObject, NumberArray, dump_stream  # noqa: E402
+
+# Configuration
+NUM_SIMILAR = 10  # Number of similar MicroSims to store per item
+BLOCK_MEMORY_MB = 64  # Budget for one block of the similarity matrix
+EMBEDDINGS_PATH = STORE_DIR
+OUTPUT_PATH = Path("docs/search/similar-microsims.json")
+SHARD_DIR = OUTPUT_PATH.with_suffix("")  # docs/search/similar-microsims/
+SCHEMA_COMPACT = "similar-v2"
+SCHEMA_SHARDED = "similar-v2-sharded"
+SHARD_COUNTS = {16: 1, 256: 2}  # shards -> hex prefix characters
+STATE_PATH = Path("data/similar-neighbors.npz")
+STATE_SCHEMA = "similar-neighbors-v1"
+
+
+def top_k_similar(normalized: np.ndarray, k: int,
+                  block_memory_mb: int = BLOCK_MEMORY_MB,
+                  rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the k most similar rows for every row, excluding itself.
 
-def atomic_write_json(path: Path, obj, **dump_kwargs):
-    """Write JSON atomically (temp file in same dir + os.replace)."""
+    Args:
+        normalized: L2-normalized embeddings of shape (n_items, embedding_dim),
+                    so cosine similarity is a plain dot product
+        k: Number of neighbors per row
+        block_memory_mb: Memory budget for one (block, n_items) slice of
+                         the similarity matrix
+        rows: Only search for these rows (default: all of them)
+
+    Returns:
+        (indices, scores), each of shape (len(rows), k), sorted by descending
+        similarity within each row
+    """
+    n = normalized.shape[0]
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+    k = min(k, n - 1)
+    indices = np.empty((len(rows), k), dtype=np.int64)
+    scores = np.empty((len(rows), k), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+
+    block = max(1, (block_memory_mb * 1024 * 1024) // (4 * n))
+    for start in range(0, len(rows), block):
+        end = min(start + block, len(rows))
+        query = rows[start:end]
+        sims = normalized[query] @ normalized.T  # (block, n)
+        sims[np.arange(end - start), query] = -np.inf  # Skip self
+
+        # Unordered top k per row, then sort just those k
+        part = np.argpartition(sims, -k, axis=1)[:, -k:]
+        part_scores = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        indices[start:end] = np.take_along_axis(part, order, axis=1)
+        scores[start:end] = np.take_along_axis(part_scores, order, axis=1)
+
+        if end // 1000 > start // 1000:
+            print(f"  Processed {end}/{len(rows)} MicroSims...")
+
+    return indices, scores
+
+
+def ann_top_k_similar(index, matrix, k: int, nprobe: int = None,
+                      batch: int = 1024, rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Approximate top_k_similar() using the IVF index.
+
+    Rows whose probed lists hold fewer than k other sims get index -1
+    (score -inf) in the unused slots.
+    """
+    n = matrix.shape[0]
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+    k = min(k, n - 1)
+    indices = np.empty((len(rows), k), dtype=np.int64)
+    scores = np.empty((len(rows), k), dtype=np.float32)
+    for start in range(0, len(rows), batch):
+        end = min(start + batch, len(rows))
+        query = rows[start:end]
+        indices[start:end], scores[start:end] = index.search(
+            matrix, matrix[query], k, nprobe=nprobe, exclude_rows=query)
+        if end // 1000 > start // 1000:
+            print(f"  Processed {end}/{len(rows)} MicroSims...")
+    return indices, scores
+
+
+def vector_digests(matrix: np.ndarray) -> np.ndarray:
+    """64-bit digest of every row's float32 bytes, to spot changed vectors."""
+    return np.array([
+        int.from_bytes(hashlib.blake2b(np.ascontiguousarray(row).tobytes(), digest_size=8).digest(), "little")
+        for row in matrix], dtype=np.uint64)
+
+
+def save_neighbors(path: Path, urls: list, digests: np.ndarray,
+                   indices: np.ndarray, scores: np.ndarray, settings: dict):
+    """Write the float32 neighbor lists atomically as a .npz for --incremental."""
     path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
     fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(obj, f, **dump_kwargs)
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, urls=np.array(urls, dtype=str), digests=digests,
+                     indices=indices.astype(np.int32), scores=scores.astype(np.float32),
+                     meta=np.array(json.dumps(dict(settings, schema=STATE_SCHEMA))))
         os.replace(tmp, path)
     finally:
         if os.path.exists(tmp):
             os.remove(tmp)
 
-# Configuration
-NUM_SIMILAR = 10  # Number of similar MicroSims to store per item
-EMBEDDINGS_PATH = Path("data/microsims-embeddings.json")
-OUTPUT_PATH = Path("docs/search/similar-microsims.json")
 
+def load_neighbors(path: Path, settings: dict):
+    """The saved neighbor lists as a dict of arrays, or None if missing,
+    unreadable or made with other settings (model, k, index, nprobe)."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("schema") != STATE_SCHEMA or any(meta.get(k) != v for k, v in settings.items()):
+                return None
+            return {k: data[k] for k in ("urls", "digests", "indices", "scores")}
+    except (OSError, ValueError, KeyError):
+        return None
 
-def get_what_vector(entry):
-    """
-    Extract the WHAT vector from an embeddings entry.
 
-    Supports the dual-v1 schema ({"what": [...], "how": [...]}) and the
-    legacy flat format (a plain list). "Similar MicroSims" on the website
-    means "teaches a related concept", so the WHAT vector is the right one.
+def update_neighbors(prev: dict, urls: list, matrix: np.ndarray, digests: np.ndarray,
+                     k: int, search, block_memory_mb: int = BLOCK_MEMORY_MB):
     """
-    if isinstance(entry, dict):
-        return entry["what"]
-    return entry
+    Bring the saved neighbor lists up to date with the current sims.
 
+    Sims whose URL is new or whose vector changed are searched in full with
+    *search(rows)*, as are unchanged sims that lost a neighbor (removed or
+    changed): another sim may now belong in their top k. Every other sim
+    keeps its list, renumbered, merged with its scores against the new and
+    changed sims. Returns (indices, scores, counts).
+    """
+    n = len(urls)
+    old_row = {u: i for i, u in enumerate(prev["urls"].tolist())}
+    old_of_new = np.full(n, -1, dtype=np.int64)
+    new_of_old = np.full(len(old_row) + 1, -1, dtype=np.int64)  # last slot: empty (-1) neighbors
+    for i, u in enumerate(urls):
+        j = old_row.get(u)
+        if j is not None and prev["digests"][j] == digests[i]:
+            old_of_new[i] = j
+            new_of_old[j] = i
+    changed = np.flatnonzero(old_of_new < 0)
+    kept = np.flatnonzero(old_of_new >= 0)
+
+    old_lists = prev["indices"][old_of_new[kept]].astype(np.int64)
+    mapped = new_of_old[old_lists]  # -1 index hits the empty slot
+    lost = ((old_lists >= 0) & (mapped < 0)).any(axis=1)
+    recompute = np.union1d(changed, kept[lost])
+    patch = kept[~lost]
+
+    indices = np.full((n, k), -1, dtype=np.int64)
+    scores = np.full((n, k), -np.inf, dtype=np.float32)
+    if len(recompute):
+        indices[recompute], scores[recompute] = search(recompute)
+    indices[patch] = mapped[~lost]
+    scores[patch] = prev["scores"][old_of_new[patch]]
+
+    if len(patch) and len(changed):
+        # Do any new or changed vectors enter the kept lists' top k?
+        new_vectors = matrix[changed]
+        block = max(1, (block_memory_mb * 1024 * 1024) // (4 * (len(changed) + k)))
+        for start in range(0, len(patch), block):
+            rows = patch[start:start + block]
+            cand_scores = np.concatenate([scores[rows], matrix[rows] @ new_vectors.T], axis=1)
+            cand_indices = np.concatenate([indices[rows], np.broadcast_to(changed, (len(rows), len(changed)))],
+                                          axis=1)
+            order = np.argsort(-cand_scores, axis=1, kind="stable")[:, :k]
+            indices[rows] = np.take_along_axis(cand_indices, order, axis=1)
+            scores[rows] = np.take_along_axis(cand_scores, order, axis=1)
+
+    counts = {"changed": len(changed), "removed": len(old_row.keys() - set(urls)),
+              "recomputed": len(recompute), "patched": len(patch)}
+    return indices, scores, counts
+
+
+def fnv1a_32(text: str) -> int:
+    """32-bit FNV-1a hash of the UTF-8 bytes (mirrored in the viewer's script.js)."""
+    h = 0x811C9DC5
+    for byte in text.encode("utf-8"):
+        h = ((h ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return h
+
+
+def shard_of(sim_id: str, prefix_chars: int) -> str:
+    return f"{fnv1a_32(sim_id):08x}"[:prefix_chars]
+
+
+def quantize_scores(indices: np.ndarray, scores: np.ndarray) -> tuple[np.ndarray, float, float]:
+    """
+    Scores as uint8 codes over [lo, hi], the range of the real neighbors.
 
-def cosine_similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
+    score ~= lo + code * (hi - lo) / 255; empty slots (index -1) get code 0.
+    """
+    valid = indices >= 0
+    lo = float(scores[valid].min()) if valid.any() else 0.0
+    hi = float(scores[valid].max()) if valid.any() else 1.0
+    span = (hi - lo) or 1.0
+    codes = np.where(valid, np.rint((np.where(valid, scores, lo) - lo) / span * 255), 0)
+    return codes.astype(np.uint8), round(lo, 6), round(hi, 6)
+
+
+def legacy_payload(urls: list, indices: np.ndarray, scores: np.ndarray, metadata: dict) -> dict:
+    """The original format: {url: [{url, score}, ...]} keyed by full URLs (streamed)."""
+    similar_lookup = (
+        (url, [
+            {
+                "url": urls[j],
+                "score": round(float(score), 4)  # Round to 4 decimal places
+            }
+            for j, score in zip(indices[i], scores[i])
+            if j >= 0
+        ])
+        for i, url in enumerate(urls)
+    )
+    return {"metadata": metadata, "similar": LazyObject(similar_lookup)}
+
+
+def compact_payload(urls: list, indices: np.ndarray, codes: np.ndarray, metadata: dict) -> dict:
     """
-    Compute cosine similarity matrix for all embeddings.
+    One ID table plus flat neighbor/score arrays: row i's neighbors are
+    neighbors[i*k:(i+1)*k] (positions in ids, -1 = none), k = metadata["k"].
+    """
+    return {
+        "metadata": dict(metadata, schema=SCHEMA_COMPACT),
+        "ids": list(urls),
+        "neighbors": NumberArray(indices),
+        "scores": NumberArray(codes),
+    }
 
-    Args:
-        embeddings: numpy array of shape (n_items, embedding_dim)
 
-    Returns:
-        Similarity matrix of shape (n_items, n_items)
+def shard_payloads(urls: list, indices: np.ndarray, codes: np.ndarray, metadata: dict,
+                   prefix_chars: int) -> tuple[dict, object]:
+    """
+    (manifest, iterator of (prefix, shard)) for sharded output; each shard is
+    built only when the iterator reaches it.
+
+    Each shard lists its sims as "sources" (positions in its own ids
+    table, which also holds their neighbors), so a shard is usable alone.
     """
-    # Normalize embeddings to unit vectors
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    normalized = embeddings / norms
+    by_shard = {}
+    for i, url in enumerate(urls):
+        by_shard.setdefault(shard_of(url, prefix_chars), []).append(i)
+
+    def shards():
+        for prefix, rows in sorted(by_shard.items()):
+            local = {}
+            for i in rows:
+                local.setdefault(i, len(local))
+            neighbors = indices[rows].ravel().tolist()
+            for j in neighbors:
+                if j >= 0:
+                    local.setdefault(j, len(local))
+            yield prefix, {
+                "ids": [urls[i] for i in local],
+                "sources": [local[i] for i in rows],
+                "neighbors": [local[j] if j >= 0 else -1 for j in neighbors],
+                "scores": NumberArray(codes[rows]),
+            }
+
+    manifest = {
+        "metadata": dict(metadata, schema=SCHEMA_SHARDED, shard_dir=SHARD_DIR.name,
+                         prefix_chars=prefix_chars, shards=len(by_shard)),
+    }
+    return manifest, shards()
+
 
-    # Cosine similarity is just dot product of normalized vectors
-    similarity_matrix = np.dot(normalized, normalized.T)
+def payload_stats(name: str, path: Path) -> dict:
+    """Raw and gzipped size, and JSON parse time, of one written payload."""
+    data = Path(path).read_bytes()
+    start = time.perf_counter()
+    json.loads(data)
+    parse_ms = (time.perf_counter() - start) * 1000
+    return {"payload": name, "bytes": len(data), "gzip_bytes": len(gzip.compress(data, 6)),
+            "parse_ms": parse_ms}
 
-    return similarity_matrix
+
+def format_size(size: float) -> str:
+    if size > 1024 * 1024:
+        return f"{size / (1024 * 1024):.2f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+def print_payload_report(rows: list):
+    """Table comparing what one page view downloads and parses, per format."""
+    base = rows[0]
+    print(f"  {'Payload':<32} {'Raw':>10} {'Gzipped':>10} {'Parse':>9} {'vs legacy':>10}")
+    for r in rows:
+        print(f"  {r['payload']:<32} {format_size(r['bytes']):>10} {format_size(r['gzip_bytes']):>10} "
+              f"{r['parse_ms']:>7.1f}ms {r['gzip_bytes'] / base['gzip_bytes']:>10.1%}")
+
+
+def write_shards(manifest: dict, shards) -> list:
+    """
+    Stream the shard files, switch the manifest over, then drop the shards
+    it no longer names (a client holding the old manifest can still fetch
+    them until the switch).
+    """
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    written = []
+    for prefix, shard in shards:
+        dump_stream(SHARD_DIR / f"{prefix}.json", shard)
+        written.append(SHARD_DIR / f"{prefix}.json")
+    dump_stream(OUTPUT_PATH, manifest)
+    names = {path.name for path in written}
+    for old in SHARD_DIR.glob("*.json"):
+        if old.name not in names:
+            old.unlink()
+    return written
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Precompute the top similar MicroSims for each MicroSim")
+    parser.add_argument("--index", choices=["exact", "ann"], default="exact",
+                        help="Exact blocked search (default) or the approximate IVF index")
+    parser.add_argument("--nprobe", type=int, default=None,
+                        help="Lists probed per sim with --index ann (default: the index's own)")
+    parser.add_argument("--format", choices=["compact", "legacy"], default="compact",
+                        help="Compact ID-table format (default) or the original URL-keyed map")
+    parser.add_argument("--shards", type=int, choices=sorted(SHARD_COUNTS), default=None,
+                        help="Split the compact output into this many hash-prefix shards")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Only re-search sims that changed since the last run (state: {STATE_PATH})")
+    parser.add_argument("--report", action="store_true",
+                        help="Compare size and parse time of every output format (writes scratch copies)")
+    args = parser.parse_args()
+    if args.shards and args.format == "legacy":
+        parser.error("--shards needs --format compact")
+
     print("=" * 60)
     print("Similar MicroSims Generator")
     print("=" * 60)
     print(f"Input:  {EMBEDDINGS_PATH}")
     print(f"Output: {OUTPUT_PATH}")
     print(f"Top N:  {NUM_SIMILAR}")
+    print(f"Index:  {args.index}")
+    print(f"Format: {args.format}" + (f", {args.shards} shards" if args.shards else ""))
     print()
 
-    # Load embeddings
+    # Load embeddings (dual-v2 store, or the dual-v1 JSON as a fallback)
     print("Loading embeddings...")
-    with open(EMBEDDINGS_PATH, 'r') as f:
-        data = json.load(f)
-
-    metadata = data['metadata']
-    embeddings_dict = data['embeddings']
+    store = load_store()
+    metadata = store.metadata
 
     print(f"  Model: {metadata['model']}")
     print(f"  Dimension: {metadata['dimension']}")
     print(f"  Count: {metadata['count']}")
     print()
 
-    # Convert to numpy arrays
-    print("Building similarity matrix...")
-    urls = list(embeddings_dict.keys())
-    embeddings = np.array([get_what_vector(embeddings_dict[url]) for url in urls])
-
+    # "Similar MicroSims" on the website means "teaches a related concept",
+    # so the WHAT vectors are the right ones. Store rows are L2-normalized.
+    urls = store.urls
+    embeddings = np.asarray(store.what, dtype=np.float32)
     print(f"  Embeddings shape: {embeddings.shape}")
-
-    # Compute similarity matrix
-    similarity_matrix = cosine_similarity_matrix(embeddings)
-    print(f"  Similarity matrix shape: {similarity_matrix.shape}")
     print()
 
-    # For each MicroSim, find top N similar (excluding self)
+    # For each MicroSim, find top N similar (excluding self), block by block
     print(f"Finding top {NUM_SIMILAR} similar MicroSims for each item...")
-    similar_lookup = {}
-
-    for i, url in enumerate(urls):
-        # Get similarities for this item
-        similarities = similarity_matrix[i]
-
-        # Get indices sorted by similarity (descending)
-        # argsort returns ascending, so we reverse
-        sorted_indices = np.argsort(similarities)[::-1]
-
-        # Skip self (index 0 after sorting, which has similarity 1.0)
-        # Take top N similar items
-        top_similar = []
-        for idx in sorted_indices:
-            if idx == i:  # Skip self
-                continue
-            if len(top_similar) >= NUM_SIMILAR:
-                break
-
-            similar_url = urls[idx]
-            score = float(similarities[idx])  # Convert from numpy
-
-            top_similar.append({
-                "url": similar_url,
-                "score": round(score, 4)  # Round to 4 decimal places
-            })
-
-        similar_lookup[url] = top_similar
-
-        # Progress indicator
-        if (i + 1) % 100 == 0:
-            print(f"  Processed {i + 1}/{len(urls)} MicroSims...")
+    settings = {"model": metadata['model'], "k": min(NUM_SIMILAR, len(urls) - 1), "index": args.index}
+    if args.index == "ann":
+        index = load_index("what", store)
+        nprobe = args.nprobe or index.nprobe
+        settings["nprobe"] = nprobe
+        print(f"  ANN index: {index.n_lists} lists, nprobe {nprobe}")
+
+        def search(rows=None):
+            return ann_top_k_similar(index, embeddings, NUM_SIMILAR, nprobe, rows=rows)
+    else:
+        def search(rows=None):
+            return top_k_similar(embeddings, NUM_SIMILAR, rows=rows)
+
+    digests = vector_digests(embeddings)
+    previous = load_neighbors(STATE_PATH, settings) if args.incremental else None
+    if args.incremental and previous is None:
+        print(f"  No usable previous run in {STATE_PATH}; searching every sim")
+    if previous is not None:
+        top_indices, top_scores, counts = update_neighbors(
+            previous, urls, embeddings, digests, settings["k"], search)
+        print(f"  Incremental: {counts['changed']} new/changed, {counts['removed']} removed; "
+              f"{counts['recomputed']} searched in full, {counts['patched']} patched")
+    else:
+        top_indices, top_scores = search()
+    save_neighbors(STATE_PATH, urls, digests, top_indices, top_scores, settings)
 
     print(f"  Processed {len(urls)}/{len(urls)} MicroSims")
     print()
 
     # Build output structure
-    output = {
-        "metadata": {
-            "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "source_model": metadata['model'],
-            "num_similar": NUM_SIMILAR,
-            "count": len(urls)
-        },
-        "similar": similar_lookup
+    output_metadata = {
+        "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "source_model": metadata['model'],
+        "num_similar": NUM_SIMILAR,
+        "index": args.index,
+        "count": len(urls)
+    }
+    codes, lo, hi = quantize_scores(top_indices, top_scores)
+    # k is the row stride of the flat arrays: fewer than NUM_SIMILAR on small catalogs
+    compact_metadata = dict(output_metadata, k=top_indices.shape[1], score_min=lo, score_max=hi)
+    # Payloads are lazy and single-use, so each write builds a fresh one
+    payloads = {
+        "legacy": lambda: legacy_payload(urls, top_indices, top_scores, output_metadata),
+        "compact": lambda: compact_payload(urls, top_indices, codes, compact_metadata),
     }
 
-    # Save output
+    # Save output: payloads are streamed to disk, never built as one string
     print(f"Saving to {OUTPUT_PATH}...")
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    atomic_write_json(OUTPUT_PATH, output, separators=(',', ':'))  # Compact JSON
-
-    # Calculate file size
-    file_size = OUTPUT_PATH.stat().st_size
-    if file_size > 1024 * 1024:
-        size_str = f"{file_size / (1024 * 1024):.2f} MB"
+    if args.shards:
+        manifest, shards = shard_payloads(urls, top_indices, codes, compact_metadata,
+                                          SHARD_COUNTS[args.shards])
+        shard_paths = write_shards(manifest, shards)
+        print(f"  Shards: {len(shard_paths)} files in {SHARD_DIR}")
     else:
-        size_str = f"{file_size / 1024:.1f} KB"
+        dump_stream(OUTPUT_PATH, payloads[args.format]())
+        for old in SHARD_DIR.glob("*.json"):  # From an earlier --shards run
+            old.unlink()
 
+    # Calculate file size
+    size_str = format_size(OUTPUT_PATH.stat().st_size)
     print(f"  File size: {size_str}")
     print()
 
+    if args.report:
+        # The single-file payloads not written above are measured from scratch files
+        with tempfile.TemporaryDirectory() as scratch:
+            report = []
+            for fmt, build in payloads.items():
+                path = OUTPUT_PATH
+                if args.shards or args.format != fmt:
+                    path = Path(scratch) / f"{fmt}.json"
+                    dump_stream(path, build())
+                report.append(payload_stats(f"{fmt} (one file)", path))
+        if args.shards:
+            # One page view fetches the manifest and a single shard
+            views = [payload_stats("", path) for path in shard_paths]
+            head = payload_stats("", OUTPUT_PATH)
+            report.append({
+                "payload": f"sharded (manifest + 1 of {len(shard_paths)})",
+                "bytes": head["bytes"] + sum(v["bytes"] for v in views) / len(views),
+                "gzip_bytes": head["gzip_bytes"] + sum(v["gzip_bytes"] for v in views) / len(views),
+                "parse_ms": head["parse_ms"] + sum(v["parse_ms"] for v in views) / len(views),
+            })
+
+        print("Payload per page view:")
+        print_payload_report(report)
+        print()
+
     # Summary
     print("=" * 60)
     print("Summary:")
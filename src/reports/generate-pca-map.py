@@ -3,7 +3,7 @@
 Generate 2D PCA data for MicroSim embeddings visualization.
 
 This script:
-1. Loads 384-dimensional embeddings from microsims-embeddings.json
+1. Loads 384-dimensional embeddings from the embeddings store (data/microsims-embeddings/)
 2. Loads metadata from microsims-data.json
 3. Loads subject mapping from config/subject-mapping.json
 4. Applies PCA to reduce to 2 dimensions
@@ -33,9 +33,13 @@ from sklearn.decomposition import PCA
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "embeddings"))
+from embedding_store import load_store, store_exists, STORE_DIR, JSON_PATH  # noqa: E402
+from microsim_ids import catalog_rows  # noqa: E402
+
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-EMBEDDINGS_PATH = PROJECT_ROOT / "data" / "microsims-embeddings.json"
+EMBEDDINGS_PATH = STORE_DIR if store_exists(STORE_DIR) else JSON_PATH
 MICROSIMS_PATH = PROJECT_ROOT / "docs" / "search" / "microsims-data.json"
 SUBJECT_MAPPING_PATH = PROJECT_ROOT / "config" / "subject-mapping.json"
 OUTPUT_DIR = PROJECT_ROOT / "docs" / "sims" / "pca-map"
@@ -69,29 +73,23 @@ def init_subject_config():
     SUBJECT_COLORS[SUBJECT_CONFIG['default']['name']] = SUBJECT_CONFIG['default']['color']
 
 
-def load_embeddings(path: Path) -> dict:
-    """Load embeddings from JSON file."""
+def load_embeddings(path: Path):
+    """Load the embeddings store (dual-v2 directory or dual-v1 JSON)."""
     print(f"Loading embeddings from {path}...")
-    with open(path, 'r') as f:
-        data = json.load(f)
-    print(f"  Loaded {data['metadata']['count']} embeddings ({data['metadata']['dimension']}D)")
-    return data
+    store = load_store(path)
+    print(f"  Loaded {len(store)} embeddings ({store.metadata['dimension']}D)")
+    return store
 
 
-def load_microsims(path: Path) -> dict:
-    """Load MicroSims metadata and index by URL."""
+def load_microsims(path: Path, store) -> list:
+    """Load MicroSims metadata: the catalog entry for each store row, joined on sim IDs."""
     print(f"Loading MicroSims metadata from {path}...")
     with open(path, 'r') as f:
         microsims = json.load(f)
 
-    by_url = {}
-    for sim in microsims:
-        url = sim.get('url') or sim.get('identifier')
-        if url:
-            by_url[url] = sim
-
-    print(f"  Loaded {len(microsims)} MicroSims, {len(by_url)} with URLs")
-    return by_url
+    rows = catalog_rows(store, microsims)
+    print(f"  Loaded {len(microsims)} MicroSims, {sum(1 for sim in rows if sim)} matched to embeddings")
+    return rows
 
 
 def normalize_subject(raw_subject: str) -> str:
@@ -158,25 +156,13 @@ def get_subject(sim: dict) -> str:
     return 'Other'
 
 
-def get_what_vector(entry):
-    """
-    Extract the WHAT vector from an embeddings entry.
-
-    Supports the dual-v1 schema ({"what": [...], "how": [...]}) and the
-    legacy flat format (a plain list). The map should cluster by subject
-    matter, so the WHAT vector is used.
-    """
-    if isinstance(entry, dict):
-        return entry["what"]
-    return entry
-
-
-def apply_pca(embeddings_dict: dict) -> tuple:
+def apply_pca(store) -> tuple:
     """Apply PCA to reduce embeddings to 2D."""
     print("Applying PCA dimensionality reduction (384D → 2D)...")
 
-    urls = list(embeddings_dict.keys())
-    embeddings_matrix = np.array([get_what_vector(embeddings_dict[url]) for url in urls])
+    # The map should cluster by subject matter, so the WHAT vectors are used
+    urls = store.urls
+    embeddings_matrix = np.asarray(store.what, dtype=np.float32)
 
     print(f"  Input shape: {embeddings_matrix.shape}")
 
@@ -190,12 +176,11 @@ def apply_pca(embeddings_dict: dict) -> tuple:
     return urls, coords_2d, explained_variance
 
 
-def build_dataframe(urls: list, coords_2d: np.ndarray, microsims: dict) -> list:
+def build_dataframe(urls: list, coords_2d: np.ndarray, microsims: list) -> list:
     """Build list of point data for plotting."""
     points = []
 
-    for i, url in enumerate(urls):
-        sim = microsims.get(url, {})
+    for i, (url, sim) in enumerate(zip(urls, microsims)):
         subject = get_subject(sim)
         title = sim.get('title', 'Unknown MicroSim')
         source = sim.get('_source', {})
@@ -346,7 +331,7 @@ def main():
         print(f"ERROR: Subject mapping config not found: {SUBJECT_MAPPING_PATH}")
         sys.exit(1)
 
-    if not EMBEDDINGS_PATH.exists():
+    if not store_exists(EMBEDDINGS_PATH):
         print(f"ERROR: Embeddings file not found: {EMBEDDINGS_PATH}")
         sys.exit(1)
 
@@ -359,10 +344,10 @@ def main():
 
     # Load data
     embeddings_data = load_embeddings(EMBEDDINGS_PATH)
-    microsims = load_microsims(MICROSIMS_PATH)
+    microsims = load_microsims(MICROSIMS_PATH, embeddings_data)
 
     # Apply PCA
-    urls, coords_2d, explained_variance = apply_pca(embeddings_data['embeddings'])
+    urls, coords_2d, explained_variance = apply_pca(embeddings_data)
 
     # Build point data
     points = build_dataframe(urls, coords_2d, microsims)
@@ -12,7 +12,9 @@ Usage:
     python src/update-local-microsims.py --list            # List available repos
 
 Output:
-    - Updates docs/search/microsims-data.json with new/changed metadata
+    - Updates docs/search/microsims-data.json with new/changed metadata,
+      stamping each entry with its canonical "sim_id" and "url"
+    - Adds new sims to the canonical ID table data/microsim-ids.json
     - Logs activity to logs/local-update-YYYY-MM-DD.jsonl
 """
 
@@ -24,6 +26,9 @@ import tempfile
 from datetime import datetime, timezone
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / "embeddings"))
+from microsim_ids import MicrosimIds, ID_TABLE_PATH  # noqa: E402
+
 
 def atomic_write_json(path: Path, obj, **dump_kwargs):
     """Write JSON atomically (temp file in same dir + os.replace) so a
@@ -61,7 +66,8 @@ class LocalRepoUpdater:
             "metadata_missing": 0,
             "added": 0,
             "updated": 0,
-            "errors": 0
+            "errors": 0,
+            "ids_assigned": 0
         }
 
     def log(self, event_type: str, data: dict):
@@ -296,6 +302,11 @@ class LocalRepoUpdater:
             # Merge and save
             merged_data = self.merge_metadata()
 
+            # Canonical IDs: the table is written first, as the catalog refers to it
+            id_table = MicrosimIds.load()
+            self.stats["ids_assigned"] = id_table.stamp(merged_data)
+            id_table.save()
+
             OUTPUT_JSON.parent.mkdir(parents=True, exist_ok=True)
             atomic_write_json(OUTPUT_JSON, merged_data, indent=2)
 
@@ -313,9 +324,11 @@ class LocalRepoUpdater:
         print(f"Entries added:     {self.stats['added']}")
         print(f"Entries updated:   {self.stats['updated']}")
         print(f"Errors:            {self.stats['errors']}")
+        print(f"New sim IDs:       {self.stats['ids_assigned']}")
         print(f"Total entries:     {len(merged_data)}")
         print()
         print(f"Output written to: {OUTPUT_JSON}")
+        print(f"Sim ID table:      {ID_TABLE_PATH}")
 
 
 def list_available_repos(workspace: Path):
@@ -1,46 +1,412 @@
 #!/usr/bin/env python3
 """
-Single Repository MicroSim Metadata Updater
+Repository MicroSim Metadata Updater
 
-Fetches metadata.json files from a single GitHub repository and
+Fetches metadata.json files from one or more GitHub repositories and
 updates the combined microsims-data.json file. Handles duplicates
-by replacing existing entries for the same repo/sim combination.
+by replacing existing entries for the same owner/repo/sim combination.
+
+Several repositories (listed, read from --repos-file, or every repository
+of an --owner) are crawled concurrently, sharing one pool of in-flight
+requests and one rate budget. Their results are merged into the catalog in
+memory and the catalog is written once, atomically, at the end.
+
+Sims are discovered with one recursive Git Trees request, which lists every
+docs/sims/*/metadata.json, so only existing metadata files are fetched.
+They are fetched concurrently (--concurrency, default 8)
+through github_fetch.py, which paces requests by GitHub's rate-limit headers
+and retries 429/5xx responses with backoff. Set GITHUB_API_URL and
+GITHUB_RAW_URL to crawl a local stand-in server instead of GitHub.
+
+Responses are cached in data/github-cache.sqlite (github_cache.py): a
+metadata.json whose blob SHA in the tree matches the cached copy is not
+requested at all, and other cached URLs are revalidated with conditional
+requests, whose 304s do not count against the rate limit. Cache hits,
+misses and bytes saved are logged with the run. --no-cache disables it.
+
+Every fetched sim is checkpointed in data/repo-crawl-journal.jsonl (with the
+blob SHA of its content), and every finished repo after it. A crawl cut
+short by a rate limit, network failure or Ctrl-C leaves the catalog
+untouched and exits with a non-zero status; the same command resumes it,
+skipping sims already fetched whose file is unchanged, and merges only once
+every repo is complete. --restart discards the checkpoint.
 
 Usage:
     python src/update-repo-microsims.py <owner/repo>
     python src/update-repo-microsims.py dmccreary/geometry-course
+    python src/update-repo-microsims.py dmccreary/geometry-course --concurrency 16
+    python src/update-repo-microsims.py dmccreary/geometry-course --no-cache
+    python src/update-repo-microsims.py dmccreary/geometry-course dmccreary/calculus
+    python src/update-repo-microsims.py --repos-file config/course-repos.txt
+    python src/update-repo-microsims.py --owner dmccreary
+    python src/update-repo-microsims.py --owner dmccreary --restart
 
 Output:
-    - Updates docs/search/microsims-data.json with new/changed metadata
+    - Updates docs/search/microsims-data.json with new/changed metadata,
+      stamping each entry with its canonical "sim_id" and "url"
+    - Adds new sims to the canonical ID table data/microsim-ids.json
     - Logs activity to logs/repo-update-YYYY-MM-DD.jsonl
+    - Keeps data/repo-crawl-journal.jsonl while a crawl is unfinished
 """
 
 import argparse
+import asyncio
 import json
 import os
 import re
 import sys
-import time
 from datetime import datetime, timezone
 from pathlib import Path
 
 import requests
 
-# Configuration
-GITHUB_API = "https://api.github.com"
-RAW_CONTENT_BASE = "https://raw.githubusercontent.com"
-REQUEST_DELAY = 0.5  # seconds between requests
+sys.path.insert(0, str(Path(__file__).resolve().parent / "embeddings"))
+from microsim_ids import MicrosimIds, ID_TABLE_PATH, DEFAULT_OWNER, GITHUB_URL_RE  # noqa: E402
+from github_fetch import (GitHubFetcher, FetchResult, SimTree, discover_sims,  # noqa: E402
+                          list_repos, DEFAULT_CONCURRENCY, RETRY_STATUSES)
+from github_cache import GitHubCache, CACHE_PATH, git_blob_sha  # noqa: E402
+from json_stream import dump_json  # noqa: E402
 
 # Paths relative to script location
 SCRIPT_DIR = Path(__file__).parent.parent
 OUTPUT_JSON = SCRIPT_DIR / "docs" / "search" / "microsims-data.json"
 LOG_DIR = SCRIPT_DIR / "logs"
+JOURNAL_PATH = SCRIPT_DIR / "data" / "repo-crawl-journal.jsonl"
+
+
+def source_key(item: dict):
+    """
+    (owner, repo, sim) of a catalog entry, or None without a repo. Entries
+    written before the owner was recorded take it from their github_url.
+    """
+    source = item.get("_source") or {}
+    if not source.get("repo"):
+        return None
+    owner = source.get("owner")
+    if not owner:
+        match = GITHUB_URL_RE.match(source.get("github_url") or "")
+        owner = match.group(1) if match else DEFAULT_OWNER
+    return owner.lower(), source["repo"], source.get("sim")
+
+
+def is_transient(response: FetchResult) -> bool:
+    """A failure a later run can expect to get past: network error, rate limit or 429/5xx."""
+    return response.status is None or response.rate_limited or response.status in RETRY_STATUSES
+
+
+class CrawlJournal:
+    """
+    Append-only checkpoint of a crawl in progress (JSONL):
+
+        {"type": "crawl", "targets": [...], "started": ...}      header
+        {"type": "sim", "repo", "sim", "sha", "metadata"}         one per fetched file
+        {"type": "repo", "repo", "sims_sha", "sims"}              one per finished repo
+
+    "sha" is the git blob SHA of the fetched content, so a sim is only
+    skipped on resume while the repo still lists that same file. Failed
+    fetches are not recorded and are retried. A journal for other targets
+    is discarded; the journal is deleted once the catalog has been written.
+    """
+
+    def __init__(self, path: Path, targets: list):
+        self.path = Path(path)
+        self.targets = sorted(targets)
+        self.sims = {}  # (repo, sim) -> entry
+        self.repos = {}  # repo -> entry
+        self.resumed = False
+        self._file = None
+
+    def open(self, restart: bool = False):
+        """Load a matching journal to resume from, or start a new one."""
+        entries = []
+        if self.path.exists() and not restart:
+            data = self.path.read_bytes()
+            # A crash can leave a partial last line: drop it before appending
+            complete = data[:data.rfind(b"\n") + 1]
+            if len(complete) < len(data):
+                with open(self.path, "r+b") as f:
+                    f.truncate(len(complete))
+            entries = [json.loads(line) for line in complete.decode("utf-8").splitlines() if line]
+        if entries and entries[0].get("type") == "crawl" and entries[0].get("targets") == self.targets:
+            self.resumed = True
+            for entry in entries[1:]:
+                if entry["type"] == "sim":
+                    self.sims[(entry["repo"], entry["sim"])] = entry
+                elif entry["type"] == "repo":
+                    self.repos[entry["repo"]] = entry
+            self._file = open(self.path, "a")
+            return
+        if entries and not restart:
+            print(f"Discarding the checkpoint of a different crawl ({', '.join(entries[0].get('targets', []))})")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w")
+        self._write({"type": "crawl", "targets": self.targets,
+                     "started": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")})
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def record_sim(self, repo: str, sim: str, sha: str, metadata: dict | None):
+        entry = {"type": "sim", "repo": repo, "sim": sim, "sha": sha, "metadata": metadata}
+        self.sims[(repo, sim)] = entry
+        self._write(entry)
+
+    def record_repo(self, repo: str, sims_sha: str | None, sims: list):
+        entry = {"type": "repo", "repo": repo, "sims_sha": sims_sha, "sims": sims}
+        self.repos[repo] = entry
+        self._write(entry)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """The crawl is merged: remove the journal."""
+        self.close()
+        self.path.unlink(missing_ok=True)
 
 
 class RepoUpdater:
-    def __init__(self, owner: str, repo: str):
+    """Crawls the sims of one repository; CatalogUpdater runs many at once."""
+
+    def __init__(self, owner: str, repo: str, fetcher: GitHubFetcher,
+                 cache: GitHubCache = None, log_file=None, journal: CrawlJournal = None):
         self.owner = owner
         self.repo = repo
+        self.fetcher = fetcher
+        self.cache = cache
+        self.log_file = log_file
+        self.journal = journal
+        self.tree = None
+        self.incomplete = False  # a request failed in a way a rerun can fix
+        self.new_metadata = []
+        self.stats = {
+            "sims_found": 0,
+            "metadata_found": 0,
+            "metadata_missing": 0,
+            "errors": 0,
+            "resumed": 0
+        }
+
+    @property
+    def name(self) -> str:
+        return f"{self.owner}/{self.repo}"
+
+    def log(self, event_type: str, data: dict):
+        """Write a log entry in JSONL format."""
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "event": event_type,
+            "repo": self.name,
+            **data
+        }
+        if self.log_file:
+            self.log_file.write(json.dumps(entry) + "\n")
+            self.log_file.flush()
+
+        if event_type in ["error", "missing_metadata"]:
+            print(f"  [{self.name} {event_type}] {data}")
+
+    async def get_sims_directories(self) -> SimTree | None:
+        """List the repo's sim directories and metadata.json files (one Git Trees request)."""
+        tree = await discover_sims(self.fetcher, self.owner, self.repo)
+        response = tree.response
+        if not tree.ok and is_transient(response):
+            self.incomplete = True
+
+        if response.status == 404:
+            print(f"{self.name}: repository or branch {tree.branch} not found")
+            self.log("error", {"message": "Repository or branch not found", "url": response.url})
+            self.stats["errors"] += 1
+            return None
+
+        if response.status == 409:  # Empty repository
+            return None
+
+        if response.status == 403 or response.rate_limited:
+            print(f"{self.name}: rate limited! Set GITHUB_TOKEN environment variable.")
+            self.log("error", {"message": "Rate limited", "url": response.url})
+            self.stats["errors"] += 1
+            return None
+
+        if not tree.ok:
+            self.log("error", {
+                "message": response.error or f"API error {response.status}",
+                "url": response.url
+            })
+            self.stats["errors"] += 1
+            return None
+
+        return tree
+
+    async def fetch_metadata(self, tree: SimTree, skip=()) -> dict:
+        """Fetch every existing metadata.json not in *skip* concurrently: {sim_name: FetchResult}."""
+        sim_names = [sim_name for sim_name in tree.sims if sim_name in tree.metadata and sim_name not in skip]
+        fetched, to_fetch = {}, []
+        for sim_name in sim_names:
+            url = tree.metadata_url(sim_name)
+            # Same blob SHA as the cached copy: the file is unchanged, skip the request
+            content = self.cache.blob(url, tree.metadata[sim_name]) if self.cache else None
+            if content is None:
+                to_fetch.append(sim_name)
+            else:
+                fetched[sim_name] = FetchResult(url, 200, content=content)
+        responses = await self.fetcher.fetch_all([tree.metadata_url(sim_name) for sim_name in to_fetch])
+        fetched.update(zip(to_fetch, responses))
+        return fetched
+
+    def parse_metadata(self, sim_name: str, response) -> dict | None:
+        """The metadata in one fetch result, or None (errors are logged)."""
+        if response.status == 404:
+            return None
+
+        if response.status != 200:
+            self.log("error", {
+                "sim": sim_name,
+                "message": response.error or f"HTTP error {response.status}",
+                "url": response.url
+            })
+            self.stats["errors"] += 1
+            return None
+
+        try:
+            return response.json()
+        except json.JSONDecodeError as e:
+            self.log("error", {
+                "sim": sim_name,
+                "message": f"Invalid JSON: {e}"
+            })
+            self.stats["errors"] += 1
+            return None
+
+    async def crawl(self):
+        """Discover and fetch the repo's sims into self.new_metadata, checkpointing each."""
+        done = self.journal.repos.get(self.name) if self.journal else None
+        if done is not None:
+            # Finished before the interruption: rebuild it from the journal
+            tree = SimTree(self.owner, self.repo)
+            tree.sims, tree.sims_sha = done["sims"], done["sims_sha"]
+            results = {sim_name: self.journal.sims[(self.name, sim_name)]["metadata"]
+                       for sim_name in tree.sims if (self.name, sim_name) in self.journal.sims}
+            self.stats["resumed"] += len(results)
+            self.tree = tree
+            if tree.sims:
+                print(f"{self.name}: {len(tree.sims)} sim directories, {len(results)} with metadata.json "
+                      f"(resumed from the checkpoint)")
+                self.add_results(tree, results)
+            return
+
+        tree = await self.get_sims_directories()
+        if not tree or not tree.sims:
+            if tree:
+                print(f"{self.name}: no sim directories found")
+            if self.journal and not self.incomplete:
+                self.journal.record_repo(self.name, tree.sims_sha if tree else None, [])
+            return
+        self.tree = tree
+
+        unchanged = bool(self.cache) and self.cache.tree_sha(self.name) == tree.sims_sha
+        if unchanged:
+            self.cache.stats["trees_unchanged"] += 1
+
+        # Sims fetched before an interruption, whose file is still the same, are not fetched again
+        results, pending = {}, set()
+        if self.journal:
+            for sim_name, sha in tree.metadata.items():
+                entry = self.journal.sims.get((self.name, sim_name))
+                if entry is not None and entry["sha"] == sha:
+                    results[sim_name] = entry["metadata"]
+            self.stats["resumed"] += len(results)
+
+        # Fetch the remaining metadata files at once, then process in listing order
+        fetched = await self.fetch_metadata(tree, skip=results)
+        print(f"{self.name}: {len(tree.sims)} sim directories, {len(tree.metadata)} with metadata.json"
+              + (" (docs/sims unchanged, served from the cache)" if unchanged else ""))
+        for sim_name, response in fetched.items():
+            if is_transient(response):
+                pending.add(sim_name)
+                continue
+            results[sim_name] = self.parse_metadata(sim_name, response)
+            if self.journal:
+                sha = git_blob_sha(response.content) if response.status == 200 else None
+                self.journal.record_sim(self.name, sim_name, sha, results[sim_name])
+        if pending:
+            # One entry for the lot: they are typically all the same rate limit
+            response = fetched[next(iter(pending))]
+            self.log("error", {
+                "message": f"{len(pending)} metadata fetches failed, left for the next run "
+                           f"({response.error or f'HTTP error {response.status}'})",
+                "url": response.url
+            })
+            self.stats["errors"] += 1
+            self.incomplete = True
+
+        self.add_results(tree, results, pending)
+
+        if not self.incomplete:
+            if self.journal:
+                self.journal.record_repo(self.name, tree.sims_sha, tree.sims)
+            if self.cache:
+                self.cache.set_tree_sha(self.name, tree.sims_sha)
+
+    def add_results(self, tree: SimTree, results: dict, pending: set = ()):
+        """Add the metadata of every listed sim, except those still *pending*, to self.new_metadata."""
+        for sim_name in tree.sims:
+            if sim_name in pending:
+                continue
+            self.stats["sims_found"] += 1
+            metadata = results.get(sim_name)
+
+            if metadata:
+                self.stats["metadata_found"] += 1
+
+                # Add source info
+                metadata["_source"] = {
+                    "owner": self.owner,
+                    "repo": self.repo,
+                    "sim": sim_name,
+                    "github_url": tree.github_url(sim_name)
+                }
+
+                # Ensure URL is set
+                if "identifier" in metadata and not metadata.get("url"):
+                    metadata["url"] = metadata["identifier"]
+                elif not metadata.get("url"):
+                    metadata["url"] = f"https://{self.owner}.github.io/{self.repo}/sims/{sim_name}/"
+
+                self.new_metadata.append(metadata)
+                print(f"  + {sim_name}")
+
+                self.log("metadata_found", {
+                    "sim": sim_name,
+                    "title": metadata.get("title", "Unknown")
+                })
+            else:
+                self.stats["metadata_missing"] += 1
+                print(f"  - {sim_name} (no metadata)")
+
+                self.log("missing_metadata", {
+                    "sim": sim_name,
+                    "github_url": tree.github_url(sim_name)
+                })
+
+
+class CatalogUpdater:
+    """
+    Crawls any number of repositories concurrently and merges them into the
+    catalog. All repos share one fetcher, so one pool of in-flight requests
+    and one rate budget per host, and the catalog is written once, atomically.
+    """
+
+    def __init__(self, repos: list, owners: list = (), concurrency: int = DEFAULT_CONCURRENCY,
+                 use_cache: bool = True, restart: bool = False):
+        self.repos = list(repos)  # (owner, repo) pairs
+        self.owners = list(owners)  # crawl every repo of these owners too
+        self.restart = restart  # ignore the checkpoint of an interrupted crawl
+        self.journal = None
+        self.incomplete = False
         self.session = requests.Session()
         self.session.headers.update({
             "Accept": "application/vnd.github.v3+json",
@@ -54,34 +420,36 @@ class RepoUpdater:
             print("Using GitHub token for authentication")
         else:
             print("Warning: No GITHUB_TOKEN set. Rate limits will be lower (60 req/hr)")
+        self.cache = GitHubCache() if use_cache else None
+        self.fetcher = GitHubFetcher(self.session, concurrency=concurrency, cache=self.cache)
 
         self.log_file = None
         self.existing_data = []
-        self.new_metadata = []
+        self.updaters = []
         self.stats = {
+            "repos": 0,
+            "repos_with_sims": 0,
             "sims_found": 0,
             "metadata_found": 0,
             "metadata_missing": 0,
             "added": 0,
             "updated": 0,
-            "errors": 0
+            "errors": 0,
+            "resumed": 0,
+            "ids_assigned": 0
         }
 
     def log(self, event_type: str, data: dict):
-        """Write a log entry in JSONL format."""
+        """Write a run-level log entry in JSONL format."""
         entry = {
             "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
             "event": event_type,
-            "repo": f"{self.owner}/{self.repo}",
             **data
         }
         if self.log_file:
             self.log_file.write(json.dumps(entry) + "\n")
             self.log_file.flush()
 
-        if event_type in ["error", "missing_metadata"]:
-            print(f"  [{event_type}] {data}")
-
     def load_existing_data(self):
         """Load existing microsims-data.json if it exists."""
         if OUTPUT_JSON.exists():
@@ -92,77 +460,42 @@ class RepoUpdater:
             self.existing_data = []
             print("No existing data file found, starting fresh")
 
-    def get_sims_directories(self) -> list:
-        """Get list of sim directories from the repo."""
-        url = f"{GITHUB_API}/repos/{self.owner}/{self.repo}/contents/docs/sims"
-
-        response = self.session.get(url)
-        time.sleep(REQUEST_DELAY)
-
-        if response.status_code == 404:
-            print(f"No docs/sims directory found in {self.owner}/{self.repo}")
-            return []
-
-        if response.status_code == 403:
-            print("Rate limited! Set GITHUB_TOKEN environment variable.")
-            self.log("error", {"message": "Rate limited", "url": url})
-            return []
-
-        if response.status_code != 200:
-            self.log("error", {
-                "message": f"API error {response.status_code}",
-                "url": url
-            })
-            return []
-
-        contents = response.json()
-        sim_dirs = [item["name"] for item in contents if item["type"] == "dir"]
-        return sim_dirs
-
-    def fetch_metadata(self, sim_name: str) -> dict | None:
-        """Fetch metadata.json for a specific MicroSim."""
-        url = f"{RAW_CONTENT_BASE}/{self.owner}/{self.repo}/main/docs/sims/{sim_name}/metadata.json"
-
-        response = self.session.get(url)
-        time.sleep(REQUEST_DELAY)
-
-        if response.status_code == 404:
-            return None
-
-        if response.status_code != 200:
-            self.log("error", {
-                "sim": sim_name,
-                "message": f"HTTP error {response.status_code}",
-                "url": url
-            })
-            self.stats["errors"] += 1
-            return None
-
-        try:
-            return response.json()
-        except json.JSONDecodeError as e:
-            self.log("error", {
-                "sim": sim_name,
-                "message": f"Invalid JSON: {e}"
-            })
-            self.stats["errors"] += 1
-            return None
-
-    def merge_metadata(self):
+    async def resolve_repos(self) -> list:
+        """The explicit repos plus every repo of each owner, without duplicates."""
+        repos = list(self.repos)
+        for owner in self.owners:
+            names, failed = await list_repos(self.fetcher, owner)
+            if failed is not None:
+                print(f"Could not list repositories of {owner}: "
+                      f"{failed.error or f'API error {failed.status}'}")
+                self.log("error", {"owner": owner, "message": "Repository listing failed",
+                                   "url": failed.url})
+                self.stats["errors"] += 1
+                self.incomplete = self.incomplete or is_transient(failed)
+            print(f"{owner}: {len(names)} repositories")
+            repos.extend((owner, name) for name in names)
+        return list(dict.fromkeys(repos))
+
+    async def crawl(self):
+        """Crawl all repos concurrently."""
+        repos = await self.resolve_repos()
+        self.updaters = [RepoUpdater(owner, repo, self.fetcher, self.cache, self.log_file, self.journal)
+                         for owner, repo in repos]
+        await asyncio.gather(*(updater.crawl() for updater in self.updaters))
+
+    def merge_metadata(self, new_metadata: list):
         """Merge new metadata with existing data, removing duplicates."""
         # Build a key-based index of existing entries
-        # Key is (repo, sim) tuple from _source
+        # Key is (owner, repo, sim) from _source, so forks do not collide
         existing_by_key = {}
         for item in self.existing_data:
-            source = item.get("_source", {})
-            key = (source.get("repo"), source.get("sim"))
-            if key != (None, None):
+            key = source_key(item)
+            if key is not None:
                 existing_by_key[key] = item
 
         # Process new metadata
-        for new_item in self.new_metadata:
-            source = new_item.get("_source", {})
-            key = (source.get("repo"), source.get("sim"))
+        for new_item in new_metadata:
+            key = source_key(new_item)
 
             if key in existing_by_key:
                 # Update existing entry
@@ -174,7 +507,7 @@ class RepoUpdater:
                 existing_by_key[key] = new_item
 
         # Convert back to list and remove any entries with invalid keys
-        merged = [v for k, v in existing_by_key.items() if k != (None, None)]
+        merged = [v for k, v in existing_by_key.items() if k is not None]
 
         # Also include any existing entries that didn't have _source
         for item in self.existing_data:
@@ -185,8 +518,7 @@ class RepoUpdater:
         seen = set()
         unique_merged = []
         for item in merged:
-            source = item.get("_source", {})
-            key = (source.get("repo"), source.get("sim"))
+            key = source_key(item)
             if key not in seen:
                 seen.add(key)
                 unique_merged.append(item)
@@ -197,77 +529,85 @@ class RepoUpdater:
 
         return unique_merged
 
-    def update(self):
-        """Main update logic."""
+    def update(self) -> bool:
+        """Main update logic. False if the crawl was interrupted and nothing was merged."""
         LOG_DIR.mkdir(parents=True, exist_ok=True)
         log_filename = f"repo-update-{datetime.now().strftime('%Y-%m-%d')}.jsonl"
         log_path = LOG_DIR / log_filename
 
-        print(f"Updating metadata from {self.owner}/{self.repo}")
+        targets = [f"{owner}/{repo}" for owner, repo in self.repos] + [f"{owner}/*" for owner in self.owners]
+        print(f"Updating metadata from {', '.join(targets)}")
         print(f"Log file: {log_path}")
         print(f"Output: {OUTPUT_JSON}")
         print()
 
         with open(log_path, "a") as self.log_file:
-            self.log("update_started", {})
+            self.log("update_started", {"repos": targets})
 
             # Load existing data
             self.load_existing_data()
 
-            # Get sim directories
-            print(f"Checking docs/sims in {self.owner}/{self.repo}...")
-            sim_dirs = self.get_sims_directories()
-
-            if not sim_dirs:
-                print("No sim directories found.")
-                self.log("update_completed", {"message": "No sims found"})
-                return
-
-            print(f"Found {len(sim_dirs)} sim directories")
-
-            # Fetch metadata for each sim
-            for sim_name in sim_dirs:
-                self.stats["sims_found"] += 1
-                metadata = self.fetch_metadata(sim_name)
-
-                if metadata:
-                    self.stats["metadata_found"] += 1
-
-                    # Add source info
-                    metadata["_source"] = {
-                        "repo": self.repo,
-                        "sim": sim_name,
-                        "github_url": f"https://github.com/{self.owner}/{self.repo}/tree/main/docs/sims/{sim_name}"
-                    }
-
-                    # Ensure URL is set
-                    if "identifier" in metadata and not metadata.get("url"):
-                        metadata["url"] = metadata["identifier"]
-                    elif not metadata.get("url"):
-                        metadata["url"] = f"https://{self.owner}.github.io/{self.repo}/sims/{sim_name}/"
-
-                    self.new_metadata.append(metadata)
-                    print(f"  + {sim_name}")
-
-                    self.log("metadata_found", {
-                        "sim": sim_name,
-                        "title": metadata.get("title", "Unknown")
-                    })
-                else:
-                    self.stats["metadata_missing"] += 1
-                    print(f"  - {sim_name} (no metadata)")
-
-                    self.log("missing_metadata", {
-                        "sim": sim_name,
-                        "github_url": f"https://github.com/{self.owner}/{self.repo}/tree/main/docs/sims/{sim_name}"
-                    })
-
-            # Merge and save
-            merged_data = self.merge_metadata()
-
-            OUTPUT_JSON.parent.mkdir(parents=True, exist_ok=True)
-            with open(OUTPUT_JSON, "w") as f:
-                json.dump(merged_data, f, indent=2)
+            # Resume an interrupted crawl of the same targets, if any
+            self.journal = CrawlJournal(JOURNAL_PATH, targets)
+            self.journal.open(restart=self.restart)
+            if self.journal.resumed:
+                print(f"Resuming the interrupted crawl: {len(self.journal.repos)} repos and "
+                      f"{len(self.journal.sims)} sims already fetched ({JOURNAL_PATH})")
+                print()
+
+            # Crawl every repo, all sharing one request pool and rate budget
+            try:
+                asyncio.run(self.crawl())
+            finally:
+                self.journal.close()
+            new_metadata = []
+            for updater in self.updaters:
+                new_metadata.extend(updater.new_metadata)
+                for name, value in updater.stats.items():
+                    self.stats[name] += value
+                if updater.tree and updater.tree.sims:
+                    self.stats["repos_with_sims"] += 1
+                self.log("repo_completed", dict(updater.stats, repo=updater.name))
+            self.stats["repos"] = len(self.updaters)
+            self.stats.update(self.fetcher.stats)
+            if self.cache:
+                self.stats.update({f"cache_{name}": value for name, value in self.cache.stats.items()})
+
+            # Merge only a complete crawl; otherwise keep the journal for the next run
+            if self.incomplete or any(updater.incomplete for updater in self.updaters):
+                self.log("update_interrupted", self.stats)
+                unfinished = [updater.name for updater in self.updaters if updater.incomplete]
+                print()
+                print("=" * 50)
+                print("CRAWL INTERRUPTED")
+                print("=" * 50)
+                print(f"Unfinished repos:  {len(unfinished)} of {len(self.updaters)}"
+                      + (f" ({', '.join(unfinished[:5])}{', ...' if len(unfinished) > 5 else ''})"
+                         if unfinished else ""))
+                print(f"Sims fetched:      {len(self.journal.sims)}")
+                print(f"Errors:            {self.stats['errors']}")
+                print()
+                print(f"{OUTPUT_JSON} was not changed. Progress is saved in")
+                print(f"{JOURNAL_PATH}; run the same command again to continue.")
+                return False
+
+            if not new_metadata:
+                print()
+                print("No sim metadata found.")
+                self.log("update_completed", dict(self.stats, message="No sims found"))
+                self.journal.finish()
+                return True
+
+            # Merge once and write once, whatever the number of repos
+            merged_data = self.merge_metadata(new_metadata)
+
+            # Canonical IDs: the table is written first, as the catalog refers to it
+            id_table = MicrosimIds.load()
+            self.stats["ids_assigned"] = id_table.stamp(merged_data)
+            id_table.save()
+
+            dump_json(OUTPUT_JSON, merged_data, indent=2)
+            self.journal.finish()
 
             self.log("update_completed", self.stats)
 
@@ -276,15 +616,34 @@ class RepoUpdater:
         print("=" * 50)
         print("UPDATE COMPLETE")
         print("=" * 50)
+        if len(self.updaters) > 1:
+            print(f"Repos crawled:     {self.stats['repos']} ({self.stats['repos_with_sims']} with sims)")
         print(f"Sims found:        {self.stats['sims_found']}")
         print(f"Metadata found:    {self.stats['metadata_found']}")
         print(f"Metadata missing:  {self.stats['metadata_missing']}")
         print(f"Entries added:     {self.stats['added']}")
         print(f"Entries updated:   {self.stats['updated']}")
         print(f"Errors:            {self.stats['errors']}")
+        if self.stats["resumed"]:
+            print(f"Resumed sims:      {self.stats['resumed']} (from the interrupted crawl)")
+        print(f"HTTP requests:     {self.stats['requests']} ({self.stats['retries']} retries)")
+        if self.cache:
+            print(f"Cache:             {self.stats['cache_hits']} hits "
+                  f"({self.stats['cache_not_modified']} via 304), {self.stats['cache_misses']} misses, "
+                  f"{self.stats['cache_bytes_saved'] / 1024:.1f} KB saved")
+        print(f"New sim IDs:       {self.stats['ids_assigned']}")
         print(f"Total entries:     {len(merged_data)}")
         print()
         print(f"Output written to: {OUTPUT_JSON}")
+        print(f"Sim ID table:      {ID_TABLE_PATH}")
+        if self.cache:
+            print(f"HTTP cache:        {CACHE_PATH}")
+        return True
+
+    def close(self):
+        """Write out and close the response cache."""
+        if self.cache:
+            self.cache.close()
 
 
 def parse_repo_arg(repo_arg: str) -> tuple[str, str]:
@@ -303,33 +662,76 @@ def parse_repo_arg(repo_arg: str) -> tuple[str, str]:
     return None, None
 
 
+def read_repos_file(path: Path) -> list:
+    """Repository arguments from a file: one per line, # starts a comment."""
+    with open(path) as f:
+        return [line.split("#", 1)[0].strip() for line in f if line.split("#", 1)[0].strip()]
+
+
 def main():
     parser = argparse.ArgumentParser(
-        description="Update MicroSim metadata from a single GitHub repository",
+        description="Update MicroSim metadata from one or more GitHub repositories",
         epilog="Examples:\n"
                "  python src/update-repo-microsims.py dmccreary/geometry-course\n"
-               "  python src/update-repo-microsims.py https://github.com/dmccreary/geometry-course",
+               "  python src/update-repo-microsims.py https://github.com/dmccreary/geometry-course\n"
+               "  python src/update-repo-microsims.py dmccreary/geometry-course dmccreary/calculus\n"
+               "  python src/update-repo-microsims.py --owner dmccreary",
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
     parser.add_argument(
-        "repo",
+        "repos", nargs="*", metavar="repo",
         help="GitHub repository (owner/repo or full URL)"
     )
+    parser.add_argument(
+        "--repos-file", type=Path,
+        help="File listing repositories, one per line (# comments allowed)"
+    )
+    parser.add_argument(
+        "--owner", action="append", default=[],
+        help="Crawl every public repository of this user or organization (repeatable)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help=f"Requests in flight at once, across all repos (default: {DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Fetch everything, ignoring and not updating the response cache"
+    )
+    parser.add_argument(
+        "--restart", action="store_true",
+        help="Discard the checkpoint of an interrupted crawl and start over"
+    )
 
     args = parser.parse_args()
 
-    owner, repo = parse_repo_arg(args.repo)
-
-    if not owner or not repo:
-        print(f"Error: Could not parse repository: {args.repo}")
-        print(f"Expected formats:")
-        print(f"  dmccreary/geometry-course")
-        print(f"  https://github.com/dmccreary/geometry-course")
+    repo_args = list(args.repos)
+    if args.repos_file:
+        repo_args.extend(read_repos_file(args.repos_file))
+    if not repo_args and not args.owner:
+        parser.error("give at least one repository, --repos-file or --owner")
+
+    repos = []
+    for repo_arg in repo_args:
+        owner, repo = parse_repo_arg(repo_arg)
+
+        if not owner or not repo:
+            print(f"Error: Could not parse repository: {repo_arg}")
+            print(f"Expected formats:")
+            print(f"  dmccreary/geometry-course")
+            print(f"  https://github.com/dmccreary/geometry-course")
+            sys.exit(1)
+        repos.append((owner, repo))
+
+    updater = CatalogUpdater(repos, owners=args.owner, concurrency=args.concurrency,
+                             use_cache=not args.no_cache, restart=args.restart)
+    try:
+        complete = updater.update()
+    finally:
+        updater.close()
+    if not complete:
         sys.exit(1)
 
-    updater = RepoUpdater(owner, repo)
-    updater.update()
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,38 @@
+"""
+Shared test setup.
+
+The pipeline's shared modules live in src/embeddings and are imported the way
+the scripts import them (that directory on sys.path). The scripts themselves
+have hyphenated names, so tests load them by path with the `script` fixture.
+
+Run from the project root:
+    pip install pytest
+    python -m pytest -q
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "embeddings"))
+
+_scripts = {}
+
+
+def load_script(relative_path: str):
+    """Import a script such as "src/update-repo-microsims.py" as a module (once)."""
+    if relative_path not in _scripts:
+        path = PROJECT_ROOT / relative_path
+        spec = importlib.util.spec_from_file_location(path.stem.replace("-", "_"), path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[relative_path] = module
+    return _scripts[relative_path]
+
+
+@pytest.fixture
+def script():
+    return load_script
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex, load_index, recall_at_k
+from embedding_store import normalize_rows
+
+
+class Store:
+    def __init__(self, urls):
+        self.urls = urls
+
+
+@pytest.fixture
+def catalog():
+    rng = np.random.default_rng(1)
+    matrix = normalize_rows(rng.normal(size=(300, 16)))
+    urls = [f"u{i}" for i in range(len(matrix))]
+    return matrix, urls, IVFIndex.build(matrix, urls, n_lists=12)
+
+
+def exact_top_k(matrix, k):
+    sims = matrix @ matrix.T
+    np.fill_diagonal(sims, -np.inf)
+    top = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+    return top, np.take_along_axis(sims, top, axis=1)
+
+
+def test_every_row_is_filed_once(catalog):
+    matrix, _, index = catalog
+    assert sorted(index.rows.tolist()) == list(range(len(matrix)))
+    assert index.offsets[-1] == len(matrix)
+
+
+def test_probing_every_list_is_exact(catalog):
+    matrix, _, index = catalog
+    rows = np.arange(len(matrix))
+    indices, scores = index.search(matrix, matrix, 5, nprobe=index.n_lists, exclude_rows=rows)
+    _, expected = exact_top_k(matrix, 5)
+    np.testing.assert_allclose(scores, expected, atol=1e-5)
+    assert not np.any(indices == rows[:, None])
+    assert recall_at_k(scores, expected) == 1.0
+
+
+def test_range_search_finds_every_pair_above_threshold(catalog):
+    matrix, _, index = catalog
+    q, r, s = index.range_search(matrix, np.arange(len(matrix)), 0.5, nprobe=index.n_lists)
+    sims = matrix @ matrix.T
+    expected = set(zip(*np.nonzero(sims >= 0.5)))
+    assert set(zip(q.tolist(), r.tolist())) == {(int(i), int(j)) for i, j in expected}
+    np.testing.assert_allclose(s, sims[q, r], atol=1e-6)
+
+
+def test_subset_renumbers_rows(catalog):
+    matrix, _, index = catalog
+    keep = np.arange(0, len(matrix), 3)
+    sub = index.subset(keep)
+    assert sorted(sub.rows.tolist()) == list(range(len(keep)))
+    indices, _ = sub.search(matrix[keep], matrix[keep][:4], 3, nprobe=sub.n_lists)
+    assert indices.max() < len(keep)
+
+
+def test_save_load_and_fingerprint(catalog, tmp_path):
+    matrix, urls, index = catalog
+    index.save(tmp_path / "what.npz")
+    loaded = load_index("what", Store(urls), tmp_path)
+    np.testing.assert_array_equal(loaded.rows, index.rows)
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    with pytest.raises(ValueError):
+        load_index("what", Store(urls[::-1]), tmp_path)
@@ -0,0 +1,102 @@
+import json
+
+import numpy as np
+import pytest
+
+from embedding_store import (INDEX_NAME, QuantizedMatrix, dot_scores, load_store, normalize_rows,
+                             quantize_int8, save_store)
+
+
+def random_matrices(n=6, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, dim)), rng.normal(size=(n, dim))
+
+
+def test_round_trip(tmp_path):
+    what, how = random_matrices()
+    urls = [f"https://example.org/sims/s{i}/" for i in range(len(what))]
+    save_store(urls, what, how, {"model": "m", "dimension": 8}, tmp_path, ids=list(range(10, 16)))
+
+    store = load_store(tmp_path)
+    assert store.urls == urls
+    assert store.ids.tolist() == list(range(10, 16))
+    assert store.metadata["model"] == "m"
+    assert store.metadata["dtype"] == "float32"
+    np.testing.assert_array_equal(store.what, normalize_rows(what))
+    np.testing.assert_array_equal(store.how, normalize_rows(how))
+    assert store.row_of(urls[3]) == 3
+
+
+def test_rejects_misaligned_rows(tmp_path):
+    what, how = random_matrices()
+    with pytest.raises(ValueError):
+        save_store(["a"], what, how, {}, tmp_path)
+
+
+def test_float16_store_is_widened_for_float32(tmp_path):
+    what, how = random_matrices()
+    save_store(list("abcdef"), what, how, {}, tmp_path, dtype="float16")
+
+    store = load_store(tmp_path, precision="float32")
+    assert store.what.dtype == np.float32 and store.how.dtype == np.float32
+    assert store.metadata["dtype"] == "float32"
+    np.testing.assert_array_equal(store.what, normalize_rows(what).astype(np.float16).astype(np.float32))
+
+    raw = load_store(tmp_path, precision="float16")
+    assert raw.what.dtype == np.float16
+
+
+def test_save_keeps_the_previous_generation(tmp_path):
+    what, how = random_matrices()
+    generations = []
+    for _ in range(3):
+        save_store(list("abcdef"), what, how, {}, tmp_path)
+        with open(tmp_path / INDEX_NAME) as f:
+            generations.append(json.load(f)["files"]["what"].split(".")[1])
+
+    on_disk = {path.name.split(".")[1] for path in tmp_path.glob("*.npy")}
+    assert on_disk == set(generations[1:])
+
+
+def test_save_leaves_newer_generations_alone(tmp_path):
+    what, how = random_matrices()
+    save_store(list("abcdef"), what, how, {}, tmp_path)
+    # Another writer's matrices, written after ours started
+    newer = tmp_path / "what.ffffffffffffffff.npy"
+    np.save(newer, np.zeros(1))
+    save_store(list("abcdef"), what, how, {}, tmp_path)
+    save_store(list("abcdef"), what, how, {}, tmp_path)
+    assert newer.exists()
+
+
+def test_int8_codes_reconstruct_the_matrix():
+    matrix = normalize_rows(random_matrices(n=50, dim=16)[0])
+    codes, scale = quantize_int8(matrix)
+    assert codes.dtype == np.int8 and np.abs(codes).max() <= 127
+    # Per-dimension rounding error is at most half a step
+    assert np.all(np.abs(codes * scale - matrix) <= scale / 2 + 1e-7)
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_quantized_variants_score_like_float32(tmp_path, precision):
+    what, how = random_matrices(n=40, dim=16)
+    save_store([f"u{i}" for i in range(40)], what, how, {}, tmp_path, quantize=("float16", "int8"))
+    exact = load_store(tmp_path)
+    quantized = load_store(tmp_path, precision=precision)
+    assert quantized.metadata["dtype"] == precision
+    assert isinstance(quantized.what, QuantizedMatrix) == (precision == "int8")
+
+    queries = exact.what[:3]
+    expected = dot_scores(exact.what, queries)
+    scores = dot_scores(quantized.what, queries)
+    assert scores.shape == expected.shape == (40, 3)
+    np.testing.assert_allclose(scores, expected, atol=0.02)
+    # Single-vector queries score the same as a batch of one
+    np.testing.assert_allclose(dot_scores(quantized.what, queries[0]), scores[:, 0], atol=1e-6)
+
+
+def test_missing_variant_is_reported(tmp_path):
+    what, how = random_matrices()
+    save_store(list("abcdef"), what, how, {}, tmp_path)
+    with pytest.raises(FileNotFoundError):
+        load_store(tmp_path, precision="int8")
@@ -0,0 +1,194 @@
+import numpy as np
+import pytest
+
+from embedding_store import normalize_rows
+
+
+@pytest.fixture
+def dup(script):
+    return script("src/find-duplicate-microsims.py")
+
+
+def clustered_matrix(n=60, dim=12, seed=3):
+    """Rows in small groups of near-copies, plus unrelated rows."""
+    rng = np.random.default_rng(seed)
+    bases = rng.normal(size=(n // 4, dim))
+    rows = [base + rng.normal(scale=0.05, size=dim) for base in bases for _ in range(3)]
+    rows += list(rng.normal(size=(n - len(rows), dim)))
+    return normalize_rows(np.array(rows))
+
+
+def brute_force_edges(matrix, threshold):
+    sims = matrix @ matrix.T
+    i, j = np.nonzero(np.triu(sims >= np.float32(threshold), k=1))
+    return {(int(a), int(b)) for a, b in zip(i, j)}
+
+
+def naive_labels(n, pairs):
+    labels = list(range(n))
+    changed = True
+    while changed:
+        changed = False
+        for a, b in pairs:
+            low = min(labels[a], labels[b])
+            if labels[a] != low or labels[b] != low:
+                labels[a] = labels[b] = low
+                changed = True
+    return labels
+
+
+def test_exact_edges_match_brute_force(dup):
+    matrix = clustered_matrix()
+    src, dst, sim = dup.exact_edges(matrix, 0.9)
+    assert np.all(src < dst)
+    assert set(zip(src.tolist(), dst.tolist())) == brute_force_edges(matrix, 0.9)
+    np.testing.assert_allclose(sim, np.sum(matrix[src] * matrix[dst], axis=1), atol=1e-6)
+
+
+def test_bucket_pairs_are_every_pair_sharing_a_key(dup):
+    keys = np.random.default_rng(7).integers(0, 12, size=80)
+    i, j = dup.bucket_pairs(keys)
+    pairs = {(min(a, b), max(a, b)) for a, b in zip(i.tolist(), j.tolist())}
+    assert len(pairs) == len(i)  # no pair twice
+    assert pairs == {(a, b) for a in range(80) for b in range(a + 1, 80) if keys[a] == keys[b]}
+
+
+def spread_matrix(n=600, dim=32, seed=4):
+    """Groups of 4 noisy copies, noisier from group to group, so pair similarities span 0.7-1."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for scale in np.linspace(0.05, 0.7, n // 4):
+        base = rng.normal(size=dim)
+        rows += [base + rng.normal(scale=scale, size=dim) for _ in range(4)]
+    return normalize_rows(np.array(rows))
+
+
+@pytest.mark.parametrize("threshold", [0.85, 0.9])
+def test_lsh_edges_are_a_high_recall_subset_of_exact(dup, threshold):
+    matrix = spread_matrix()
+    exact = dup.exact_edges(matrix, threshold)
+    lsh = dup.lsh_edges(matrix, threshold)
+    exact_sims = dict(zip(zip(exact[0].tolist(), exact[1].tolist()), exact[2].tolist()))
+    lsh_pairs = list(zip(lsh[0].tolist(), lsh[1].tolist()))
+    assert set(lsh_pairs) <= set(exact_sims)
+    # Verified pair by pair rather than by blocked matmul: equal up to float32 rounding
+    np.testing.assert_allclose(lsh[2], [exact_sims[pair] for pair in lsh_pairs], rtol=0, atol=1e-6)
+    recall = len(lsh_pairs) / len(exact_sims)
+    assert recall >= dup.LSH_TARGET_RECALL
+
+    report = dup.edge_recall(matrix, lsh, threshold, sample=len(matrix))
+    assert report["exact_pairs"] == len(exact_sims) and report["found_pairs"] == len(lsh_pairs)
+    assert report["recall"] == round(recall, 4)
+    assert dup.edge_recall(matrix, exact, threshold, sample=100)["recall"] == 1.0
+
+
+def test_connected_components_label_by_smallest_member(dup):
+    pairs = [(5, 9), (9, 2), (0, 7), (11, 12), (12, 3)]
+    src, dst = (np.array(side) for side in zip(*pairs))
+    labels = dup.connected_components(14, src, dst)
+    assert labels.tolist() == naive_labels(14, pairs)
+
+
+def test_cluster_stats(dup):
+    edges = (np.array([0, 1, 4]), np.array([1, 2, 5]), np.array([0.95, 0.91, 0.99], dtype=np.float32))
+    clusters, stats = dup.cluster(6, edges, 0.9)
+    assert clusters == [[0, 1, 2], [4, 5]]
+    assert stats[0] == pytest.approx((0.91, 0.93))
+    assert stats[1] == pytest.approx((0.99, 0.99))
+
+
+def test_sweep_matches_clustering_each_threshold(dup):
+    matrix = clustered_matrix()
+    edges = dup.exact_edges(matrix, 0.8)
+    thresholds = [0.8, 0.9, 0.95, 0.99]
+    swept = {t: labels for t, labels, _ in dup.sweep_labels(len(matrix), edges, thresholds)}
+    assert sorted(swept) == thresholds
+    for t in thresholds:
+        src, dst, _ = dup.exact_edges(matrix, t)
+        np.testing.assert_array_equal(swept[t], dup.connected_components(len(matrix), src, dst))
+
+
+def test_parallel_edges_equal_serial(tmp_path, monkeypatch):
+    # Spawned workers import the script by name: expose it under an importable one
+    import importlib
+    import sys
+    from conftest import PROJECT_ROOT
+    (tmp_path / "find_duplicate_microsims.py").symlink_to(PROJECT_ROOT / "src" / "find-duplicate-microsims.py")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    dup = importlib.import_module("find_duplicate_microsims")
+    monkeypatch.setattr(dup, "EDGE_BLOCK", 16)
+    try:
+        matrix = clustered_matrix(n=80)
+        serial = dup.exact_edges(matrix, 0.9, workers=1)
+        parallel = dup.exact_edges(matrix, 0.9, workers=2)
+        for a, b in zip(serial, parallel):
+            np.testing.assert_array_equal(a, b)
+    finally:
+        sys.modules.pop("find_duplicate_microsims", None)
+
+
+def test_reused_and_rebuilt_counts_with_cross_repo_only(dup, capsys):
+    urls = ["a1", "a2", "b1", "b2", "c1", "c2"]
+    by_url = {u: {"title": u, "_source": {"repo": repo, "sim": u}}
+              for u, repo in zip(urls, ["r", "r", "r", "s", "t", "t"])}
+    clusters = [[0, 1], [2, 3], [4, 5]]
+    stats = [(0.95, 0.95)] * 3
+    reuse = {frozenset(["c1", "c2"]): {"size": 2, "cross_repo": False, "avg_similarity": 0.95}}
+    records = dup.cluster_records(clusters, stats, urls, by_url, True, reuse=reuse)
+    # a1/a2 is same-repo and dropped; b1/b2 is rebuilt; c1/c2 is reused
+    assert len(records) == 2
+    assert "Clusters rebuilt: 1, reused from the previous report: 1" in capsys.readouterr().out
+
+
+def write_sim(root, repo, sim, code):
+    sim_dir = root / repo / "docs" / "sims" / sim
+    sim_dir.mkdir(parents=True)
+    (sim_dir / "main.js").write_text(code)
+    return sim_dir
+
+
+SKETCH = "\n".join(f"function step{i}(x) {{ return circle(x, {i}, {i * 2}); }}" for i in range(40))
+
+
+def test_minhash_estimates_jaccard(dup, tmp_path):
+    hasher = dup.MinHasher()
+    a = write_sim(tmp_path, "r", "a", SKETCH)
+    b = write_sim(tmp_path, "r", "b", SKETCH)
+    c = write_sim(tmp_path, "r", "c", SKETCH.replace("circle", "rect", 20))
+    other = write_sim(tmp_path, "r", "d", "let total = items.reduce((s, v) => s + v, 0);")
+    sig_a, digest_a, count = hasher.signature([a / "main.js"])
+    sig_b, digest_b, _ = hasher.signature([b / "main.js"])
+    assert count > 0 and digest_a == digest_b
+    np.testing.assert_array_equal(sig_a, sig_b)
+    near = (sig_a == hasher.signature([c / "main.js"])[0]).mean()
+    far = (sig_a == hasher.signature([other / "main.js"])[0]).mean()
+    assert 0.3 < near < 1.0 and far < 0.1
+
+
+def test_code_edges_find_copies(dup):
+    rng = np.random.default_rng(0)
+    signatures = rng.integers(0, 2**32, size=(6, 128), dtype=np.uint64).astype(np.uint32)
+    signatures[3] = signatures[1]
+    signatures[5, :120] = signatures[0, :120]
+    src, dst, est = dup.code_edges(signatures, 0.8)
+    assert set(zip(src.tolist(), dst.tolist())) == {(1, 3), (0, 5)}
+
+
+def test_code_report_skips_templates(dup, tmp_path, monkeypatch):
+    import json
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text(json.dumps([
+        {"title": "Pendulum", "_source": {"repo": repo, "sim": "pendulum"}} for repo in ("a", "b")
+    ] + [
+        {"title": "MicroSim Template", "_source": {"repo": repo, "sim": "starter"}} for repo in ("a", "b")
+    ]))
+    monkeypatch.setattr(dup, "CATALOG_PATH", catalog)
+    workspace = tmp_path / "ws"
+    for repo in ("a", "b"):
+        write_sim(workspace, repo, "pendulum", SKETCH)
+        write_sim(workspace, repo, "starter", SKETCH)
+
+    records = dup.code_report(workspace, 0.8, [], False)
+    assert [sorted(m["sim"] for m in r["members"]) for r in records] == [["pendulum", "pendulum"]]
+    records = dup.code_report(workspace, 0.8, [], False, include_templates=True)
+    assert [r["size"] for r in records] == [4]
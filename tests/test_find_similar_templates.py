@@ -0,0 +1,278 @@
+import io
+import json
+import socket
+import sys
+import threading
+import urllib.error
+import urllib.request
+import zlib
+from http.server import HTTPServer
+
+import numpy as np
+import pytest
+
+from embedding_store import load_store, save_store
+from query_cache import QueryEmbeddingCache
+
+DEFAULTS = {'spec_text': None, 'query_text': None, 'mode': 'template', 'top_n': 5, 'min_score': None}
+
+
+@pytest.fixture
+def fst(script):
+    return script("src/find-similar-templates/find-similar-templates.py")
+
+
+@pytest.mark.parametrize("line, request_id, fields", [
+    ('"Title: Pendulum"', None, {'query_text': "Title: Pendulum"}),
+    ('{"id": "fig-1", "spec": "Type: microsim", "top": 3, "mode": "reuse"}', "fig-1",
+     {'spec_text': "Type: microsim", 'top_n': 3, 'mode': 'reuse'}),
+    ('{"query": "q", "min_score": 0.5}', None, {'query_text': "q", 'min_score': 0.5}),
+    ('{"query": "q", "min_score": 1}', None, {'query_text': "q", 'min_score': 1}),
+])
+def test_parse_batch_line(fst, line, request_id, fields):
+    assert fst.parse_batch_line(line, DEFAULTS) == (request_id, dict(DEFAULTS, **fields))
+
+
+@pytest.mark.parametrize("line, request_id", [
+    ('{"id": 9, "query": 5}', 9),
+    ('{"id": "a", "spec": ["x"]}', "a"),
+    ('{"query": "q", "top": "3"}', None),
+    ('{"query": "q", "top": 0}', None),
+    ('{"query": "q", "top": true}', None),
+    ('{"query": "q", "min_score": "high"}', None),
+    ('{"id": "m", "query": "q", "mode": "other"}', "m"),
+    ('{"id": "u", "query": "q", "colour": "red"}', "u"),
+    ('{"id": "e", "query": "  "}', "e"),
+    ('5', None),
+    ('{"query": ', None),
+])
+def test_parse_batch_line_rejects(fst, line, request_id):
+    with pytest.raises(fst.BatchLineError) as raised:
+        fst.parse_batch_line(line, DEFAULTS)
+    assert raised.value.request_id == request_id
+
+
+def fake_batch(requests, index='exact', nprobe=None):
+    for request in requests:
+        yield [{'title': request['query_text'], 'top': request['top_n']}]
+
+
+def run(fst, lines, **kwargs):
+    out = io.StringIO()
+    fst.run_batch(lines, DEFAULTS, out=out, **kwargs)
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_run_batch_reports_bad_lines_and_runs_the_rest(fst, monkeypatch):
+    loaded = []
+    monkeypatch.setattr(fst, "load_embeddings", lambda precision=None: loaded.append(precision))
+    monkeypatch.setattr(fst, "find_similar_templates_batch", fake_batch)
+    lines = ['{"id": "a", "query": "one"}\n', '{"id": "b", "query": 5}\n', '\n',
+             '{"query": "two", "top": "3"}\n', '"three"\n']
+    assert run(fst, lines, precision="int8") == [
+        {'id': "a", 'results': [{'title': "one", 'top': 5}]},
+        {'id': "b", 'error': "query_text must be a string"},
+        {'id': 4, 'error': "top_n must be a positive integer"},
+        {'id': 5, 'results': [{'title': "three", 'top': 5}]},
+    ]
+    assert loaded and set(loaded) == {"int8"}
+
+
+def test_run_batch_on_a_server_does_not_load_embeddings(fst, monkeypatch):
+    def load_embeddings(precision=None):
+        raise AssertionError("embeddings loaded")
+
+    def query_server(url, request, endpoint):
+        if any(r['query_text'] == "bad" for r in request['requests']):
+            raise RuntimeError("server error: boom")
+        return list(fake_batch(request['requests']))
+
+    monkeypatch.setattr(fst, "load_embeddings", load_embeddings)
+    monkeypatch.setattr(fst, "query_server", query_server)
+    monkeypatch.setattr(fst, "BATCH_CHUNK", 2)
+    lines = ['{"id": 1, "query": "one"}', '{"id": 2, "query": "two"}',
+             '{"id": 3, "query": "bad"}', '{"id": 4, "query": "four"}', '{"id": 5, "query": "five"}']
+    output = run(fst, lines, server="http://127.0.0.1:1")
+    assert [line['id'] for line in output] == [1, 2, 3, 4, 5]
+    assert [line.get('error') for line in output] == [None, None, "server error: boom",
+                                                        "server error: boom", None]
+
+
+class FakeModel:
+    """Deterministic stand-in for the sentence transformer: a vector per text."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.calls.append(list(texts))
+        return np.stack([np.random.default_rng(zlib.crc32(text.encode())).normal(size=DIM)
+                         for text in texts]).astype(np.float32)
+
+
+DIM = 8
+TOPICS = ["pendulum motion", "projectile motion", "photosynthesis", "binary search",
+          "supply and demand", "cell division", "ohms law", "sorting algorithms"]
+
+
+@pytest.fixture
+def catalog(fst, tmp_path, monkeypatch):
+    """A small catalog with its embedding store, answered by FakeModel."""
+    model = FakeModel()
+    urls = [f"https://dmccreary.github.io/course/sims/s{i}/" for i in range(len(TOPICS))]
+    sims = [{"title": topic.title(), "url": url, "description": f"A sim about {topic}",
+             "pedagogical": {"pattern": "exploration", "pacing": "self-paced", "bloomVerbs": ["apply"]}}
+            for topic, url in zip(TOPICS, urls)]
+    what = model.encode([f"Title: {topic}" for topic in TOPICS])
+    how = model.encode([f"Pattern: {topic}" for topic in TOPICS])
+    save_store(urls, what, how, {"model": fst.MODEL_NAME}, tmp_path / "store")
+    (tmp_path / "sims.json").write_text(json.dumps(sims))
+    model.calls.clear()
+
+    monkeypatch.setattr(fst, "load_store", lambda precision="float32": load_store(tmp_path / "store",
+                                                                                  precision=precision))
+    monkeypatch.setattr(fst, "MICROSIMS_DATA_PATH", tmp_path / "sims.json")
+    monkeypatch.setattr(fst, "_cache", dict(fst._cache, model=model, embeddings=None, microsims_data=None,
+                                            urls=None, what_matrix=None, how_matrix=None, ann=None,
+                                            pedagogy=None, query_cache=None, use_query_cache=False))
+    return model
+
+
+@pytest.fixture
+def server(fst, catalog):
+    httpd = HTTPServer(("127.0.0.1", 0), fst.make_handler(quiet=True))
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(url, body):
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+QUERIES = [
+    {"query_text": "Title: pendulum motion", "mode": "reuse", "top_n": 3},
+    {"spec_text": "Title: Sorting\nBloom Level: Apply (L3)\nPattern: exploration", "top_n": 4},
+]
+
+
+def test_server_answers_like_an_in_process_query(fst, server):
+    with urllib.request.urlopen(server + "/health", timeout=10) as response:
+        health = json.loads(response.read())
+    assert health == {"status": "ok", "model": fst.MODEL_NAME, "precision": "float32", "count": len(TOPICS)}
+
+    for query in QUERIES:
+        expected = json.loads(json.dumps(fst.find_similar_templates(**query)))
+        assert len(expected) == query["top_n"]
+        assert fst.query_server(server, query) == expected
+    batch = fst.query_server(server, {"requests": QUERIES}, endpoint="/batch")
+    assert batch == [json.loads(json.dumps(fst.find_similar_templates(**query))) for query in QUERIES]
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/query", b"5"),
+    ("/query", b"[1, 2]"),
+    ("/query", b"{not json"),
+    ("/query", b'{"query_text": "q", "colour": "red"}'),
+    ("/query", b'{"query_text": "q", "top_n": "3"}'),
+    ("/batch", b'"text"'),
+    ("/batch", b'{"requests": [5]}'),
+    ("/batch", b'{"requests": {"query_text": "q"}}'),
+    ("/batch", b'{"requests": [{"query_text": "q", "min_score": "x"}]}'),
+])
+def test_server_rejects_malformed_requests(server, path, body):
+    status, payload = post(server + path, body)
+    assert status == 400 and payload["error"]
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def test_unreachable_server_falls_back_to_in_process(fst, catalog, monkeypatch, capsys):
+    url = closed_port_url()
+    with pytest.raises(ConnectionError):
+        fst.query_server(url, QUERIES[0])
+
+    monkeypatch.setattr(sys, "argv", ["find-similar-templates.py", "--query", QUERIES[0]["query_text"],
+                                      "--mode", "reuse", "--top", "3", "--json", "--server", url])
+    fst.main()
+    out, err = capsys.readouterr()
+    assert "running the query in-process" in err
+    assert json.loads(out) == json.loads(json.dumps(fst.find_similar_templates(**QUERIES[0])))
+
+
+def pedagogy_catalog(fst):
+    """Catalog records covering every field shape CatalogPedagogy handles."""
+    rng = np.random.default_rng(5)
+    patterns = ["", "exploration", "reference", "worked-example", "continuous", "custom-pattern"]
+    pacings = ["", "self-paced", "timed", "step-through", "warp-speed"]
+    verbs = ["explain", "apply", "predict", "create", "juggle"]
+    levels = fst.BLOOM_LEVELS + ["synthesis", "Apply"]
+    records = []
+    for _ in range(300):
+        pedagogical = {}
+        for field, values in (("pattern", patterns), ("pacing", pacings)):
+            if rng.random() < 0.8:
+                pedagogical[field] = values[rng.integers(len(values))]
+        if rng.random() < 0.7:
+            pedagogical["bloomVerbs"] = list(rng.choice(verbs, size=rng.integers(0, 3), replace=False))
+        if rng.random() < 0.7:
+            pedagogical["bloomAlignment"] = list(rng.choice(levels, size=rng.integers(0, 3), replace=False))
+        records.append({"pedagogical": pedagogical})
+    records += [
+        {},  # no pedagogical field
+        {"pedagogical": None},
+        {"pedagogical": {}},
+        {"pedagogical": "exploration"},  # not an object
+        {"pedagogical": ["exploration"]},
+        {"pedagogical": {"pattern": "exploration", "bloomVerbs": "explain"}},  # irregular types
+        {"pedagogical": {"pacing": 3, "bloomAlignment": "apply"}},
+        {"pedagogical": {"pattern": "exploration", "bloomVerbs": ["explain", 7, None]}},
+    ]
+    return records
+
+
+@pytest.mark.parametrize("level", [None, "Remember (L1)", "Apply (L3)", "Create", "Synthesis"])
+@pytest.mark.parametrize("verb", [None, "explain", "predict", "juggle"])
+def test_vectorized_pedagogy_matches_the_reference_scorer(fst, level, verb):
+    records = pedagogy_catalog(fst)
+    spec = {key: value for key, value in (("bloom_level", level), ("bloom_verb", verb)) if value}
+    expected = np.array([fst.compute_pedagogical_score(spec, record) for record in records])
+    scores = fst.CatalogPedagogy(records).scores(spec)
+    np.testing.assert_allclose(scores, expected, rtol=0, atol=1e-12)
+
+    # Top-N order, ties included, is what a stable sort of the reference scores gives
+    positions = np.arange(len(records))
+    for top_n in (1, 10, 50, len(records) + 5):
+        reference = sorted(positions.tolist(), key=lambda i: -expected[i])[:top_n]
+        assert fst.top_positions(scores, positions, top_n).tolist() == reference
+    subset = positions[::3]
+    reference = sorted(subset.tolist(), key=lambda i: -expected[i])[:10]
+    assert fst.top_positions(scores, subset, 10).tolist() == reference
+
+
+def test_cached_queries_do_not_load_the_model(fst, tmp_path, monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(fst, "_cache", dict(fst._cache, model=model, use_query_cache=True,
+                                            query_cache=QueryEmbeddingCache("m", tmp_path / "q.sqlite")))
+    first = fst.encode_normalized(["Title: pendulum", "Title: orbit", "Title: pendulum"])
+    assert model.calls == [["Title: pendulum", "Title: orbit"]]
+    np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0, rtol=1e-6)
+
+    def load_model():
+        raise AssertionError("model loaded on a full cache hit")
+
+    monkeypatch.setattr(fst, "load_model", load_model)
+    again = fst.encode_normalized(["Title:  orbit ", "Title: pendulum"])
+    np.testing.assert_array_equal(again, first[[1, 0]])
+    assert len(model.calls) == 1
@@ -0,0 +1,132 @@
+import json
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+import embedding_store
+from embedding_store import load_store, save_store
+from microsim_ids import MicrosimIds
+
+DIM = 8
+
+
+@pytest.fixture
+def gen(script):
+    return script("src/embeddings/generate-embeddings.py")
+
+
+class FakeModel:
+    """Deterministic stand-in for the sentence transformer: a vector per text."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.stack([np.random.default_rng(zlib.crc32(text.encode())).normal(size=DIM)
+                         for text in texts]).astype(np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+@pytest.fixture
+def workspace(gen, tmp_path, monkeypatch):
+    """Point the generator's catalog, store, hash file and sim ID table at *tmp_path*."""
+    ids_path = tmp_path / "microsim-ids.json"
+
+    class Ids(MicrosimIds):
+        @classmethod
+        def load(cls, path=ids_path):
+            return super().load(path)
+
+        def save(self, path=ids_path):
+            super().save(path)
+
+    store_dir = tmp_path / "store"
+    monkeypatch.setattr(gen, "INPUT_FILE", tmp_path / "microsims-data.json")
+    monkeypatch.setattr(gen, "OUTPUT_DIR", store_dir)
+    monkeypatch.setattr(embedding_store, "STORE_DIR", store_dir)  # load_store()'s default
+    monkeypatch.setattr(gen, "HASHES_FILE", tmp_path / "hashes.json")
+    monkeypatch.setattr(gen, "MicrosimIds", Ids)
+    return tmp_path
+
+
+URLS = [f"https://example.org/sims/s{i}/" for i in range(3)]
+
+
+def previous_store(gen, tmp_path):
+    what = np.random.default_rng(0).normal(size=(3, DIM))
+    save_store(URLS, what, what[::-1], {"model": gen.MODEL_NAME}, tmp_path)
+    hashes = {url: {"what": gen.text_hash(f"what {i}"), "how": gen.text_hash(f"how {i}")}
+              for i, url in enumerate(URLS)}
+    return load_store(tmp_path), hashes
+
+
+def test_plan_reuses_vectors_of_unchanged_texts(gen, tmp_path):
+    previous, hashes = previous_store(gen, tmp_path)
+    urls = [URLS[2], URLS[1], "https://example.org/sims/new/"]
+    texts = ["what 2", "what 1 (edited)", "what new"]
+    vectors, pending = gen.plan_encoding(urls, texts, "what", previous, hashes)
+    assert pending == [1, 2]
+    np.testing.assert_array_equal(vectors[0], previous.what[2])
+    assert vectors[1] is None and vectors[2] is None
+
+    # Each role is checked against its own hash
+    vectors, pending = gen.plan_encoding(urls[:2], ["how 2", "how 1"], "how", previous, hashes)
+    assert pending == []
+    np.testing.assert_array_equal(vectors[1], previous.how[1])
+
+
+def test_model_change_reencodes_everything(gen, workspace):
+    save_store(URLS, np.eye(3, DIM), np.eye(3, DIM), {"model": gen.MODEL_NAME}, workspace / "store")
+    hashes = {url: {"what": gen.text_hash("what"), "how": gen.text_hash("how")} for url in URLS}
+    (workspace / "hashes.json").write_text(json.dumps({"model": gen.MODEL_NAME, "hashes": hashes}))
+    previous, previous_hashes = gen.load_previous_embeddings()
+    assert previous is not None and previous_hashes == hashes
+
+    (workspace / "hashes.json").write_text(json.dumps({"model": "other-model", "hashes": hashes}))
+    previous, previous_hashes = gen.load_previous_embeddings()
+    assert previous is None and previous_hashes == {}
+    assert gen.plan_encoding(URLS, ["what"] * 3, "what", previous, previous_hashes) == ([None] * 3, [0, 1, 2])
+
+
+def run(gen, monkeypatch, capsys, *args):
+    monkeypatch.setattr(sys, "argv", ["generate-embeddings.py", *args])
+    gen.main()
+    return capsys.readouterr().out
+
+
+def test_unchanged_catalog_does_not_load_the_model(gen, workspace, monkeypatch, capsys):
+    catalog = [{"title": title, "subject": "physics", "framework": "p5.js",
+                "_source": {"repo": "physics", "sim": title.lower(),
+                            "github_url": f"https://github.com/dmccreary/physics/tree/main/docs/sims/{title.lower()}"}}
+               for title in ("Pendulum", "Projectile")]
+    (workspace / "microsims-data.json").write_text(json.dumps(catalog))
+    model = FakeModel()
+    monkeypatch.setattr(gen, "load_model", lambda: model)
+    run(gen, monkeypatch, capsys)
+    first = load_store(workspace / "store")
+    assert len(model.calls) == 2 and len(first) == 2
+
+    def load_model():
+        raise AssertionError("the model was loaded with nothing to encode")
+
+    monkeypatch.setattr(gen, "load_model", load_model)
+    out = run(gen, monkeypatch, capsys, "--incremental")
+    assert "Reusing 2 WHAT + 2 HOW vectors; encoding 0 WHAT + 0 HOW texts" in out
+    second = load_store(workspace / "store")
+    assert second.urls == first.urls and second.metadata["dimension"] == DIM
+    np.testing.assert_array_equal(second.what, first.what)
+    np.testing.assert_array_equal(second.how, first.how)
+
+    # The previous generation is kept on disk but not counted in the store size
+    index_path = workspace / "store" / embedding_store.INDEX_NAME
+    current = gen.store_size(index_path)
+    named = json.loads(index_path.read_text())["files"].values()
+    assert current == sum((workspace / "store" / name).stat().st_size for name in named) + index_path.stat().st_size
+    on_disk = sum(p.stat().st_size for p in (workspace / "store").iterdir())
+    assert current < on_disk
+    assert f"Store size: {current / (1024 * 1024):.2f} MB" in out
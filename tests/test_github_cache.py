@@ -0,0 +1,56 @@
+import github_cache
+from github_cache import GitHubCache, git_blob_sha
+
+URL = "https://raw.example.org/o/r/main/docs/sims/a/metadata.json"
+BODY = b'{"title": "Pendulum"}\n'
+
+
+def test_blob_sha_matches_git():
+    assert git_blob_sha(b"") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"  # git hash-object /dev/null
+    assert git_blob_sha(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_stored_responses_survive_a_reopen(tmp_path):
+    cache = GitHubCache(tmp_path / "c.sqlite")
+    cache.store(URL, {"ETag": '"abc"', "Last-Modified": "Tue, 01 Sep 2026 00:00:00 GMT"}, BODY)
+    cache.set_tree_sha("o/r", "t1")
+    cache.close()
+
+    cache = GitHubCache(tmp_path / "c.sqlite")
+    assert cache.blob(URL, git_blob_sha(BODY)) == BODY
+    assert cache.blob(URL, "0" * 40) is None  # the file changed upstream
+    assert cache.conditional_headers(URL) == {"If-None-Match": '"abc"',
+                                              "If-Modified-Since": "Tue, 01 Sep 2026 00:00:00 GMT"}
+    assert cache.conditional_headers(URL + "?other") == {}
+    assert cache.not_modified(URL) == BODY
+    assert cache.not_modified(URL + "?other") is None
+    assert cache.tree_sha("o/r") == "t1" and cache.tree_sha("o/other") is None
+    assert cache.stats["hits"] == 2 and cache.stats["not_modified"] == 1
+    assert cache.stats["bytes_saved"] == 2 * len(BODY)
+    cache.close()
+
+
+def test_unused_entries_are_pruned(tmp_path, monkeypatch):
+    cache = GitHubCache(tmp_path / "c.sqlite")
+    cache.store(URL, {}, BODY)
+    cache.flush()
+    monkeypatch.setattr(github_cache, "MAX_AGE_DAYS", -1)  # everything is past the cutoff
+    cache.close()
+    assert GitHubCache(tmp_path / "c.sqlite").blob(URL, git_blob_sha(BODY)) is None
+
+
+def test_corrupt_database_disables_the_cache(tmp_path, capsys):
+    path = tmp_path / "c.sqlite"
+    path.write_bytes(b"this is not a database" * 100)
+    cache = GitHubCache(path)
+    assert cache.conditional_headers(URL) == {}
+    assert not cache.enabled
+    assert "GitHub cache disabled" in capsys.readouterr().err
+    # Everything else is a quiet no-op
+    cache.store(URL, {}, BODY)
+    cache.set_tree_sha("o/r", "t1")
+    assert cache.blob(URL, git_blob_sha(BODY)) is None and cache.tree_sha("o/r") is None
+    cache.close()
+    assert capsys.readouterr().err == ""
+    assert cache.stats["misses"] == 1
+    assert path.read_bytes() == b"this is not a database" * 100
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import github_fetch
+from github_cache import GitHubCache, git_blob_sha
+from github_fetch import GitHubFetcher, TokenBucket
+
+
+class Response:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class Cache:
+    """Stand-in for github_cache.GitHubCache that can lose an entry between calls."""
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.evict = False
+
+    def conditional_headers(self, url):
+        return {"If-None-Match": '"v1"'} if url in self.entries else {}
+
+    def not_modified(self, url):
+        if self.evict:
+            self.entries.pop(url, None)
+        return self.entries.get(url)
+
+    def store(self, url, headers, content):
+        self.entries[url] = content
+
+
+def fetcher_with(responses, **kwargs):
+    """A fetcher whose requests are answered from *responses* in turn; also returns the sent headers."""
+    fetcher = GitHubFetcher(**kwargs)
+    sent = []
+
+    def get(url, headers):
+        sent.append(headers)
+        return responses.pop(0)
+
+    fetcher._get = get
+    return fetcher, sent
+
+
+URL = "https://api.example.org/repos/o/r"
+
+
+def test_not_modified_is_answered_from_the_cache():
+    cache = Cache({URL: b"cached"})
+    fetcher, sent = fetcher_with([Response(304)], cache=cache)
+    result = fetcher.get(URL)
+    assert result.ok and result.from_cache and result.content == b"cached"
+    assert sent == [{"If-None-Match": '"v1"'}]
+
+
+def test_evicted_not_modified_is_asked_again_without_a_retry():
+    cache = Cache({URL: b"cached"})
+    cache.evict = True
+    fetcher, sent = fetcher_with([Response(304), Response(200, b"fresh")], cache=cache, max_retries=0)
+    result = fetcher.get(URL)
+    assert result.ok and not result.from_cache and result.content == b"fresh"
+    assert result.attempts == 2 and fetcher.stats["retries"] == 0
+    assert sent == [{"If-None-Match": '"v1"'}, {}]
+    assert cache.entries[URL] == b"fresh"
+
+
+def test_server_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(github_fetch, "BACKOFF_BASE", 0.0)
+    fetcher, _ = fetcher_with([Response(503), Response(502), Response(200, b"ok")])
+    result = fetcher.get(URL)
+    assert result.ok and result.content == b"ok" and result.attempts == 3
+    assert fetcher.stats["retries"] == 2 and fetcher.stats["failed"] == 0
+
+
+def test_not_found_is_not_retried():
+    fetcher, _ = fetcher_with([Response(404)])
+    result = fetcher.get(URL)
+    assert result.status == 404 and result.attempts == 1 and fetcher.stats["retries"] == 0
+
+
+def test_rate_limit_beyond_max_wait_fails_fast():
+    headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() + 3600)}
+    fetcher, _ = fetcher_with([Response(403, headers=headers)], max_wait=5)
+    started = time.monotonic()
+    result = fetcher.get(URL)
+    assert time.monotonic() - started < 1
+    assert result.rate_limited and not result.ok and result.attempts == 1
+    assert fetcher.stats["failed"] == 1
+    # The host stays paused, so the next request fails without being sent
+    assert fetcher.get(URL).attempts == 0
+
+
+def test_bucket_follows_rate_limit_headers():
+    bucket = TokenBucket(rate=10, capacity=10, reserve=20)
+    reset = str(time.time() + 100)
+    bucket.observe({"X-RateLimit-Remaining": "500", "X-RateLimit-Reset": reset})
+    assert bucket.rate == 10
+    bucket.observe({"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": reset})
+    assert bucket.rate == pytest.approx(0.05, rel=0.05) and bucket.tokens <= 5
+    bucket.observe({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset})
+    assert bucket.wait_time() > 90
+    bucket.observe({})  # no rate-limit headers: unchanged
+    assert bucket.wait_time() > 90
+
+
+def tree_of(entries, truncated=False):
+    return {"sha": "root", "tree": [{"path": p, "type": t, "sha": s} for p, t, s in entries],
+            "truncated": truncated}
+
+
+class TreeFetcher(GitHubFetcher):
+    """Answers Git Trees requests from a dict of tree SHA -> (listing, recursive listing)."""
+
+    def __init__(self, trees):
+        super().__init__()
+        self.trees = trees
+
+    async def fetch(self, url):
+        sha, _, query = url.rsplit("/", 1)[1].partition("?")
+        flat, recursive = self.trees[sha]
+        data = recursive if query else flat
+        return github_fetch.FetchResult(url, 200, content=json.dumps(data).encode())
+
+
+SIM_TREES = {
+    "a1": (tree_of([("metadata.json", "blob", "ma"), ("main.js", "blob", "ja")]), None),
+    "b1": (tree_of([("index.md", "blob", "ib")]), None),
+}
+
+
+@pytest.mark.parametrize("depth", [1, 2])  # the repo, or docs/sims too, is truncated
+def test_truncated_trees_list_the_same_sims(depth):
+    sims = [("a", "tree", "a1"), ("a/metadata.json", "blob", "ma"), ("a/main.js", "blob", "ja"),
+            ("b", "tree", "b1"), ("b/index.md", "blob", "ib")]
+    trees = dict(SIM_TREES,
+                 main=(None, tree_of([("docs", "tree", "d1")], truncated=True)),
+                 root=(tree_of([("docs", "tree", "d1"), ("README.md", "blob", "r")]), None),
+                 d1=(tree_of([("sims", "tree", "s1")]), None),
+                 s1=(tree_of(sims[0:1] + sims[3:4]), tree_of(sims, truncated=depth == 2)))
+    tree = asyncio.run(github_fetch.discover_sims(TreeFetcher(trees), "o", "r"))
+    assert tree.ok and tree.truncated and tree.sims_sha == "s1"
+    assert tree.sims == ["a", "b"] and tree.metadata == {"a": "ma"}
+
+
+class StandIn:
+    """A local stand-in for the GitHub API and raw-content hosts, serving repo o/r."""
+
+    def __init__(self):
+        self.bodies = {sim: json.dumps({"title": sim.upper()}).encode() for sim in ("a", "b")}
+        self.seen = {}  # path -> headers of every request
+        self.lock = threading.Lock()
+        reset = str(int(time.time()) + 3600)
+        self.quota = [("X-RateLimit-Remaining", "4000"), ("X-RateLimit-Reset", reset)]
+        self.exhausted = [("X-RateLimit-Remaining", "0"), ("X-RateLimit-Reset", reset)]
+
+    def tree(self):
+        entries = [("docs", "tree", "d1"), ("docs/sims", "tree", "s1"), ("docs/sims/c", "tree", "c1"),
+                   ("docs/sims/c/index.md", "blob", "ic")]
+        for sim, body in self.bodies.items():
+            entries += [(f"docs/sims/{sim}", "tree", sim + "1"),
+                        (f"docs/sims/{sim}/metadata.json", "blob", git_blob_sha(body))]
+        return tree_of(entries)
+
+    def respond(self, path, headers):
+        """(status, headers, body) for a GET of *path*."""
+        with self.lock:
+            previous = len(self.seen.setdefault(path, []))
+            self.seen[path].append(headers)
+        if path == "/api/repos/o/r/git/trees/main?recursive=1":
+            return 200, self.quota, json.dumps(self.tree()).encode()
+        if path.startswith("/raw/o/r/main/docs/sims/"):
+            sim = path.split("/")[7]
+            if sim == "limited":
+                return 403, self.exhausted, b'{"message": "API rate limit exceeded"}'
+            if previous == 0:  # every file fails once
+                status = 503 if sim == "a" else 429
+                return status, [("Retry-After", "0")] + self.quota, b"{}"
+            etag = f'"{git_blob_sha(self.bodies[sim])}"'
+            if headers.get("If-None-Match") == etag:
+                return 304, [("ETag", etag)], b""
+            return 200, [("ETag", etag)], self.bodies[sim]
+        return 404, [], b'{"message": "Not Found"}'
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    site = StandIn()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, headers, body = site.respond(self.path, dict(self.headers))
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    # GITHUB_API_URL / GITHUB_RAW_URL are read at import: point the module at the server
+    monkeypatch.setattr(github_fetch, "GITHUB_API", base + "/api")
+    monkeypatch.setattr(github_fetch, "RAW_CONTENT_BASE", base + "/raw")
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(fetcher):
+    async def run():
+        tree = await github_fetch.discover_sims(fetcher, "o", "r")
+        return tree, await fetcher.fetch_all([tree.metadata_url(sim) for sim in sorted(tree.metadata)])
+    return asyncio.run(run())
+
+
+def test_crawl_against_a_stand_in_server(stand_in, tmp_path):
+    session = requests.Session()
+    session.headers["Authorization"] = "token t"
+    cache = GitHubCache(tmp_path / "c.sqlite")
+    fetcher = GitHubFetcher(session, concurrency=4, cache=cache)
+    tree, results = crawl(fetcher)
+    assert tree.ok and tree.sims_sha == "s1" and tree.sims == ["a", "b", "c"]
+    assert sorted(tree.metadata) == ["a", "b"]
+    # A 503 and a 429, both with Retry-After, are retried once each
+    assert [r.status for r in results] == [200, 200] and [r.attempts for r in results] == [2, 2]
+    assert [r.json()["title"] for r in results] == ["A", "B"]
+    assert fetcher.stats["retries"] == 2 and fetcher.stats["failed"] == 0
+    # Every request carries the caller's headers, from whichever worker thread sent it
+    assert all(h.get("Authorization") == "token t" for seen in stand_in.seen.values() for h in seen)
+    cache.flush()
+
+    # The next crawl asks conditionally and is answered from the cache
+    fetcher = GitHubFetcher(session, cache=cache)
+    _, results = crawl(fetcher)
+    assert all(r.ok and r.from_cache for r in results)
+    assert [r.json()["title"] for r in results] == ["A", "B"]
+    assert cache.stats["not_modified"] == 2
+    assert stand_in.seen["/raw/o/r/main/docs/sims/a/metadata.json"][-1]["If-None-Match"]
+    cache.close()
+
+
+def test_exhausted_quota_fails_fast_against_a_stand_in_server(stand_in):
+    fetcher = GitHubFetcher(max_wait=5)
+    started = time.monotonic()
+    result = fetcher.get(f"{github_fetch.RAW_CONTENT_BASE}/o/r/main/docs/sims/limited/metadata.json")
+    assert time.monotonic() - started < 5
+    assert result.status == 403 and result.rate_limited and result.attempts == 1
+    assert fetcher.stats["failed"] == 1
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pytest
+
+from json_stream import LazyArray, LazyObject, NumberArray, dump_json, dump_stream
+
+
+def test_lazy_nodes_parse_like_json_dumps(tmp_path):
+    # Exactly representable values, so the float32 text and float64 repr parse alike
+    matrix = (np.random.default_rng(0).integers(-64, 64, size=(3, 5)) / 8).astype(np.float32)
+    counts = np.arange(-3, 7, dtype=np.int64)
+    urls = ["a", "b", "c"]
+    lazy = {
+        "metadata": {"count": 3, "model": "m", "nested": [1, {"x": None}]},
+        "embeddings": LazyObject((url, NumberArray(matrix[i])) for i, url in enumerate(urls)),
+        "items": LazyArray(({"url": url, "rank": i} for i, url in enumerate(urls))),
+        "counts": NumberArray(counts),
+        "mixed": [1, LazyArray(iter(["x", 2.5]))],
+        "empty": LazyObject(iter(())),
+    }
+    plain = {
+        "metadata": {"count": 3, "model": "m", "nested": [1, {"x": None}]},
+        "embeddings": {url: matrix[i].tolist() for i, url in enumerate(urls)},
+        "items": [{"url": url, "rank": i} for i, url in enumerate(urls)],
+        "counts": counts.tolist(),
+        "mixed": [1, ["x", 2.5]],
+        "empty": {},
+    }
+    size = dump_stream(tmp_path / "out.json", lazy)
+    text = (tmp_path / "out.json").read_text()
+    assert size == len(text.encode())
+    assert json.loads(text) == json.loads(json.dumps(plain))
+
+
+def test_float32_values_round_trip_exactly(tmp_path):
+    values = np.random.default_rng(1).normal(scale=1e3, size=10_000).astype(np.float32)
+    values[:3] = [0.1, 1e-30, 3.4e38]
+    dump_stream(tmp_path / "v.json", NumberArray(values))  # spans several formatting blocks
+    decoded = np.array(json.loads((tmp_path / "v.json").read_text()), dtype=np.float32)
+    np.testing.assert_array_equal(decoded, values)
+
+
+def test_integers_are_written_without_a_fraction(tmp_path):
+    dump_stream(tmp_path / "i.json", NumberArray(np.array([[1, -2], [30, 0]], dtype=np.int16)))
+    assert (tmp_path / "i.json").read_text() == "[1,-2,30,0]"
+
+
+def test_nan_is_rejected_and_the_target_is_kept(tmp_path):
+    target = tmp_path / "out.json"
+    target.write_text('{"old": true}')
+    with pytest.raises(ValueError):
+        dump_stream(target, {"v": NumberArray(np.array([1.0, np.nan]))})
+    assert json.loads(target.read_text()) == {"old": True}
+    assert [path.name for path in tmp_path.iterdir()] == ["out.json"]
+
+
+def test_dump_json_matches_json_dump(tmp_path):
+    obj = {"sims": [{"title": "Pendulum", "score": 0.5}], "count": 1}
+    size = dump_json(tmp_path / "out.json", obj, indent=2)
+    assert (tmp_path / "out.json").read_text() == json.dumps(obj, indent=2)
+    assert size == (tmp_path / "out.json").stat().st_size
@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pytest
+
+from microsim_ids import MicrosimIds, canonical_url, catalog_rows, sim_id, sim_key
+
+
+def entry(repo, sim, url=None, owner="dmccreary"):
+    item = {"_source": {"repo": repo, "sim": sim,
+                        "github_url": f"https://github.com/{owner}/{repo}/tree/main/docs/sims/{sim}"}}
+    if url:
+        item["url"] = url
+    return item
+
+
+def test_keys_and_urls():
+    sim = entry("Geometry-Course", "Pendulum", "https://dmccreary.github.io/geometry-course/sims/pendulum/")
+    assert sim_key(sim) == "geometry-course/pendulum"
+    assert canonical_url(sim) == "https://dmccreary.github.io/geometry-course/sims/pendulum/"
+    # A copied URL of another sim is replaced by the sim's own Pages URL
+    copied = entry("calculus", "limits", "https://dmccreary.github.io/geometry-course/sims/pendulum/")
+    assert canonical_url(copied) == "https://dmccreary.github.io/calculus/sims/limits/"
+    # No _source: the location comes from the Pages URL; a bare slug keys on itself
+    assert sim_key({"url": "https://dmccreary.github.io/calculus/sims/limits/"}) == "calculus/limits"
+    assert sim_key({"identifier": "ai-pipeline"}) == "url:ai-pipeline"
+    assert sim_key({}) is None
+
+
+def test_ids_are_stable_across_saves(tmp_path):
+    path = tmp_path / "ids.json"
+    table = MicrosimIds()
+    catalog = [entry("a", "x"), entry("a", "y"), {}]
+    assert table.stamp(catalog) == 2
+    assert [sim.get("sim_id") for sim in catalog] == [0, 1, None]
+    assert catalog[0]["url"] == "https://dmccreary.github.io/a/sims/x/"
+    table.save(path)
+
+    reloaded = MicrosimIds.load(path)
+    reordered = [entry("b", "z"), entry("a", "y"), entry("a", "x")]
+    assert reloaded.stamp(reordered) == 1
+    assert [sim["sim_id"] for sim in reordered] == [2, 1, 0]
+
+
+def test_stale_sim_id_is_looked_up_again():
+    table = MicrosimIds(["a/x", "a/y"], [None, None])
+    assert sim_id(dict(entry("a", "y"), sim_id=0), table) == 1
+    assert sim_id(dict(entry("a", "y"), sim_id=1), table) == 1
+
+
+def test_forks_get_their_own_ids(tmp_path):
+    table = MicrosimIds()
+    # The fork's metadata still declares the upstream Pages URL
+    upstream_url = "https://dmccreary.github.io/geometry-course/sims/pendulum/"
+    catalog = [entry("geometry-course", "pendulum", upstream_url),
+               entry("geometry-course", "pendulum", upstream_url, owner="Alice")]
+    assert table.stamp(catalog) == 2
+    assert [sim["sim_id"] for sim in catalog] == [0, 1]
+    assert table.keys == ["geometry-course/pendulum", "alice/geometry-course/pendulum"]
+    assert table.urls == [upstream_url, "https://Alice.github.io/geometry-course/sims/pendulum/"]
+    table.save(tmp_path / "ids.json")
+    assert MicrosimIds.load(tmp_path / "ids.json").keys == table.keys
+
+
+def test_version_1_tables_are_migrated(tmp_path):
+    path = tmp_path / "ids.json"
+    path.write_text(json.dumps({
+        "schema": "microsim-ids-v1",
+        "keys": ["geometry-course/pendulum", "calculus/limits", "url:ai-pipeline"],
+        "urls": ["https://dmccreary.github.io/geometry-course/sims/pendulum/",
+                 "https://alice.github.io/calculus/sims/limits/", "ai-pipeline"]}))
+    table = MicrosimIds.load(path)
+    assert table.keys == ["geometry-course/pendulum", "alice/calculus/limits", "url:ai-pipeline"]
+    # Alice's sim keeps its ID; the upstream sim it had collided with gets a new one
+    catalog = [entry("calculus", "limits", owner="alice"), entry("calculus", "limits")]
+    assert table.stamp(catalog) == 1
+    assert [sim["sim_id"] for sim in catalog] == [1, 3]
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "ids.json"
+    path.write_text('{"schema": "something-else"}')
+    with pytest.raises(ValueError):
+        MicrosimIds.load(path)
+
+
+class Store:
+    def __init__(self, urls, ids=None):
+        self.urls = urls
+        self.ids = None if ids is None else np.asarray(ids)
+
+
+def test_catalog_rows_join_on_ids_or_urls():
+    table = MicrosimIds()
+    catalog = [entry("a", "x"), entry("a", "y")]
+    table.stamp(catalog)
+    rows = catalog_rows(Store(["?", "?", "?"], [1, 0, 7]), catalog, table)
+    assert rows == [catalog[1], catalog[0], {}]
+    # Stores written before sim IDs join on the declared URL
+    rows = catalog_rows(Store([catalog[1]["url"], "missing"]), catalog)
+    assert rows == [catalog[1], {}]
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+import query_cache
+from query_cache import QueryEmbeddingCache
+
+
+class Clock:
+    """Stand-in for the time module, one second per call, so LRU order is exact."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    monkeypatch.setattr(query_cache, "time", Clock())
+
+
+def vector(seed, dim=4):
+    v = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_hits_ignore_whitespace(tmp_path):
+    cache = QueryEmbeddingCache("m", tmp_path / "q.sqlite")
+    cache.put_many({"Title: Pendulum | Topic: motion": vector(1)})
+    found = cache.get_many(["  Title:  Pendulum |\nTopic: motion ", "Title: Other"])
+    assert list(found) == ["  Title:  Pendulum |\nTopic: motion "]
+    np.testing.assert_array_equal(found["  Title:  Pendulum |\nTopic: motion "], vector(1))
+
+
+def test_models_do_not_share_entries(tmp_path):
+    path = tmp_path / "q.sqlite"
+    QueryEmbeddingCache("m1", path).put_many({"q": vector(1)})
+    QueryEmbeddingCache("m2", path).put_many({"q": vector(2, dim=6)})
+    np.testing.assert_array_equal(QueryEmbeddingCache("m1", path).get_many(["q"])["q"], vector(1))
+    np.testing.assert_array_equal(QueryEmbeddingCache("m2", path).get_many(["q"])["q"], vector(2, dim=6))
+    assert QueryEmbeddingCache("m3", path).get_many(["q"]) == {}
+    assert QueryEmbeddingCache("m1", path).stats()["models"] == {"m1": 1, "m2": 1}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = QueryEmbeddingCache("m", tmp_path / "q.sqlite", max_entries=3)
+    for i, text in enumerate(["a", "b", "c"]):
+        cache.put_many({text: vector(i)})
+    cache.get_many(["a"])  # a is now more recent than b and c
+    cache.put_many({"d": vector(3)})
+    assert sorted(cache.get_many(["a", "b", "c", "d"])) == ["a", "c", "d"]
+    cache.put_many({"e": vector(4), "f": vector(5)})
+    assert sorted(cache.get_many(["a", "c", "d", "e", "f"])) == ["d", "e", "f"]
+    assert cache.stats()["evictions"] == 3
+
+
+def test_stats_count_hits_and_misses(tmp_path):
+    cache = QueryEmbeddingCache("m", tmp_path / "q.sqlite", max_entries=10)
+    empty = cache.stats()
+    assert empty["entries"] == 0 and empty["hit_rate"] is None and empty["size_bytes"] == 0
+    cache.put_many({"a": vector(0), "b": vector(1)})
+    cache.get_many(["a", "b", "c"])
+    cache.get_many(["a", " a ", "d"])  # one lookup per distinct normalized text
+    stats = QueryEmbeddingCache("m", tmp_path / "q.sqlite", max_entries=10).stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 3, 2, 0)
+    assert stats["hit_rate"] == 0.6
+    assert stats["size_bytes"] > 0 and stats["max_entries"] == 10
+
+
+def test_corrupt_database_disables_the_cache(tmp_path, capsys):
+    path = tmp_path / "q.sqlite"
+    path.write_bytes(b"not a database" * 100)
+    cache = QueryEmbeddingCache("m", path)
+    assert cache.get_many(["a"]) == {}
+    assert not cache.enabled
+    assert "query embedding cache disabled" in capsys.readouterr().err
+    cache.put_many({"a": vector(0)})  # a quiet no-op
+    assert cache.get_many(["a"]) == {} and capsys.readouterr().err == ""
+
+
+def test_locked_database_disables_the_cache(tmp_path, monkeypatch):
+    path = tmp_path / "q.sqlite"
+    QueryEmbeddingCache("m", path).put_many({"a": vector(0)})
+    monkeypatch.setattr(query_cache, "LOCK_TIMEOUT", 0)
+    other = sqlite3.connect(str(path))
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        cache = QueryEmbeddingCache("m", path)
+        assert cache.get_many(["a"]) == {} and not cache.enabled
+    finally:
+        other.rollback()
+        other.close()
+
+
+@pytest.mark.skipif(os.name != "posix" or os.geteuid() == 0, reason="needs file permissions to apply")
+def test_read_only_database_disables_the_cache(tmp_path):
+    path = tmp_path / "q.sqlite"
+    QueryEmbeddingCache("m", path).put_many({"a": vector(0)})
+    path.chmod(0o444)
+    cache = QueryEmbeddingCache("m", path)
+    cache.put_many({"b": vector(1)})
+    assert not cache.enabled
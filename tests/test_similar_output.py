@@ -0,0 +1,143 @@
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from conftest import PROJECT_ROOT
+from embedding_store import normalize_rows
+from json_stream import dump_stream
+
+VIEWER_JS = PROJECT_ROOT / "docs" / "sims" / "list-similar-microsim" / "script.js"
+
+
+@pytest.fixture
+def gen(script):
+    return script("src/generate-similar-microsims.py")
+
+
+def neighbors_of(gen, n, seed=0):
+    matrix = normalize_rows(np.random.default_rng(seed).normal(size=(n, 8)))
+    urls = [f"https://example.org/sims/s{i}/" for i in range(n)]
+    indices, scores = gen.top_k_similar(matrix, gen.NUM_SIMILAR)
+    return urls, indices, scores
+
+
+def decode(data, row, metadata):
+    """Python mirror of decodeNeighbors() in the viewer's script.js."""
+    k = metadata.get("k", metadata["num_similar"])
+    step = (metadata["score_max"] - metadata["score_min"]) / 255
+    return [(data["ids"][data["neighbors"][slot]], metadata["score_min"] + data["scores"][slot] * step)
+            for slot in range(row * k, (row + 1) * k) if data["neighbors"][slot] >= 0]
+
+
+def compact(gen, urls, indices, scores, tmp_path):
+    codes, lo, hi = gen.quantize_scores(indices, scores)
+    metadata = {"num_similar": gen.NUM_SIMILAR, "count": len(urls), "k": indices.shape[1],
+                "score_min": lo, "score_max": hi}
+    dump_stream(tmp_path / "similar.json", gen.compact_payload(urls, indices, codes, metadata))
+    return json.loads((tmp_path / "similar.json").read_text()), codes, metadata
+
+
+def assert_decodes(gen, urls, indices, scores, decoded_rows, tolerance):
+    for i, decoded in enumerate(decoded_rows):
+        assert [url for url, _ in decoded] == [urls[j] for j in indices[i] if j >= 0]
+        np.testing.assert_allclose([score for _, score in decoded], scores[i][indices[i] >= 0],
+                                   atol=tolerance)
+
+
+@pytest.mark.parametrize("n", [4, 11, 40])  # fewer, just more and many more sims than NUM_SIMILAR
+def test_compact_round_trip(gen, tmp_path, n):
+    urls, indices, scores = neighbors_of(gen, n)
+    data, _, metadata = compact(gen, urls, indices, scores, tmp_path)
+    assert data["metadata"]["schema"] == gen.SCHEMA_COMPACT
+    step = (metadata["score_max"] - metadata["score_min"]) / 255
+    assert_decodes(gen, urls, indices, scores,
+                   [decode(data, i, data["metadata"]) for i in range(n)], step / 2 + 1e-6)
+
+
+@pytest.mark.parametrize("shards", [16, 256])
+def test_shard_round_trip(gen, tmp_path, monkeypatch, shards):
+    monkeypatch.setattr(gen, "OUTPUT_PATH", tmp_path / "similar-microsims.json")
+    monkeypatch.setattr(gen, "SHARD_DIR", tmp_path / "similar-microsims")
+    (tmp_path / "similar-microsims").mkdir()
+    stale = tmp_path / "similar-microsims" / "zz.json"
+    stale.write_text("{}")
+
+    urls, indices, scores = neighbors_of(gen, 40)
+    codes, lo, hi = gen.quantize_scores(indices, scores)
+    metadata = {"num_similar": gen.NUM_SIMILAR, "count": 40, "k": indices.shape[1],
+                "score_min": lo, "score_max": hi}
+    manifest, shard_iter = gen.shard_payloads(urls, indices, codes, metadata, gen.SHARD_COUNTS[shards])
+    paths = gen.write_shards(manifest, shard_iter)
+    assert not stale.exists()
+
+    manifest = json.loads(gen.OUTPUT_PATH.read_text())["metadata"]
+    assert manifest["shards"] == len(paths)
+    step = (hi - lo) / 255
+    decoded_rows = []
+    for url in urls:
+        prefix = f"{gen.fnv1a_32(url):08x}"[:manifest["prefix_chars"]]
+        shard = json.loads((tmp_path / manifest["shard_dir"] / f"{prefix}.json").read_text())
+        row = next(r for r, source in enumerate(shard["sources"]) if shard["ids"][source] == url)
+        decoded_rows.append(decode(shard, row, manifest))
+    assert_decodes(gen, urls, indices, scores, decoded_rows, step / 2 + 1e-6)
+
+
+def test_fnv1a_matches_reference_vectors(gen):
+    assert gen.fnv1a_32("") == 0x811C9DC5
+    assert gen.fnv1a_32("a") == 0xE40C292C
+    assert gen.fnv1a_32("foobar") == 0xBF9CF968
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+@pytest.mark.parametrize("n", [4, 40])
+def test_viewer_decodes_compact_output(gen, tmp_path, n):
+    urls, indices, scores = neighbors_of(gen, n)
+    compact(gen, urls, indices, scores, tmp_path)
+    source = VIEWER_JS.read_text()
+    start = source.index("function decodeNeighbors")
+    function = source[start:source.index("\n}\n", start) + 3]
+    program = function + (
+        "const data = JSON.parse(require('fs').readFileSync(process.argv[1], 'utf8'));\n"
+        "console.log(JSON.stringify(data.ids.map((_, row) =>\n"
+        "    decodeNeighbors(data, row, data.metadata).map(s => [s.url, s.score]))));\n")
+    out = subprocess.run(["node", "-e", program, str(tmp_path / "similar.json")],
+                         capture_output=True, text=True, check=True).stdout
+    step = (scores.max() - scores.min()) / 255
+    assert_decodes(gen, urls, indices, scores, json.loads(out), step / 2 + 1e-5)
+
+
+def test_blocked_top_k_matches_full_sort(gen):
+    matrix = normalize_rows(np.random.default_rng(2).normal(size=(50, 8)))
+    indices, scores = gen.top_k_similar(matrix, 5, block_memory_mb=0)  # one row per block
+    sims = matrix @ matrix.T
+    np.fill_diagonal(sims, -np.inf)
+    np.testing.assert_allclose(scores, -np.sort(-sims, axis=1)[:, :5], atol=1e-6)
+    np.testing.assert_allclose(np.take_along_axis(sims, indices, axis=1), scores, atol=1e-6)
+
+
+def test_incremental_update_matches_full_search(gen):
+    rng = np.random.default_rng(4)
+    matrix = normalize_rows(rng.normal(size=(60, 8)))
+    urls = [f"u{i}" for i in range(60)]
+    k = 5
+    indices, scores = gen.top_k_similar(matrix, k)
+    prev = {"urls": np.array(urls), "digests": gen.vector_digests(matrix),
+            "indices": indices, "scores": scores}
+
+    # Change two vectors, remove one sim, add two
+    matrix[[3, 17]] = normalize_rows(rng.normal(size=(2, 8)))
+    keep = [i for i in range(60) if i != 40]
+    matrix = np.vstack([matrix[keep], normalize_rows(rng.normal(size=(2, 8)))])
+    urls = [urls[i] for i in keep] + ["new1", "new2"]
+
+    def search(rows):
+        return gen.top_k_similar(matrix, k, rows=rows)
+
+    new_indices, new_scores, counts = gen.update_neighbors(prev, urls, matrix, gen.vector_digests(matrix),
+                                                           k, search)
+    assert counts["changed"] == 4 and counts["removed"] == 1
+    _, expected = gen.top_k_similar(matrix, k)
+    np.testing.assert_allclose(new_scores, expected, atol=1e-6)
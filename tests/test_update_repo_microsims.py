@@ -0,0 +1,239 @@
+import asyncio
+import json
+
+import pytest
+
+import github_fetch
+import json_stream
+from github_cache import git_blob_sha
+from github_fetch import FetchResult, GitHubFetcher
+from microsim_ids import MicrosimIds
+
+
+@pytest.fixture
+def updater(script):
+    return script("src/update-repo-microsims.py")
+
+
+def crawl(journal):
+    journal.open()
+    journal.record_sim("r", "a", "sha-a", {"title": "A"})
+    journal.record_sim("r", "b", "sha-b", None)
+    journal.record_repo("r", "tree-r", ["a", "b"])
+    journal.record_sim("s", "c", "sha-c", {"title": "C"})
+    journal.close()  # interrupted before s finished
+
+
+def test_journal_resumes_a_crawl(updater, tmp_path):
+    path = tmp_path / "crawl.jsonl"
+    crawl(updater.CrawlJournal(path, ["s", "r"]))
+
+    resumed = updater.CrawlJournal(path, ["r", "s"])  # same targets, any order
+    resumed.open()
+    assert resumed.resumed
+    assert set(resumed.sims) == {("r", "a"), ("r", "b"), ("s", "c")}
+    assert resumed.sims[("r", "a")]["metadata"] == {"title": "A"}
+    assert resumed.repos["r"]["sims"] == ["a", "b"] and "s" not in resumed.repos
+    resumed.record_repo("s", "tree-s", ["c"])
+    resumed.finish()
+    assert not path.exists()
+
+
+def test_torn_last_line_is_dropped(updater, tmp_path):
+    path = tmp_path / "crawl.jsonl"
+    crawl(updater.CrawlJournal(path, ["r", "s"]))
+    with open(path, "a") as f:
+        f.write('{"type": "sim", "repo": "s", "sim": "d", "sha')  # killed mid-write
+
+    resumed = updater.CrawlJournal(path, ["r", "s"])
+    resumed.open()
+    assert ("s", "d") not in resumed.sims and len(resumed.sims) == 3
+    resumed.record_sim("s", "d", "sha-d", {"title": "D"})
+    resumed.close()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert lines[-1]["sim"] == "d" and len(lines) == 6
+
+
+def test_journal_of_other_targets_is_discarded(updater, tmp_path, capsys):
+    path = tmp_path / "crawl.jsonl"
+    crawl(updater.CrawlJournal(path, ["r", "s"]))
+
+    other = updater.CrawlJournal(path, ["t"])
+    other.open()
+    other.close()
+    assert not other.resumed and not other.sims
+    assert "Discarding the checkpoint of a different crawl (r, s)" in capsys.readouterr().out
+    assert [json.loads(line)["type"] for line in path.read_text().splitlines()] == ["crawl"]
+
+
+def test_restart_ignores_the_journal(updater, tmp_path, capsys):
+    path = tmp_path / "crawl.jsonl"
+    crawl(updater.CrawlJournal(path, ["r", "s"]))
+
+    fresh = updater.CrawlJournal(path, ["r", "s"])
+    fresh.open(restart=True)
+    fresh.close()
+    assert not fresh.resumed and not fresh.sims
+    assert capsys.readouterr().out == ""
+    assert len(path.read_text().splitlines()) == 1
+
+
+def test_transient_failures(updater):
+    assert updater.is_transient(FetchResult("u", error="connection reset"))
+    assert updater.is_transient(FetchResult("u", 503))
+    assert updater.is_transient(FetchResult("u", 403, {"X-RateLimit-Remaining": "0"}))
+    assert not updater.is_transient(FetchResult("u", 403))
+    assert not updater.is_transient(FetchResult("u", 404))
+
+
+def entry(owner, repo, sim, title, recorded_owner=True):
+    source = {"repo": repo, "sim": sim,
+              "github_url": f"https://github.com/{owner}/{repo}/tree/main/docs/sims/{sim}"}
+    if recorded_owner:
+        source["owner"] = owner
+    return {"title": title, "_source": source}
+
+
+def test_source_key_falls_back_to_the_github_url(updater):
+    assert updater.source_key(entry("Someone", "r", "a", "A")) == ("someone", "r", "a")
+    assert updater.source_key(entry("someone", "r", "a", "A", recorded_owner=False)) == ("someone", "r", "a")
+    assert updater.source_key({"_source": {"repo": "r", "sim": "a"}}) == (updater.DEFAULT_OWNER, "r", "a")
+    assert updater.source_key({"title": "no source"}) is None
+
+
+def test_merge_keeps_forks_apart(updater):
+    catalog = updater.CatalogUpdater([], use_cache=False)
+    catalog.existing_data = [entry("dmccreary", "r", "a", "old", recorded_owner=False),
+                             entry("fork", "r", "a", "fork"), {"title": "loose"}]
+    merged = catalog.merge_metadata([entry("dmccreary", "r", "a", "new"), entry("dmccreary", "r", "b", "B")])
+    assert [item["title"] for item in merged] == ["new", "fork", "B", "loose"]
+    assert [item["id"] for item in merged] == [1, 2, 3, 4]
+    assert catalog.stats["updated"] == 1 and catalog.stats["added"] == 1
+
+
+class StubFetcher(GitHubFetcher):
+    """Answers GETs from a dict of URL -> JSON-able body (404 otherwise), recording each URL."""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = responses
+        self.requested = []
+
+    async def fetch(self, url):
+        self.requested.append(url)
+        self.stats["requests"] += 1
+        if url not in self.responses:
+            return FetchResult(url, 404, content=b'{"message": "Not Found"}', attempts=1)
+        return FetchResult(url, 200, content=json.dumps(self.responses[url]).encode(), attempts=1)
+
+
+def tree_url(owner, repo):
+    return f"{github_fetch.GITHUB_API}/repos/{owner}/{repo}/git/trees/main?recursive=1"
+
+
+def metadata_url(owner, repo, sim):
+    return f"{github_fetch.RAW_CONTENT_BASE}/{owner}/{repo}/main/docs/sims/{sim}/metadata.json"
+
+
+def serve_repo(responses, owner, repo, sims):
+    """Add a repo's tree and the metadata.json of every sim in *sims* (name -> metadata or None)."""
+    entries = [{"path": "docs/sims", "type": "tree", "sha": f"{owner}-{repo}-sims"}]
+    for sim, metadata in sims.items():
+        entries.append({"path": f"docs/sims/{sim}", "type": "tree", "sha": f"{sim}-tree"})
+        if metadata is not None:
+            body = json.dumps(metadata).encode()
+            entries.append({"path": f"docs/sims/{sim}/metadata.json", "type": "blob",
+                            "sha": git_blob_sha(body)})
+            responses[metadata_url(owner, repo, sim)] = metadata
+    responses[tree_url(owner, repo)] = {"sha": "root", "tree": entries, "truncated": False}
+
+
+@pytest.fixture
+def workspace(updater, tmp_path, monkeypatch):
+    """Point the updater's catalog, log, journal and sim ID table at *tmp_path*."""
+    ids_path = tmp_path / "microsim-ids.json"
+
+    class Ids(MicrosimIds):
+        @classmethod
+        def load(cls, path=ids_path):
+            return super().load(path)
+
+        def save(self, path=ids_path):
+            super().save(path)
+
+    writes = []
+
+    def dump_json(path, obj, **kwargs):
+        writes.append(path)
+        return json_stream.dump_json(path, obj, **kwargs)
+
+    monkeypatch.setattr(updater, "OUTPUT_JSON", tmp_path / "microsims-data.json")
+    monkeypatch.setattr(updater, "LOG_DIR", tmp_path / "logs")
+    monkeypatch.setattr(updater, "JOURNAL_PATH", tmp_path / "crawl.jsonl")
+    monkeypatch.setattr(updater, "MicrosimIds", Ids)
+    monkeypatch.setattr(updater, "dump_json", dump_json)
+    return writes
+
+
+def test_update_crawls_repos_and_owners_into_one_write(updater, workspace, tmp_path):
+    responses = {
+        f"{github_fetch.GITHUB_API}/users/alice/repos?per_page=100&page=1": [{"name": "geometry"}],
+        f"{github_fetch.GITHUB_API}/users/alice/repos?per_page=100&page=2": [],
+    }
+    serve_repo(responses, "dmccreary", "geometry", {"pendulum": {"title": "Pendulum"}, "draft": None})
+    serve_repo(responses, "alice", "geometry", {"pendulum": {"title": "Alice's Pendulum"}})
+    serve_repo(responses, "dmccreary", "calculus", {"limits": {"title": "Limits"}})
+
+    catalog = updater.CatalogUpdater([("dmccreary", "geometry"), ("dmccreary", "calculus")],
+                                     owners=["alice"], use_cache=False)
+    fetcher = catalog.fetcher = StubFetcher(responses)
+    assert catalog.update()
+
+    assert workspace == [tmp_path / "microsims-data.json"]
+    written = json.loads((tmp_path / "microsims-data.json").read_text())
+    assert sorted((e["_source"]["owner"], e["_source"]["repo"], e["title"]) for e in written) == [
+        ("alice", "geometry", "Alice's Pendulum"),
+        ("dmccreary", "calculus", "Limits"),
+        ("dmccreary", "geometry", "Pendulum"),
+    ]
+    assert len({e["sim_id"] for e in written}) == 3
+    assert sorted(fetcher.requested) == sorted(responses)  # every request through the one fetcher
+    assert catalog.stats["added"] == 3 and catalog.stats["metadata_missing"] == 1
+    assert not (tmp_path / "crawl.jsonl").exists()
+
+
+def test_crawl_resumes_from_the_journal(updater, tmp_path):
+    responses = {}
+    serve_repo(responses, "o", "r", {"kept": {"title": "Kept"}, "edited": {"title": "Edited v2"}})
+    kept_sha = git_blob_sha(json.dumps({"title": "Kept"}).encode())
+    journal = updater.CrawlJournal(tmp_path / "crawl.jsonl", ["o/r", "o/done"])
+    journal.open()
+    journal.record_sim("o/r", "kept", kept_sha, {"title": "Kept (journaled)"})
+    journal.record_sim("o/r", "edited", "0" * 40, {"title": "Edited v1"})  # changed since
+    journal.record_sim("o/done", "x", "1" * 40, {"title": "X"})
+    journal.record_repo("o/done", "done-sims", ["x", "y"])
+    journal.close()
+
+    journal = updater.CrawlJournal(tmp_path / "crawl.jsonl", ["o/r", "o/done"])
+    journal.open()
+    fetcher = StubFetcher(responses)
+    repo = updater.RepoUpdater("o", "r", fetcher, journal=journal)
+    asyncio.run(repo.crawl())
+    # The unchanged sim comes from the journal; only the changed one is fetched
+    assert fetcher.requested == [tree_url("o", "r"), metadata_url("o", "r", "edited")]
+    assert sorted(m["title"] for m in repo.new_metadata) == ["Edited v2", "Kept (journaled)"]
+    assert repo.stats["resumed"] == 1 and not repo.incomplete
+    assert journal.sims[("o/r", "edited")]["metadata"]["title"] == "Edited v2"
+    assert journal.repos["o/r"]["sims"] == ["edited", "kept"]
+
+    # A repo finished before the interruption is rebuilt without any request
+    fetcher.requested.clear()
+    done = updater.RepoUpdater("o", "done", fetcher, journal=journal)
+    asyncio.run(done.crawl())
+    journal.close()
+    assert fetcher.requested == []
+    assert [m["title"] for m in done.new_metadata] == ["X"]
+    assert done.new_metadata[0]["_source"] == {
+        "owner": "o", "repo": "done", "sim": "x",
+        "github_url": "https://github.com/o/done/tree/main/docs/sims/x"}
+    assert done.stats["sims_found"] == 2 and done.stats["metadata_missing"] == 1